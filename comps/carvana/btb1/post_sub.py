@@ -1,4 +1,4 @@
-from utils.utils import parallel_run
+from utils.parallel_utils.executor import get_executor,progressReport
 import numpy as np
 import os
 from PIL import Image
@@ -38,7 +38,7 @@ def post_sub_one(inx):
 def post_sub_all(path,threshold):
     paths = ["%s/%s"%(path,i) for i in os.listdir(path) if i.endswith('npy')]
     args = [[i,i.replace('npy','csv'),threshold ] for i in paths]
-    parallel_run(post_sub_one,args)
+    get_executor().map(post_sub_one,args,chunksize=1,progress=progressReport("post sub"))
 
 def write_all(path,head,name):
     files = ["%s/%s"%(path,i) for i in os.listdir(path) if i.endswith('.csv')]
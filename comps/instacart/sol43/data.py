@@ -8,12 +8,20 @@ from utils.tf_utils.utils import intseqfea,floatseqfea,_int64_feature,_float_fea
 import os
 import numpy as np
 from utils.utils import print_mem_time
+from utils.profile_utils.stages import stage
+from utils.cache_utils.artifact import get_cache
 import pandas as pd
 import gc
 import random 
+import time
 
 TEST_UID = 2455 # randomly select one user in train for sanity check
 LOG_EVERY = 100
+RAW_FNAMES = "order_products__train.csv,order_products__prior.csv,orders.csv,aisles.csv,departments.csv,products.csv".split(',')
+RAW_NAMES = "op_train,op_prior,orders,aisles,departments,products".split(',')
+
+def _to_pickle(data,out):
+    data.to_pickle(out)
 
 class tfData(BaseSeqData):
 
@@ -29,6 +37,7 @@ class tfData(BaseSeqData):
         #self._poke_user_tfrecords()
   
     def _setup(self):
+        self.cache = get_cache(self.flags.record_path)
         self.pdDB = None
         self.o2p = None
         self.u2o = None
@@ -50,12 +59,15 @@ class tfData(BaseSeqData):
         self.float_fields = "weight,labels,lossmask".split(',') # all other fields are integer.
 
 
+    @stage("partition_test_user_tfrecord")
     def _partition_test_user_tfrecord(self):
         outpath = "%s/test_users.tfrecords"%self.flags.record_path
         recordpath = "%s/users.tfrecords"%self.flags.record_path
-        if os.path.exists(outpath)==True:
+        key = self.cache.key("partition_test_user_tfrecord",[recordpath])
+        if self.cache.check(outpath,key):
             print("%s exists."%outpath)
             return
+        start = time.time()
         print("write",outpath)
         writer = tf.python_io.TFRecordWriter(outpath)
         records = tf.python_io.tf_record_iterator(recordpath)
@@ -70,14 +82,18 @@ class tfData(BaseSeqData):
                 print(c,cc)
         print("write %s done"%outpath)
         writer.close()
+        self.cache.commit(outpath,key,time.time()-start)
         
 
+    @stage("write_train_tfrecord")
     def _write_train_tfrecord(self,max_prods):
         outpath = "%s/train.tfrecords"%self.flags.record_path
-        if os.path.exists(outpath)==True:
+        path = "%s/users.tfrecords"%self.flags.record_path
+        key = self.cache.key("write_train_tfrecord",[path],{"max_prods":max_prods})
+        if self.cache.check(outpath,key):
             print("%s exists."%outpath)
             return
-        path = "%s/users.tfrecords"%self.flags.record_path
+        start = time.time()
         ctype = getattr(tf.python_io.TFRecordCompressionType, "GZIP") 
         writer_options = tf.python_io.TFRecordOptions(compression_type=ctype)
         writer = tf.python_io.TFRecordWriter(outpath, options=writer_options)
@@ -88,13 +104,18 @@ class tfData(BaseSeqData):
             ces += ce
             if cu>0 and cu%100 == 0:
                 print_mem_time("%d users %d samples"%(cu,ces))
+        writer.close()
+        self.cache.commit(outpath,key,time.time()-start)
 
+    @stage("write_test_tfrecord")
     def _write_test_tfrecord(self,max_prods):
         outpath = "%s/test.tfrecords"%self.flags.record_path
-        if os.path.exists(outpath)==True:
+        path = "%s/test_users.tfrecords"%self.flags.record_path
+        key = self.cache.key("write_test_tfrecord",[path],{"max_prods":max_prods})
+        if self.cache.check(outpath,key):
             print("%s exists."%outpath)
             return
-        path = "%s/test_users.tfrecords"%self.flags.record_path
+        start = time.time()
         ctype = getattr(tf.python_io.TFRecordCompressionType, "GZIP")
         writer_options = tf.python_io.TFRecordOptions(compression_type=ctype)
         writer = tf.python_io.TFRecordWriter(outpath, options=writer_options)
@@ -105,6 +126,8 @@ class tfData(BaseSeqData):
             ces += ce
             if cu>0 and cu%100 == 0:
                 print_mem_time("%d users %d samples"%(cu,ces))
+        writer.close()
+        self.cache.commit(outpath,key,time.time()-start)
 
     def _get_user_sequence_examples(self,user,max_prods=np.inf,mode="train"):
         self._load_p2adn()
@@ -228,11 +251,14 @@ class tfData(BaseSeqData):
             user.ParseFromString(record)
             yield UserWrapper(user, mode)    
 
+    @stage("write_user_tfrecord")
     def _write_user_tfrecord(self):
         outpath = "%s/users.tfrecords"%self.flags.record_path
-        if os.path.exists(outpath)==True:
+        key = self.cache.key("write_user_tfrecord",self._raw_files(["orders","op_prior","op_train"]))
+        if self.cache.check(outpath,key):
             print("%s exists."%outpath)
             return
+        start = time.time()
         self._load_u2o() # get u2o, o2p and p2adn
         self._load_o2p()
         inpath = self.flags.input_path
@@ -275,39 +301,41 @@ class tfData(BaseSeqData):
             if i % LOG_EVERY == 0:
                 print_mem_time ("{} users written".format(i))
         writer.close()
+        self.cache.commit(outpath,key,time.time()-start)
 
+    @stage("load_u2o")
     def _load_u2o(self):
         if self.u2o:
             return
         path = self.flags.data_path
         p = "%s/u2o.pkl"%path
-        if os.path.exists(p)==False:
+        def _u2o():
             self._load_db()        
-            u2o = self.pdDB.data['orders'].groupby('user_id')['order_id'].apply(list) 
-            u2o.to_pickle(p)
-        else:
-            u2o = pd.read_pickle(p)
+            return self.pdDB.data['orders'].groupby('user_id')['order_id'].apply(list) 
+        u2o = get_cache(path).cached(p,_u2o,inputs=self._raw_files(["orders"]),
+            load=pd.read_pickle,save=_to_pickle)
         self.u2o = u2o
         print_mem_time("Loaded u2o %d"%len(u2o))
 
+    @stage("load_o2p")
     def _load_o2p(self):
         if self.o2p:
             return
         path = self.flags.data_path
         p = "%s/o2p.pkl"%path
-        if os.path.exists(p)==False:
+        def _o2p():
             self._load_db()
             ops = self.pdDB.data['op_prior']
             ops = ops.append(self.pdDB.data['op_train'])
-            o2p = ops.sort_values(['order_id', 'add_to_cart_order'])\
+            return ops.sort_values(['order_id', 'add_to_cart_order'])\
                 .groupby('order_id')['product_id'].apply(list)
-            o2p.to_pickle(p)
-        else:
-            o2p = pd.read_pickle(p)
+        o2p = get_cache(path).cached(p,_o2p,inputs=self._raw_files(["op_prior","op_train"]),
+            load=pd.read_pickle,save=_to_pickle)
         self.o2p = o2p
         print_mem_time("Loaded o2p %d"%len(o2p))
 
 
+    @stage("load_p2adn")
     def _load_p2adn(self):
         if self.p2adn is not None:
             return
@@ -322,14 +350,18 @@ class tfData(BaseSeqData):
         gc.collect()
         self.pdDB = None
 
+    def _raw_files(self, names):
+        fnames = dict(zip(RAW_NAMES,RAW_FNAMES))
+        return ["%s/%s"%(self.flags.input_path,fnames[i]) for i in names]
+
     def _load_db(self, files="all"):
         if self.pdDB is not None:
             return
         path = self.flags.input_path
         Table = namedtuple('Table', 'name fname dtype')
-        fnames = "order_products__train.csv,order_products__prior.csv,orders.csv,aisles.csv,departments.csv,products.csv".split(',')
-        names = "op_train,op_prior,orders,aisles,departments,products".split(',')
+        fnames,names = RAW_FNAMES,RAW_NAMES
         TABLES = [Table(i,"%s/%s"%(path,j),{}) for i,j in zip(names,fnames) if files =="all" or i in files]
-        self.pdDB = basketDB(self.flags,TABLES,prob_dtype=True)
+        # orders.eval_set is kept as codes of prior/train/test
+        self.pdDB = basketDB(self.flags,TABLES,prob_dtype=True,categorical=True)
 
 
@@ -1,13 +1,19 @@
 from utils.pypy_utils.geohash import decode,str_coord
 from utils.pypy_utils.utils import geo_distance,read_fscore,sort_value
+from utils.cache_utils.artifact import get_cache
 import os
 import pickle
 import csv
+import time
 #from utils.draw.sns_draw import distribution
 
 def build_hash_to_coord(paths):
-    if os.path.exists("comps/mobike/sol_carl/data/h2c.p") and os.path.exists("comps/mobike/sol_carl/data/c2h.p"):
+    data_path = "comps/mobike/sol_carl/data"
+    cache = get_cache(data_path)
+    key = cache.key("build_hash_to_coord",paths)
+    if cache.check("%s/h2c.p"%data_path,key) and cache.check("%s/c2h.p"%data_path,key):
         return
+    start = time.time()
     h2c,c2h = {},{}
     for path in paths:
         for c,row in enumerate(csv.DictReader(open(path))):
@@ -27,6 +33,8 @@ def build_hash_to_coord(paths):
     print(len(h2c),len(c2h))
     pickle.dump(h2c,open("comps/mobike/sol_carl/data/h2c.p","wb"))
     pickle.dump(c2h,open("comps/mobike/sol_carl/data/c2h.p","wb"))                
+    for name in ["h2c","c2h"]:
+        cache.commit("%s/%s.p"%(data_path,name),key,time.time()-start)
 
 def find_neighbor():
     h2c = pickle.load(open("comps/mobike/sol_carl/data/h2c.p","rb"))
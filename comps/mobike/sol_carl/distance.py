@@ -2,7 +2,9 @@ import os
 import csv
 from collections import defaultdict
 from math import cos
-from geohash import decode
+from comps.mobike.sol_carl.geohash import decode
+from utils.parallel_utils.executor import get_executor
+from utils.profile_utils.stages import stage
 
 cdic={}
 ddic={}
@@ -70,15 +72,10 @@ def spatial_distance(inx, base, out):
 
 
 if __name__ == "__main__":
-    spatial_distance(base='comps/mobike/sol_carl/data/tr_sort.csv', 
-        inx='comps/mobike/sol_carl/data/tr_norm_count.csv', out='comps/mobike/sol_carl/data/tr_distance.csv')
-
-    spatial_distance(base='comps/mobike/sol_carl/data/va_sort.csv', 
-        inx='comps/mobike/sol_carl/data/va_norm_count.csv', out='comps/mobike/sol_carl/data/va_distance.csv')
-
-    spatial_distance(base='../input/train_sort.csv',
-        inx='comps/mobike/sol_carl/data/train_norm_count.csv', out='comps/mobike/sol_carl/data/train_distance.csv')
-
-    spatial_distance(base='../input/test_sort.csv',
-        inx='comps/mobike/sol_carl/data/test_norm_count.csv', out='comps/mobike/sol_carl/data/test_distance.csv')
-
+    path = "comps/mobike/sol_carl/data"
+    jobs = [("%s/%s_norm_count.csv"%(path,i),base,"%s/%s_distance.csv"%(path,i)) for i,base in
+        [('tr','%s/tr_sort.csv'%path),('va','%s/va_sort.csv'%path),
+        ('train','../input/train_sort.csv'),('test','../input/test_sort.csv')]]
+    # one file per worker, each builds its own geohash cache
+    with stage('distance'):
+        get_executor(len(jobs)).map(spatial_distance,jobs,chunksize=1,star=True)
@@ -1,4 +1,5 @@
-from utils.pypy_utils.utils import logloss,apk,ave
+from utils.pypy_utils.utils import logloss,apk,mapkAcc
+from utils.pypy_utils.timeparse import split_time
 import csv
 
 def topk(true,pred,k):
@@ -17,25 +18,20 @@ def eval(bdata,data,sub,label,idx,candidate,k=3,out=None):
     
     days = {}
     for row in csv.DictReader(open("comps/mobike/sol_carl/data/va_sort.csv")):
-        ymd, hms = row['starttime'].split()
+        ymd,hms,year,month,day = split_time(row['starttime'])[:5]
         #row['hour'] = hms.split('-')[0]
-        year,month,day = ymd.split('-')
-        row['dow'] = str(((int(month)-5)*31 + int(day))%7)
+        row['dow'] = str(((month-5)*31 + day)%7)
 
         days[row['orderid']] = row['dow'] 
 
     dayscore = {}
     for i in list(days.values()):
-        dayscore[i] = []
+        dayscore[i] = mapkAcc(k)
     for row in csv.DictReader(open(data)):
         if label is None or int(row[label]):
             dic[row[idx]] = row[candidate]
-    scores = 0
-    seen_scores = 0
-    seen_sk = 0
-    sk = 0
+    total,seen = mapkAcc(k),mapkAcc(k)
     f = open(sub)
-    sc = 1
     if out:
         fo = open(out,'w')
         fo.write("orderid,apk\n") 
@@ -45,24 +41,20 @@ def eval(bdata,data,sub,label,idx,candidate,k=3,out=None):
         real = dic.get(xx[0],"")
         s1,s2 = apk([real],pred,k),topk(real,pred,k)
         if xx[0] in days:
-            dayscore[days[xx[0]]].append(s1)
+            dayscore[days[xx[0]]].add(s1,s2)
         if xx[0] in seenuser:
-            seen_scores += s1
-            seen_sk += s2
-            sc+=1
-        scores += s1
-        sk += s2
+            seen.add(s1,s2)
+        total.add(s1,s2)
         if out:
             fo.write("%s,%.3f\n"%(xx[0],s1))
-        #print(real,pred,scores)
-        #break
         if c>0 and c%100000 == 0:
-            print(c,"apk %.4f"%(scores/c),"top%d %.4f"%(k,sk/c),'seen user apk %.4f'%(seen_scores/sc),'seen user topk %.4f'%(seen_sk/sc),"seen",sc)
-            if xx[0] in days:
-                print([(i,"%.2f"%ave(j)) for i,j in dayscore.items()])
-    print(c,"apk %.4f"%(scores/c),"top%d %.4f"%(k,sk/c),'seen user apk %.4f'%(seen_scores/sc),'seen user topk %.4f'%(seen_sk/sc),"seen",sc)
-    if xx[0] in days:
-        print([(i,"%.2f"%ave(j)) for i,j in dayscore.items()])
+            _report(total,seen,dayscore,k)
+    _report(total,seen,dayscore,k)
     f.close()
     if out:
         fo.close()
+
+def _report(total,seen,dayscore,k):
+    print(total.n,"apk %.4f"%total.score(),"top%d %.4f"%(k,total.hit_rate()),'seen user apk %.4f'%seen.score(),'seen user topk %.4f'%seen.hit_rate(),"seen",seen.n)
+    if dayscore:
+        print([(i,"%.2f"%j.score()) for i,j in dayscore.items()])
@@ -1,10 +1,13 @@
 # please run this script from the root folder: ./kaggle-review
 # sh comps/mobike/sol_carl/run.sh
 
+# every step appends its per stage time and memory to this report
+export STAGE_REPORT=comps/mobike/sol_carl/data/stages.csv
+
 
 # preprocess
-python comps/mobike/sol_carl/split.py
-python comps/mobike/sol_carl/sort_bytime.py
+python -m comps.mobike.sol_carl.split
+python -m comps.mobike.sol_carl.sort_bytime
 
 # cv for coordinate data
 pypy main.py --comp mobike --sol carl --task prepare_cv_coord --input_path ../input
@@ -19,15 +22,15 @@ python main.py --comp mobike --net xgb --sol carl --task sub_coord --input_path
 
 # cv for hash data
 pypy main.py --comp mobike --sol carl --task prepare_cv_hash --input_path ../input
-pypy comps/mobike/sol_carl/distance.py 
-pypy comps/mobike/sol_carl/sample.py
+pypy -m comps.mobike.sol_carl.distance 
+pypy -m comps.mobike.sol_carl.sample
 python main.py --comp mobike --net xgb --sol carl --task cv_hash
 pypy comps/mobike/sol_carl/post.py comps/mobike/sol_carl/cv.csv
 pypy main.py --comp mobike --sol carl --task eval_hash --pred_path cv_sub.csv
 
 # sub for hash data
 pypy main.py --comp mobike --sol carl --task prepare_sub_hash --input_path ../input
-pypy comps/mobike/sol_carl/distance.py
+pypy -m comps.mobike.sol_carl.distance
 python main.py --comp mobike --net xgb --sol carl --task sub_hash
 pypy comps/mobike/sol_carl/post.py comps/mobike/sol_carl/sub.csv
 pypy comps/mobike/sol_carl/merge_sub.py
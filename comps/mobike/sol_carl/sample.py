@@ -1,6 +1,8 @@
 import csv
 from random import random
 import os
+from utils.parallel_utils.executor import get_executor
+from utils.profile_utils.stages import stage
 
 def sample(name,ratio=0.05):
     oname = name.replace('.csv','_sample.csv')
@@ -28,6 +30,7 @@ def sample(name,ratio=0.05):
 
 if __name__ == "__main__":
     path = "comps/mobike/sol_carl/data"
-    for i in ['va_norm_count.csv','va_distance.csv']:
-        sample("%s/%s"%(path,i))
+    names = ["%s/%s"%(path,i) for i in ['va_norm_count.csv','va_distance.csv']]
+    with stage('sample'):
+        get_executor(len(names)).map(sample,names,chunksize=1)
 
@@ -2,6 +2,8 @@ import csv
 from collections import defaultdict
 from utils.pypy_utils.utils import ave,geo_distance,sort_value
 from utils.pypy_utils.geohash import float_coord,str_coord
+from utils.pypy_utils.timeparse import split_time
+from utils.cache_utils.artifact import cached_pickle
 import pickle
 import os
 
@@ -30,16 +32,14 @@ def sample_coord_data(data,start_day,end_day,out,min_distance=4000,
     fo.write("orderid,candidate_loc,label,%s,next_bsx,next_usx,tbsx,tusx\n"%head)
     with open(data) as f:
         for c,row in enumerate(csv.DictReader(f)):
-            ymd, hms = row['starttime'].split()
-            year,month,day = ymd.split('-')
-            day = int(day)
+            ymd,hms,year,month,day = split_time(row['starttime'])[:5]
             row["coord_start"] = h2c[row['geohashed_start_loc']]
             if is_train:
                 row["coord_end"] = h2c[row['geohashed_end_loc']]
             if 'geohashed_end_loc' not in row:
                 row['geohashed_end_loc'] = 'xx'
             row['hour'] = hms.split('-')[0]
-            row['dow'] = str(((int(month)-5)*31 + int(day))%7)
+            row['dow'] = str(((month-5)*31 + day)%7)
             row['next_bs'] = h2c.get(bsdic.get(row['orderid'],('',100000))[0],'')
             row['next_us'] = h2c.get(usdic.get(row['orderid'],('',100000))[0],'')
 
@@ -190,10 +190,9 @@ def sample_hash_data(inx,out,coord_pred,counter={},scounter=defaultdict(int),sta
 
     for c,row in enumerate(csv.DictReader(open(inx))):
 
-        ymd, hms = row['starttime'].split()
+        ymd,hms,year,month,day = split_time(row['starttime'])[:5]
         #row['hour'] = hms.split('-')[0]
-        year,month,day = ymd.split('-')
-        row['dow'] = str(((int(month)-5)*31 + int(day))%7)
+        row['dow'] = str(((month-5)*31 + day)%7)
         row['gs6'] = row['geohashed_start_loc'][:6]
         row['gs5'] = row['geohashed_start_loc'][:5]
         row['gs4'] = row['geohashed_start_loc'][:4]
@@ -340,15 +339,17 @@ def get_consecutive_start_dic(ins,op,fea):
         h2,m2,s2 = t2
         return ((h2-h1)*60+(m2-m1))*60+s2-s1
     #op = "comps/mobike/sol_carl/data/ssdic.p"
-    if os.path.exists(op):
-        return pickle.load(open(op,'rb'))
+    def _consecutive_start_dic():
+        return _build_consecutive_start_dic(ins,op,fea,_time_diff)
+    return cached_pickle(op,_consecutive_start_dic,inputs=ins,params={"fea":fea})
 
+def _build_consecutive_start_dic(ins,op,fea,_time_diff):
     dic={}
     for inx in ins:
         for c,row in enumerate(csv.DictReader(open(inx))):
             if row[fea] not in dic:
                 dic[row[fea]] = []
-            ymd, hms = row['starttime'].split()
+            ymd,hms = split_time(row['starttime'])[:2]
             #row['hour'] = hms.split('-')[0]
             dic[row[fea]].append((row['orderid'],row['geohashed_start_loc'],ymd,hms))
             if c>0 and c%100000 == 0:
@@ -360,8 +361,6 @@ def get_consecutive_start_dic(ins,op,fea):
             k = l[0]
             if ll[c+1][2] == ll[c][2]:
                 bdic[k] = (ll[c+1][1],_time_diff(ll[c][3],ll[c+1][3]))
-
-    pickle.dump(bdic,open(op,'wb'))
     return bdic
 
 def get_normalize_sloc_counter(inxs,counter={},scounter=defaultdict(int)):
@@ -370,18 +369,20 @@ def get_normalize_sloc_counter(inxs,counter={},scounter=defaultdict(int)):
     """
     feas = 'ub,userid,bikeid,biketype,hour,dow'
     op = "comps/mobike/sol_carl/data/all_sc.p"
-    if os.path.exists(op):
-        return pickle.load(open(op,'rb'))
+    def _normalize_sloc_counter():
+        return _build_normalize_sloc_counter(inxs,counter,scounter,feas)
+    return cached_pickle(op,_normalize_sloc_counter,inputs=inxs,params={"feas":feas})
+
+def _build_normalize_sloc_counter(inxs,counter,scounter,feas):
     candidate_feas = ['bikeid','userid']
     feas = feas.split(',')
     rate = 0
     for inx in inxs:
         for c,row in enumerate(csv.DictReader(open(inx))):
 
-            ymd, hms = row['starttime'].split()
+            ymd,hms,year,month,day = split_time(row['starttime'])[:5]
             row['hour'] = hms.split('-')[0]
-            year,month,day = ymd.split('-')
-            row['dow'] = str(((int(month)-5)*31 + int(day))%7)
+            row['dow'] = str(((month-5)*31 + day)%7)
             row['ub'] = "%s_%s"%(row['userid'],row['bikeid'])
 
             for fea in feas:
@@ -397,7 +398,6 @@ def get_normalize_sloc_counter(inxs,counter={},scounter=defaultdict(int)):
                     break
             if c>0 and c%100000 == 0:
                 print("%s %d day %s rows processed, cover rate %.3f"%(inx,c,day,(rate*1.0/c)))
-    pickle.dump((counter,scounter),open(op,'wb'))
     return counter,scounter
 
 def rm_low_freq(inx,out,base,bar=10):
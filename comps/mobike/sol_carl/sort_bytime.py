@@ -1,5 +1,10 @@
 import pandas as pd
+import numpy as np
 import os
+from utils.pd_utils.datetime_fea import time_parts
+from utils.profile_utils.stages import stage
+
+@stage('sort_by_time')
 def sort_by_time(name):
     oname = name.replace('.csv','_sort.csv')
     if os.path.exists(oname):
@@ -12,14 +17,10 @@ def sort_by_time(name):
     print("sort %s done"%name)
 
 def get_time(s):
-    s['month'] = s['starttime'].apply(lambda x:x.split()[0].split('-')[1]).astype(int)
-    s['day'] = s['starttime'].apply(lambda x:x.split()[0].split('-')[-1]).astype(int)
-    s['year'] = s['starttime'].apply(lambda x:x.split()[0].split('-')[0]).astype(int)
-    s['hour'] = s['starttime'].apply(lambda x:x.split()[1].split(':')[0]).astype(int)
-    s['min'] = s['starttime'].apply(lambda x:x.split()[1].split(':')[1]).astype(int)
-    s['sec'] = s['starttime'].apply(lambda x:x.split()[1].split(':')[-1].split('.')[0]).astype(int)
-    s['time'] = ((((s.month-5)*30+s.day-9)*24+s.hour)*60+s['min'])*60 + s['sec']
-    return s.drop('month,day,year,hour,min,sec'.split(','),axis=1)
+    t = time_parts(s['starttime'],['month','day','hour','minute','second'])
+    month = t['month'].astype(np.int64)
+    s['time'] = ((((month-5)*30+t['day']-9)*24+t['hour'])*60+t['minute'])*60 + t['second']
+    return s
 
 if __name__ == "__main__":
     sort_by_time('comps/mobike/sol_carl/data/tr.csv')
@@ -1,15 +1,22 @@
 import pandas as pd
 import os
+from utils.pd_utils.datetime_fea import time_parts
+from utils.profile_utils.stages import stage
+from utils.sk_utils.folds import get_folds
+
+@stage('split')
 def split():
     if os.path.exists('comps/mobike/sol_carl/data/va.csv'):
         return
     path = "../input/train.csv"
     s = pd.read_csv(path)
-    s['day'] = s['starttime'].apply(lambda x:x.split()[0].split('-')[-1]).astype(int)
-    mask = s['day']>19
-    s[mask].drop('geohashed_end_loc',axis=1).to_csv('comps/mobike/sol_carl/data/va.csv',index=False)
-    s[~mask].to_csv('comps/mobike/sol_carl/data/tr.csv',index=False)
-    s[mask][['orderid','geohashed_end_loc']].to_csv('comps/mobike/sol_carl/data/va_label.csv',index=False)
+    s['day'] = time_parts(s['starttime'],['day'])['day']
+    # fold 1 is day 20 on, trained with the days before it
+    folds = get_folds('comps/mobike/sol_carl/data/day',s.shape[0],time=s['day'].values,cuts=[20])
+    va,tr = s.iloc[folds.valid(1)],s.iloc[folds.train(1)]
+    va.drop('geohashed_end_loc',axis=1).to_csv('comps/mobike/sol_carl/data/va.csv',index=False)
+    tr.to_csv('comps/mobike/sol_carl/data/tr.csv',index=False)
+    va[['orderid','geohashed_end_loc']].to_csv('comps/mobike/sol_carl/data/va_label.csv',index=False)
 
 if __name__ == "__main__":
     split()
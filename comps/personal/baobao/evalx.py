@@ -24,27 +24,33 @@ def multiclass_log_loss(y_true, y_pred, eps=1e-15):
     vectsum = np.sum(actual * np.log(predictions))
     loss = -1.0 / n_samples * vectsum
     return loss
-def cross_entropy(y,yp):
-    yp[yp>0.99999] = 0.99999
-    yp[yp<1e-5] = 1e-5
-    return np.mean(-np.log(yp[range(yp.shape[0]),y.astype(int)]))
+from utils.np_utils.metrics import mlogloss as cross_entropy
+from utils.np_utils.stream_metrics import loglossAcc
 
-def eval(name,clip=False,bar=0.9):
-    base = pd.read_csv('../input/stage1_solution_filtered.csv')
-    base['Class'] = np.argmax(base[['class%d'%i for i in range(1,10)]].values,axis=1)
-    sub = pd.read_csv(name)
-    #sub = pd.merge(sub,base[['ID','Class']],on="ID",how='right')
-    #print(sub.head())
-    y = base['Class'].values
-    yp = sub[['class%d'%i for i in range(1,10)]].values
-    if clip:
-        yp = np.clip(yp,(1.0-bar)/8,bar)
-        yp = yp/np.sum(yp,axis=1).reshape([yp.shape[0],1])
-    print(name,cross_entropy(y,yp),multiclass_log_loss(y,yp))
+def eval(name,clip=False,bar=0.9,chunksize=1<<16):
+    # both files are read in chunks, rows are matched by position
+    cols = ['class%d'%i for i in range(1,10)]
+    accs = [(loglossAcc(),loglossAcc(eps=1e-15)) for i in range(10)]
+    bases = pd.read_csv('../input/stage1_solution_filtered.csv',chunksize=chunksize)
+    subs = pd.read_csv(name,chunksize=chunksize)
+    for base,sub in zip(bases,subs):
+        y = np.argmax(base[cols].values,axis=1)
+        yp = sub[cols].values
+        if clip:
+            yp = np.clip(yp,(1.0-bar)/8,bar)
+            yp = yp/np.sum(yp,axis=1).reshape([yp.shape[0],1])
+        # multiclass_log_loss renormalizes the clipped rows
+        ypn = np.clip(yp,1e-15,1-1e-15)
+        ypn = ypn/ypn.sum(axis=1)[:,np.newaxis]
+        for i,(ce,mll) in enumerate(accs):
+            m = y==i if i<9 else slice(None)
+            ce.update(y[m],yp[m])
+            mll.update(y[m],ypn[m])
+    ce,mll = accs[-1]
+    print(name,ce.score(),mll.score())
     for i in range(9):
-        y1 = y[y==i]
-        yp1 = yp[y==i]
-        print(i,y1.shape,cross_entropy(y1,yp1),multiclass_log_loss(y1,yp1))
+        ce,mll = accs[i]
+        print(i,(ce.n,),ce.score(),mll.score())
 
 if __name__ == "__main__":
     name = sys.argv[1]
@@ -1,4 +1,5 @@
 import tensorflow as tf
+import numpy as np
 from comps.personal.personal_db import personalDB
 from comps.personal.baobao.d2v import D2V
 
@@ -50,29 +51,20 @@ class BaoNN(D2V):
             self.logit = net
         
     def _batch_gen(self):
-        from random import sample,randint
+        from utils.pd_utils.batch_sampler import batchSampler
         self.DB.get_split()
         epochs = self.flags.epochs
         fold = self.flags.fold
 
         if fold>=0:
-            docs_ids = list(self.DB.split[fold][0])
+            docs_ids = np.asarray(self.DB.split[fold][0])
         else:
-            docs_ids = list(range(self.DB.data['training_text'].shape[0]))
-
-        B = min(self.flags.batch_size,len(docs_ids))
-        batches_per_epoch = len(docs_ids)//B
+            docs_ids = np.arange(self.DB.data['training_text'].shape[0])
 
         y = self.DB.y
-        #print(batches_per_epoch)
-        for epoch in range(epochs):
-            for batch in range(batches_per_epoch):
-                inputs = []
-                labels = [] # 0 or 1
-                for idx in sample(docs_ids,B):
-                    inputs.append(idx+1)
-                    labels.append(y[idx])
-                yield inputs, labels, epoch 
+        # every doc once per epoch, doc id 0 is reserved
+        return batchSampler(docs_ids+1,y=y[docs_ids],batch_size=self.flags.batch_size,
+            epochs=epochs,stratify=y[docs_ids].argmax(axis=1))
 
     def _batch_gen_test(self):
         return self._batch_gen_va()
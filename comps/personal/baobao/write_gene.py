@@ -1,6 +1,7 @@
 import os
 import re
 import csv
+from utils.parallel_utils.executor import get_executor,progressReport
 
 def poke_gene_texts(flags):
     import pandas as pd
@@ -44,7 +45,8 @@ def write_gene_text(flags,window=10,bar=0):
         vname = name.replace('text','variants')
         sv = pd.read_csv("%s/%s"%(path,vname))
         s['Gene'] = sv['Gene'].values
-        s['GText'] = s.apply(lambda row:find_gene_text(row['Text'],row['Gene'],W,bar),axis=1)
+        jobs = [(text,gene,W,bar) for text,gene in zip(s['Text'].values,s['Gene'].values)]
+        s['GText'] = get_executor().map(find_gene_text,jobs,star=True,progress=progressReport(name))
         fo = open(oname,'w')
         fo.write("ID,Text\n")
         for i in range(s.shape[0]):
@@ -54,29 +56,32 @@ def write_gene_text(flags,window=10,bar=0):
 def write_gene_text_pypy(flags,tag='Gene',window=10,bar=0):
     path = flags.input_path
     opath = flags.data_path
-    W = window
-    for name in ['training_text','test_text_filter','stage2_test_text.csv']:
-        oname = "%s/%s_%d_%d_%s"%(opath,tag.lower(),W,bar,name)
-        if os.path.exists(oname):
-            continue
-        f1 = open("%s/%s"%(path,name))
-        vname = name.replace('text','variants')
-        f2 = csv.DictReader(open("%s/%s"%(path,vname)))
-        f1.readline()
-        fo = open(oname,'w')
-        fo.write("ID,Text\n")
-        for c,l1 in enumerate(f1):
-            if c%1000 == 0:
-                print(c,oname)
-            l2 = f2.next()
-            #print(l2)
-            ID,gene = l2['ID'],l2[tag]
-            text = l1.strip().split('||')[1]
-            gtext = find_gene_text(text,gene,W,bar,isvar=tag=='Variation')
-            fo.write("%s||%s\n"%(ID,gtext))
-        fo.close()
-        f1.close()
-        print(oname,'done')
+    jobs = [(path,opath,name,tag,window,bar) for name in ['training_text','test_text_filter','stage2_test_text.csv']]
+    # the files are independent, one worker each
+    get_executor(len(jobs)).map(_write_gene_file,jobs,chunksize=1,star=True)
+
+def _write_gene_file(path,opath,name,tag,W,bar):
+    oname = "%s/%s_%d_%d_%s"%(opath,tag.lower(),W,bar,name)
+    if os.path.exists(oname):
+        return
+    f1 = open("%s/%s"%(path,name))
+    vname = name.replace('text','variants')
+    f2 = csv.DictReader(open("%s/%s"%(path,vname)))
+    f1.readline()
+    fo = open(oname,'w')
+    fo.write("ID,Text\n")
+    for c,l1 in enumerate(f1):
+        if c%1000 == 0:
+            print(c,oname)
+        l2 = f2.next()
+        #print(l2)
+        ID,gene = l2['ID'],l2[tag]
+        text = l1.strip().split('||')[1]
+        gtext = find_gene_text(text,gene,W,bar,isvar=tag=='Variation')
+        fo.write("%s||%s\n"%(ID,gtext))
+    fo.close()
+    f1.close()
+    print(oname,'done')
 
 def find_gene_text(s,gene,W,bar,isvar=False):
     s,gene = s.upper(),gene.upper()
@@ -5,7 +5,7 @@ import pandas as pd
 import numpy as np
 from utils.utils import print_mem_time
 from utils.pd_utils.utils import series_equal
-from utils.pypy_utils.utils import load_pickle,save_pickle
+from utils.sk_utils.folds import get_folds
 from utils.nlp_utils.utils import df_per_sample_word_lists
 import pickle
 
@@ -39,29 +39,24 @@ class personalDB(nlpDB):
         Table = namedtuple('Table', 'name fname dtype')
         tables = [Table(i,"%s/%s"%(path,j),{}) for i,j in zip(names,fnames) if files =="all" or i in files]
 
-        print()
-        self.flags = flags
-        path = flags.data_path
-        data = {}
-        for table in tables:
-            name,fname,dtype = table.name,table.fname,table.dtype
-            pname = "%s/%s_%s.pkl"%(path,self.name,name.split('/')[-1].split('.')[0])
-            if os.path.exists(pname):
-                data[name] = pd.read_pickle(pname)
-            else: 
-                if '_text' in name:              
-                    data[name] = pd.read_csv(fname,header=None,sep="\|\|",skiprows=1,names=['ID','Text']) 
-                else:
-                    data[name] = pd.read_csv(fname)
-                data[name].to_pickle(pname)
-            print_mem_time("Loaded {} {}".format(fname.split('/')[-1],data[name].shape))
-        self.data = data # no copy, pass the reference
+        super()._build(flags,tables,eager=getattr(flags,'eager_load',None))
         if "training_variants" in self.data:
             y = self.data["training_variants"]['Class']-1
             from utils.np_utils.encoder import onehot_encode
             self.y = onehot_encode(y,self.flags.classes)
         print()
 
+    def _cache_name(self,path,name):
+        return "%s/%s_%s"%(path,self.name,name.split('/')[-1].split('.')[0])
+
+    def _cache_params(self,table,prob_dtype):
+        return {"text":'_text' in table.name}
+
+    def _read_raw(self,table,prob_dtype=False):
+        if '_text' in table.name:
+            return pd.read_csv(table.fname,header=None,sep="\|\|",skiprows=1,names=['ID','Text'])
+        return pd.read_csv(table.fname)
+
     def poke_text(self):
         for name,data in self.data.items():
             if 'text' not in name:
@@ -97,20 +92,10 @@ class personalDB(nlpDB):
     def get_split(self):
         if self.split is not None:
             return
-        name = "{}/split.p".format(self.flags.data_path)
-        split = load_pickle(None,name,[])
-        
-        if len(split) == 0:
-            #data = self.data["training_variants"].append(self.data["test_variants_filter"])
-            data = self.data["training_variants"]
-            y = data['Class']-1
-            X = np.arange(y.shape[0])
-            from sklearn.model_selection import StratifiedKFold
-            skf = StratifiedKFold(n_splits=self.flags.folds,shuffle=True,random_state=99)
-            split = [(train_index, test_index) for train_index, test_index in skf.split(X, y)]
-            save_pickle(split,name)
-            print("new shuffle")
-        self.split = split
+        #data = self.data["training_variants"].append(self.data["test_variants_filter"])
+        y = self.data["training_variants"]['Class'].values-1
+        self.split = get_folds("{}/split".format(self.flags.data_path),y.shape[0],
+            int(self.flags.folds),y=y,seed=99)
         #print("split va",split[0][1][:10])
 
     def random_pick_sample(self, bar=0.005,floor = 1e-4):
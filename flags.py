@@ -39,6 +39,8 @@ def get_parser():
     parser.add_argument("--height",help="height of image to resize to")
     parser.add_argument('--add_paths',help='additional input paths')
     parser.add_argument('--add_record_paths',help='additional records')
+    parser.add_argument('--stage_report',help='csv or json file the stage profile is appended to')
+    parser.add_argument('--eager_load',choices=['thread','process'],help='load every pd_DB table at start with a pool of threads or processes')
     parser.add_argument("--momentum",help="momentum")
     #####################################################################
 
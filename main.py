@@ -53,7 +53,12 @@ def main(_):
         print("Unknown competion %s"%FLAGS.comp)
         assert False
     print("run competition %s solution %s"%(FLAGS.comp,FLAGS.sol))
-    run_sol(FLAGS)
+    from utils.profile_utils.stages import stage,set_report
+    if getattr(FLAGS,'stage_report',None):
+        set_report(FLAGS.stage_report)
+    name = '.'.join(str(i) for i in [FLAGS.comp,FLAGS.sol,getattr(FLAGS,'task',None)] if i)
+    with stage(name):
+        run_sol(FLAGS)
 
 if __name__ == "__main__":
     try:
@@ -1,6 +1,7 @@
 import lightgbm as lgb 
 import numpy as np
 from utils.pypy_utils.utils import sort_value
+from utils.sk_utils.folds import get_folds
  
 class lgb_model(object):
     
@@ -48,28 +49,21 @@ class lgb_model(object):
         return self.bst.predict(Xt, num_iteration=self.bst.best_iteration)
 
     def bag_fit_predict(self,X,y,Xt,obj=None,feval=None,folds=4,
-        stratified=True,ydim=1,shuffle=True):
+        stratified=True,ydim=1,shuffle=True,fold_path=None):
         #X,y,Xt = np.array(X),np.array(y),np.array(Xt)
         print(self.params)
         num_round = self.params.get('num_round',1000)
         early_stopping_rounds = self.params['early_stopping_rounds']
         maximize = self.params.get('maximize',False)
-        def _get_split(X,y,stratified):
-            import sklearn
-            if stratified:
-                kf = sklearn.model_selection.StratifiedKFold(n_splits=folds, shuffle=shuffle, random_state=126)
-                for tr,te in kf.split(X,y):
-                    yield tr,te
-            else:
-                kf = sklearn.model_selection.KFold(n_splits=folds, shuffle=shuffle, random_state=126)
-                for tr,te in kf.split(X):
-                    yield tr,te
+        # the same folds for every model of a dataset when fold_path is set
+        split = get_folds(fold_path,X.shape[0],folds,y=y if stratified else None,
+            shuffle=shuffle,seed=126)
         if ydim==1:
             yp = np.zeros(Xt.shape[0])
         else:
             yp = np.zeros([Xt.shape[0],ydim])
         scores = []
-        for k,(tr,te) in enumerate(_get_split(X,y,stratified)):
+        for k,(tr,te) in enumerate(split):
             Xtr,Xte = X[tr],X[te]
             ytr,yte = y[tr],y[te]
             score = self.fit(Xtr,ytr,Xt=Xte,yt=yte,obj=obj,feval=feval)
@@ -4,6 +4,7 @@ xgboost for classification & regression
 import xgboost as xgb
 import numpy as np
 from utils.pypy_utils.utils import sort_value
+from utils.sk_utils.folds import get_folds
  
 class xgb_model(object):
     
@@ -48,29 +49,22 @@ class xgb_model(object):
         return 0
 
     def bag_fit_predict(self,X,y,Xt,obj=None,feval=None,folds=4,
-        stratified=True,ydim=1,evalx=None,shuffle=True):
+        stratified=True,ydim=1,evalx=None,shuffle=True,fold_path=None):
         assert (self.params['colsample_bytree'] < 1 or self.params['subsample'] < 1)
         #X,y,Xt = np.array(X),np.array(y),np.array(Xt)
         num_round = self.params.get('num_round',1000)
         early_stopping_rounds = self.params['early_stopping_rounds']
         maximize = self.params.get('maximize',False)
 
-        def _get_split(X,y,stratified):
-            import sklearn
-            if stratified:
-                kf = sklearn.model_selection.StratifiedKFold(n_splits=folds, shuffle=shuffle, random_state=126)
-                for tr,te in kf.split(X,y):
-                    yield tr,te
-            else:
-                kf = sklearn.model_selection.KFold(n_splits=folds, shuffle=shuffle, random_state=126)
-                for tr,te in kf.split(X):
-                    yield tr,te
+        # the same folds for every model of a dataset when fold_path is set
+        split = get_folds(fold_path,X.shape[0],folds,y=y if stratified else None,
+            shuffle=shuffle,seed=126)
         if ydim==1:
             yp = np.zeros(Xt.shape[0])
         else:
             yp = np.zeros([Xt.shape[0],ydim])
         scores = []
-        for k,(tr,te) in enumerate(_get_split(X,y,stratified)):
+        for k,(tr,te) in enumerate(split):
             Xtr,Xte = X[tr],X[te]
             ytr,yte = y[tr],y[te]            
             score = self.fit(Xtr,ytr,Xt=Xte,yt=yte,obj=obj,feval=feval,
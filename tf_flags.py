@@ -46,6 +46,8 @@ flags.DEFINE_integer("width",None,"width of image to resize to")
 flags.DEFINE_integer("height",None,"height of image to resize to")
 flags.DEFINE_string('add_paths', None, 'additional input paths')
 flags.DEFINE_string('add_record_paths', None, 'additional records')
+flags.DEFINE_string('stage_report', None, 'csv or json file the stage profile is appended to')
+flags.DEFINE_string('eager_load', None, 'thread or process: load every pd_DB table at start with a pool')
 flags.DEFINE_float("momentum",0.0,"momentum")
 flags.DEFINE_float("verbosity",100,"verbosity")
 
@@ -0,0 +1,237 @@
+"""
+content fingerprinted cache for derived artifacts
+an artifact (a pickle, a tfrecord, a columnar table ...) is keyed by a hash of
+the function that builds it, its parameters and the size/mtime/digest of its
+input files. A manifest next to the artifacts remembers the key each one was
+built with, so only artifacts whose key changed are rebuilt.
+
+pure python on purpose, the mobike pipeline runs it under pypy.
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import atexit
+import threading
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+MANIFEST = "artifacts.json"
+BLOCK = 1<<22
+
+_caches = {}
+
+def get_cache(root):
+    """
+    one cache per directory, shared by every caller in the process
+    """
+    root = os.path.normpath(root)
+    if root not in _caches:
+        _caches[root] = artifactCache(root)
+    return _caches[root]
+
+def cached_pickle(out,build,name=None,inputs=(),params=None,root=None):
+    """
+        Input:
+            out: pickle file of the artifact
+            build: function without arguments returning the artifact
+            name: name of the builder, defaults to build.__name__
+            inputs: files or directories the artifact is derived from
+            params: json-able parameters of the build
+            root: directory holding the manifest, defaults to dirname(out)
+        Return: the artifact, loaded from out if still valid
+    """
+    cache = get_cache(root or os.path.dirname(out) or '.')
+    return cache.cached(out,build,name=name,inputs=inputs,params=params,
+        load=_load_pickle,save=_save_pickle)
+
+def _load_pickle(out):
+    with open(out,'rb') as f:
+        return pickle.load(f)
+
+def _save_pickle(data,out):
+    with open(out,'wb') as fo:
+        pickle.dump(data,fo,protocol=pickle.HIGHEST_PROTOCOL)
+
+def path_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(d,f)) for d,_,fs in os.walk(path) for f in fs)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+class artifactCache(object):
+
+    def __init__(self,root,adopt=True,verbose=True):
+        """
+            root: directory of the manifest
+            adopt: artifacts built before the manifest existed are
+                trusted once and recorded, instead of being rebuilt
+        """
+        self.root = root
+        self.adopt = adopt
+        self.verbose = verbose
+        self.mname = os.path.join(root,MANIFEST)
+        # threads of this process (eager table loads) share the manifest
+        self.lock = threading.RLock()
+        self.manifest = self._read()
+        self.hits,self.misses = 0,0
+        self.bytes_saved,self.seconds_saved = 0,0.0
+        self.rebuilt = []
+        self.removed = set()
+        atexit.register(self._report_at_exit)
+
+    def key(self,name,inputs=(),params=None):
+        h = hashlib.sha1()
+        h.update(("%s\n"%name).encode('utf-8'))
+        for path in inputs:
+            h.update(("%s %s\n"%(path,self.fingerprint(path))).encode('utf-8'))
+        h.update(json.dumps(params,sort_keys=True,default=repr).encode('utf-8'))
+        return h.hexdigest()
+
+    def fingerprint(self,path):
+        """
+        size, mtime and a sha1 of the content. The digest is memoized in the
+        manifest by (size,mtime) so unchanged inputs are not read again.
+        """
+        if os.path.isdir(path):
+            files = sorted(os.path.join(d,f) for d,_,fs in os.walk(path) for f in fs if f != MANIFEST)
+            h = hashlib.sha1()
+            for f in files:
+                h.update(("%s %s\n"%(os.path.relpath(f,path),self.fingerprint(f))).encode('utf-8'))
+            return h.hexdigest()
+        if not os.path.exists(path):
+            return "missing"
+        st = os.stat(path)
+        stamp = "%d-%d"%(st.st_size,int(st.st_mtime*1e6))
+        files = self.manifest['files']
+        entry = files.get(path)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry['digest']
+        h = hashlib.sha1()
+        with open(path,'rb') as f:
+            for block in iter(lambda: f.read(BLOCK),b''):
+                h.update(block)
+        digest = "%s-%s"%(stamp.split('-')[0],h.hexdigest())
+        with self.lock:
+            self.manifest['files'][path] = {"stamp":stamp,"digest":digest}
+        return digest
+
+    def check(self,out,key):
+        """
+        True if out exists and was built with key, counts hits and misses
+        """
+        with self.lock:
+            return self._check(out,key)
+
+    def _check(self,out,key):
+        entry = self.manifest['artifacts'].get(out)
+        exists = os.path.exists(out)
+        if exists and entry is None and self.adopt:
+            if self.verbose:
+                print("adopt existing %s"%out)
+            self.commit(out,key,0.0)
+            entry = self.manifest['artifacts'][out]
+        if exists and entry is not None and entry['key'] == key:
+            self.hits += 1
+            self.bytes_saved += entry['bytes']
+            self.seconds_saved += entry['seconds']
+            return True
+        self.misses += 1
+        if exists:
+            self.rebuilt.append(out)
+            if self.verbose:
+                print("%s is stale, rebuild"%out)
+        return False
+
+    def commit(self,out,key,seconds):
+        entry = {"key":key,"bytes":path_size(out),
+            "seconds":seconds,"built":time.strftime("%Y-%m-%d %H:%M:%S")}
+        with self.lock:
+            self.removed.discard(out)
+            self.manifest['artifacts'][out] = entry
+            self._write()
+
+    def reload(self):
+        # pick up artifacts committed by other processes
+        with self.lock:
+            disk = self._read()
+            for tag in ['artifacts','files']:
+                disk[tag].update(self.manifest[tag])
+            self.manifest = disk
+
+    def invalidate(self,out):
+        with self.lock:
+            self.manifest['artifacts'].pop(out,None)
+            self.removed.add(out)
+            self._write()
+
+    def cached(self,out,build,name=None,inputs=(),params=None,load=None,save=None):
+        """
+            build: returns the artifact, or writes out itself if save is None
+            load: reads the artifact back from out, None to skip loading
+            save: writes the artifact returned by build to out
+        """
+        key = self.key(name or build.__name__,inputs,params)
+        if self.check(out,key):
+            return load(out) if load is not None else None
+        start = time.time()
+        data = build()
+        if save is not None:
+            save(data,out)
+        self.commit(out,key,time.time()-start)
+        return data
+
+    def report(self):
+        total = self.hits+self.misses
+        if total == 0:
+            return
+        print("artifact cache %s: %d hits %d misses, %.2f GB and %.1f seconds saved"%(
+            self.root,self.hits,self.misses,self.bytes_saved/1024.0**3,self.seconds_saved))
+        for out in self.rebuilt:
+            print("  rebuilt stale %s"%out)
+
+    def _report_at_exit(self):
+        try:
+            self.report()
+        except Exception:
+            pass
+
+    def _read(self):
+        if os.path.exists(self.mname):
+            with open(self.mname) as f:
+                manifest = json.load(f)
+        else:
+            manifest = {}
+        manifest.setdefault('artifacts',{})
+        manifest.setdefault('files',{})
+        return manifest
+
+    def _write(self):
+        # merge with entries other processes committed meanwhile, the lock
+        # file keeps two processes from dropping each other's entries
+        with self.lock:
+            if not os.path.exists(self.root):
+                try:
+                    os.makedirs(self.root)
+                except OSError:
+                    if not os.path.isdir(self.root):
+                        raise
+            with open(self.mname+".lock",'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock,fcntl.LOCK_EX)
+                try:
+                    disk = self._read()
+                    for tag in ['artifacts','files']:
+                        disk[tag].update(self.manifest[tag])
+                    for out in self.removed:
+                        disk['artifacts'].pop(out,None)
+                    self.manifest = disk
+                    tmp = "%s.%d.tmp"%(self.mname,os.getpid())
+                    with open(tmp,'w') as fo:
+                        json.dump(self.manifest,fo,indent=1,sort_keys=True)
+                    os.rename(tmp,self.mname)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock,fcntl.LOCK_UN)
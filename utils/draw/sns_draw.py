@@ -1,6 +1,7 @@
 import seaborn as sns
 import matplotlib.pyplot as plt
 import numpy as np
+from utils.pd_utils.utils import num_cols
 
 def scatter(x,y,xlabel='x',ylabel='y',title=None,line=False,name=None,show=False):
     sns.set()
@@ -29,7 +30,7 @@ def distribution(data,xlabel="data",ylabel="percentage",name=None):
 def corr_heatmap(df,cols=None,name=None):
     sns.set()
     if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype!='object']
+        cols = num_cols(df)
     df = df[cols].corr()
     print(df.shape)
     ds = sns.heatmap(df, annot=False)
@@ -8,11 +8,13 @@ import pickle
 from utils.nlp_utils.utils import rm_stop_words,df_global_word_container,stem,\
     df_per_sample_word_lists,tf,idf,tf_idf,rm_punctuation
 from utils.pypy_utils.utils import load_pickle,save_pickle,sort_value
+from utils.cache_utils.artifact import cached_pickle
 
 
 class nlpDB(pd_DB):
 
     def __init__(self,name,noise_texts=[]):
+        super().__init__()
         self.name = name
         self.stem_dic = None
         self.sample_tf = None
@@ -53,9 +55,7 @@ class nlpDB(pd_DB):
 
         for text in texts:
             name = "{}/{}_clean_doc_{}.p".format(self.flags.data_path,self.name,text)
-            if os.path.exists(name):
-                self.clean_doc[text] = pickle.load(open(name,'rb'))
-            else:
+            def _clean_doc(text=text,name=name):
                 print("gen",name)
                 word_lists = [] # list of lists, each item is a list of words for each sample
                 df_per_sample_word_lists(self.data[text],field,word_lists) 
@@ -69,8 +69,10 @@ class nlpDB(pd_DB):
                     clean_lists.append(word_list)
                     if c%1000 == 0:
                         print("{} docs cleaned {}".format(c,word_list[:10]))
-                pickle.dump(clean_lists,open(name,'wb'))
-                self.clean_doc[text] = clean_lists
+                return clean_lists
+            self.clean_doc[text] = self._cached(name,_clean_doc,
+                inputs=[self._source(text),self._stem_name()],
+                params={"field":field,"words":sorted(selected_words)})
         #print(self.clean_doc[text][0])
 
     def get_per_sample_tfidf(self, texts, field, silent=0):
@@ -85,28 +87,29 @@ class nlpDB(pd_DB):
         self.sample_tfidf = {}
         self.get_per_sample_tf(texts, field, 1)
 
-        name = "{}/{}_global_idf_dic.p".format(self.flags.data_path,self.name)
-        self.global_idf_dic = load_pickle(self.global_idf_dic,name,{})
-        if len(self.global_idf_dic)==0:
+        name = self._idf_name()
+        def _global_idf_dic():
             print("gen",name)
             all_tf_list = []
             for text in texts:
                 if text not in self.noise_texts:
                     all_tf_list.extend(self.sample_tf[text])
-            idf(all_tf_list,self.global_idf_dic,0)
-            save_pickle(self.global_idf_dic,name)
+            idf_dic = {}
+            idf(all_tf_list,idf_dic,0)
+            return idf_dic
+        if self.global_idf_dic is None:
+            self.global_idf_dic = self._cached(name,_global_idf_dic,
+                inputs=[self._tf_name(text) for text in texts if text not in self.noise_texts])
 
         for text in texts:
             name = "{}/{}_sample_tfidf_{}.p".format(self.flags.data_path,self.name,text)
-            if os.path.exists(name):
-                self.sample_tfidf[text] = pickle.load(open(name,'rb'))
-            else:
+            def _sample_tfidf(text=text,name=name):
                 print("gen",name)
                 tf_list = self.sample_tf[text]
                 idf_list = self.get_idf_list(tf_list)
-                tfidf_list = tf_idf(tf_list, idf_list,0)
-                pickle.dump(tfidf_list,open(name,'wb'))
-                self.sample_tfidf[text] = tfidf_list
+                return tf_idf(tf_list, idf_list,0)
+            self.sample_tfidf[text] = self._cached(name,_sample_tfidf,
+                inputs=[self._tf_name(text),self._idf_name()])
             if silent==0:
                 print("\n{} sample tfidf done".format(text))
 
@@ -131,14 +134,12 @@ class nlpDB(pd_DB):
         self.get_per_sample_words_count(texts, field, 1)
 
         for text in texts:
-            name = "{}/{}_sample_tf_{}.p".format(self.flags.data_path,self.name,text)
-            if os.path.exists(name):
-                self.sample_tf[text] = pickle.load(open(name,'rb'))
-            else:
+            name = self._tf_name(text)
+            def _sample_tf(text=text,name=name):
                 print("gen",name)
-                tf_list = tf(self.sample_words_count[text],0)
-                pickle.dump(tf_list,open(name,'wb'))
-                self.sample_tf[text] = tf_list
+                return tf(self.sample_words_count[text],0)
+            self.sample_tf[text] = self._cached(name,_sample_tf,
+                inputs=[self._count_name(text)])
             if silent==0:
                 print("\n{} sample tf done".format(text))
 
@@ -156,10 +157,8 @@ class nlpDB(pd_DB):
         self.get_global_words_count(texts,[field],1)
 
         for text in texts:
-            name = "{}/{}_sample_count_{}.p".format(self.flags.data_path,self.name,text)
-            if os.path.exists(name):
-                self.sample_words_count[text] = pickle.load(open(name,'rb'))
-            else:
+            name = self._count_name(text)
+            def _sample_count(text=text,name=name):
                 print("gen",name)
                 word_lists = [] # list of lists, each item is a list of words for each sample
                 df_per_sample_word_lists(self.data[text],field,word_lists) 
@@ -170,9 +169,9 @@ class nlpDB(pd_DB):
                     word_list = rm_punctuation(word_list)
                     word_list = stem(word_list,self.stem_dic)
                     word_counts.append(Counter(word_list))
-                
-                pickle.dump(word_counts,open(name,'wb'))
-                self.sample_words_count[text] = word_counts
+                return word_counts
+            self.sample_words_count[text] = self._cached(name,_sample_count,
+                inputs=[self._source(text)],params={"field":field})
             if silent == 0:
                 print("\n{} sample words count done".format(text))
 
@@ -192,9 +191,7 @@ class nlpDB(pd_DB):
 
         for text in texts:
             name = "{}/{}_total_count_{}.p".format(self.flags.data_path,self.name,text)
-            if os.path.exists(name):
-            	self.words_count[text] = pickle.load(open(name,'rb'))
-            else:
+            def _total_count(text=text,name=name):
                 print("gen",name)
                 word_list = []
                 df_global_word_container(self.data[text],fields,word_list) 
@@ -204,9 +201,9 @@ class nlpDB(pd_DB):
                 word_list = rm_stop_words(word_list)
                 word_list = rm_punctuation(word_list)
                 word_list = stem(word_list,self.stem_dic)
-                word_count = Counter(word_list)
-                pickle.dump(word_count,open(name,'wb'))
-                self.words_count[text] = word_count
+                return Counter(word_list)
+            self.words_count[text] = self._cached(name,_total_count,
+                inputs=[self._source(text)],params={"fields":fields})
 
             if silent==0:
                 print("\nnumber of different words in {}:".format(text),len(self.words_count[text]))
@@ -222,9 +219,21 @@ class nlpDB(pd_DB):
 
     def select_top_k_words(self, texts, field, mode="count", k=10, slack=8):
         name = "{}/{}_top{}-{}_{}_words.p".format(self.flags.data_path,self.name,k,slack,mode)
-        selected = load_pickle(None,name,set())
-        if len(selected):
-            return selected
+        # build or load what the words are selected from, the key depends on it
+        if mode=="count":
+            self.get_per_sample_words_count(texts,field,1)
+            inputs = [self._count_name(text) for text in texts]
+        else:
+            self.get_per_sample_tfidf(texts,field,1)
+            inputs = [self._tf_name(text) for text in texts]+[self._idf_name()]
+        def _top_k_words():
+            return self._select_top_k_words(texts,field,mode,k,slack)
+        return self._cached(name,_top_k_words,inputs=inputs,
+            params={"texts":texts,"field":field,"mode":mode,"k":k,"slack":slack})
+
+    def _select_top_k_words(self, texts, field, mode, k, slack):
+        selected = set()
+        name = "{}/{}_top{}-{}_{}_words.p".format(self.flags.data_path,self.name,k,slack,mode)
         print("gen",name)
 
         name = "{}/{}_stem_dic.p".format(self.flags.data_path,self.name)
@@ -256,8 +265,6 @@ class nlpDB(pd_DB):
                 if c>0 and c%1000 == 0:
                     print("{} documents done, mode {}, sample {}, num {}".format(c,mode,topk,len(selected)))
         print("num of selected {} key words:".format(mode),len(selected))
-        name = "{}/{}_top{}-{}_{}_words.p".format(self.flags.data_path,self.name,k,slack,mode)
-        save_pickle(selected,name)
         return selected
 
     def get_words(self,words):
@@ -265,4 +272,22 @@ class nlpDB(pd_DB):
         self.w2id = {i:c for c,i in enumerate(words)}
         self.id2w = {j:i for i,j in self.w2id.items()}
 
+    def _cached(self,name,build,inputs=(),params=None):
+        return cached_pickle(name,build,name="nlpDB.%s"%build.__name__,
+            inputs=inputs,params=params,root=self.flags.data_path)
+
+    def _source(self,text):
+        # the cached table a text is read from, so artifacts follow its raw file
+        return self.sources.get(text,"")
+
+    def _stem_name(self):
+        return "{}/{}_stem_dic.p".format(self.flags.data_path,self.name)
+
+    def _count_name(self,text):
+        return "{}/{}_sample_count_{}.p".format(self.flags.data_path,self.name,text)
+
+    def _tf_name(self,text):
+        return "{}/{}_sample_tf_{}.p".format(self.flags.data_path,self.name,text)
 
+    def _idf_name(self):
+        return "{}/{}_global_idf_dic.p".format(self.flags.data_path,self.name)
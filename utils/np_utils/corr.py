@@ -0,0 +1,144 @@
+"""
+blocked pearson correlation of many columns
+columns are centered and scaled once into a float32 matrix, the correlation
+matrix is then computed one block of columns against another with a matrix
+product, so only a block x block tile is ever held and pairs over a
+threshold are collected tile by tile. Missing values follow pandas:
+every pair is computed on the rows where both columns are present.
+"""
+import numpy as np
+
+BLOCK = 2048 # columns per tile, a tile is BLOCK*BLOCK float32
+
+def standardize(X):
+    """
+        Input:
+            X: 2d array or pd.DataFrame [n,p], may contain nan
+        Return:
+            Z: float32 [n,p], centered, unit norm columns, nan set to 0
+            M: float32 mask [n,p] of present values, None without nan
+    """
+    n,p = X.shape
+    Z = np.empty([n,p],dtype=np.float32)
+    M = None
+    # one column at a time in float64, a large offset (epoch seconds, ids)
+    # is removed before the values are rounded to float32
+    for c in range(p):
+        x = np.array(X.iloc[:,c].values if hasattr(X,'iloc') else X[:,c],dtype=np.float64)
+        nan = np.isnan(x)
+        if nan.any():
+            if M is None:
+                M = np.ones([n,p],dtype=np.float32)
+            M[:,c] = ~nan
+            x[nan] = 0
+            x -= x.sum()/max(n-nan.sum(),1)
+            x[nan] = 0
+        else:
+            x -= x.mean()
+        norm = np.sqrt(x.dot(x))
+        Z[:,c] = x/(norm if norm > 0 else 1)
+    return Z,M
+
+def corr_tiles(Z,M=None,block=BLOCK):
+    """
+        yield (i0,j0,R), R the correlations of columns i0: against j0:
+        for every tile on or above the diagonal
+    """
+    p = Z.shape[1]
+    for i0 in range(0,p,block):
+        zi = Z[:,i0:i0+block]
+        for j0 in range(i0,p,block):
+            zj = Z[:,j0:j0+block]
+            if M is None:
+                R = zi.T.dot(zj)
+            else:
+                R = _pairwise_tile(zi,zj,M[:,i0:i0+block],M[:,j0:j0+block])
+            yield i0,j0,R
+
+def _pairwise_tile(zi,zj,mi,mj):
+    # moments over the rows where both columns are present
+    n = mi.T.dot(mj)
+    sx,sy = zi.T.dot(mj),mi.T.dot(zj)
+    sxx,syy = (zi*zi).T.dot(mj),mi.T.dot(zj*zj)
+    sxy = zi.T.dot(zj)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        nn = np.where(n>1,n,np.nan)
+        cov = sxy-sx*sy/nn
+        var = (sxx-sx*sx/nn)*(syy-sy*sy/nn)
+        return cov/np.sqrt(var)
+
+def corr_matrix(X,block=BLOCK):
+    """
+        dense correlation matrix [p,p] float32, like df.corr()
+    """
+    Z,M = standardize(X)
+    p = Z.shape[1]
+    C = np.empty([p,p],dtype=np.float32)
+    for i0,j0,R in corr_tiles(Z,M,block):
+        C[i0:i0+R.shape[0],j0:j0+R.shape[1]] = R
+        C[j0:j0+R.shape[1],i0:i0+R.shape[0]] = R.T
+    return C
+
+def corr_pairs(X,bar,block=BLOCK,sample=None,slack=0.05,seed=0):
+    """
+        Input:
+            X: 2d array or pd.DataFrame [n,p]
+            bar: threshold on the absolute correlation
+            sample: None, or number (or fraction) of rows for a quick first
+                pass with threshold bar-slack, whose candidate pairs are
+                then checked on all rows
+        Return: i,j,score of the pairs i<j with |score|>bar, sorted by i,j
+    """
+    n = X.shape[0]
+    if sample is not None:
+        m = int(sample*n) if sample < 1 else int(sample)
+        if m < n:
+            rows = np.sort(np.random.RandomState(seed).choice(n,m,replace=False))
+            part = X.iloc[rows] if hasattr(X,'iloc') else X[rows]
+            I,J,_ = corr_pairs(part,bar-slack,block)
+            S = pair_corr(X,I,J)
+            mask = np.abs(S)>bar
+            return I[mask],J[mask],S[mask]
+    Z,M = standardize(X)
+    I,J,S = [],[],[]
+    for i0,j0,R in corr_tiles(Z,M,block):
+        with np.errstate(invalid='ignore'):
+            hit = np.abs(R)>bar
+        if i0 == j0:
+            hit = np.triu(hit,1)
+        i,j = np.nonzero(hit)
+        I.append(i+i0)
+        J.append(j+j0)
+        S.append(R[i,j])
+    if len(I) == 0:
+        return np.array([],dtype=np.int64),np.array([],dtype=np.int64),np.array([],dtype=np.float32)
+    I,J,S = np.concatenate(I),np.concatenate(J),np.concatenate(S)
+    order = np.lexsort((J,I))
+    return I[order],J[order],S[order]
+
+def pair_corr(X,I,J,chunk=1<<25):
+    """
+        correlation of the column pairs (I[k],J[k]) on all rows,
+        in chunks of pairs so at most about chunk values are gathered
+    """
+    n = X.shape[0]
+    S = np.empty(len(I),dtype=np.float32)
+    step = max(chunk//max(n,1),1)
+    for s in range(0,len(I),step):
+        a = _columns(X,I[s:s+step])
+        b = _columns(X,J[s:s+step])
+        mask = ~(np.isnan(a)|np.isnan(b))
+        cnt = mask.sum(axis=0)
+        a,b = np.where(mask,a,0),np.where(mask,b,0)
+        with np.errstate(divide='ignore',invalid='ignore'):
+            a -= a.sum(axis=0)/cnt
+            b -= b.sum(axis=0)/cnt
+            a *= mask
+            b *= mask
+            S[s:s+step] = (a*b).sum(axis=0)/np.sqrt((a*a).sum(axis=0)*(b*b).sum(axis=0))
+    return S
+
+def _columns(X,idx):
+    if hasattr(X,'iloc'):
+        return X.iloc[:,idx].values.astype(np.float64)
+    return X[:,idx].astype(np.float64)
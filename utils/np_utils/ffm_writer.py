@@ -0,0 +1,139 @@
+"""
+chunked libffm/libsvm writers
+rows are given as an int array ids [n,k] of feature ids per column (0 for
+none, what FFMEncoder.transform returns), a chunk of rows is turned into
+text by vectorized digit formatting into one byte buffer and written in one
+call.
+with workers>1 the rows are put in shared memory once and row shards are
+written by the processes of the shared pool into part files which are
+concatenated in order at the end.
+
+    enc = FFMEncoder().fit(tr[cols])
+    write_ffm("tr.ffm",enc.transform(tr[cols]).values,tr['y'].values,workers=4)
+"""
+import os
+import shutil
+import numpy as np
+from utils.parallel_utils.executor import get_executor
+from utils.parallel_utils.shared import sharedArrays
+
+CHUNK = 1<<16 # rows per write
+
+def write_ffm(out,ids,y=None,fields=None,chunk=CHUNK,workers=1):
+    """
+        Input:
+            ids: int array [n,k], 0 for a missing feature
+            y: labels [n], None for 0
+            fields: field of each column, None for the column index
+        writes lines "y field:id:1 ..." of the non zero ids
+    """
+    ids = np.asarray(ids)
+    if fields is None:
+        fields = np.arange(ids.shape[1])
+    prefix = np.array(["%d:"%i for i in fields])
+    _write(out,ids,y,prefix,':1',chunk,workers)
+
+def write_svm(out,ids,y=None,chunk=CHUNK,workers=1):
+    """
+        writes lines "y id:1 ..." of the non zero ids in increasing order,
+        the libsvm file ffm2svm makes of the libffm file of the same ids
+    """
+    ids = np.sort(np.asarray(ids),axis=1)
+    prefix = np.array(['']*ids.shape[1])
+    _write(out,ids,y,prefix,':1',chunk,workers)
+
+def _write(out,ids,y,prefix,suffix,chunk,workers):
+    n = ids.shape[0]
+    if y is None:
+        y = np.zeros(n,dtype=np.int64)
+    # integral float labels print as integers, decided once for the file
+    y = _label_values(np.asarray(y))
+    if workers <= 1 or n <= chunk:
+        _write_rows(out,ids,y,prefix,suffix,chunk)
+        return
+    step = (n+workers-1)//workers
+    parts = ["%s.part%d"%(out,i) for i in range(workers)]
+    # the rows are published once, every worker maps its shard of them
+    with sharedArrays() as shared:
+        shared.put('ids',ids)
+        shared.put('y',y)
+        jobs = [(shared,part,s,s+step,prefix,suffix,chunk) for part,s in zip(parts,range(0,n,step))]
+        get_executor(workers).map(_write_shard,jobs,chunksize=1,star=True)
+    with open(out,'wb') as fo:
+        for part in parts:
+            if os.path.exists(part):
+                with open(part,'rb') as f:
+                    shutil.copyfileobj(f,fo,1<<24)
+                os.remove(part)
+
+def _write_shard(shared,out,s,e,prefix,suffix,chunk):
+    _write_rows(out,shared['ids'][s:e],shared['y'][s:e],prefix,suffix,chunk)
+
+def _write_rows(out,ids,y,prefix,suffix,chunk):
+    with open(out,'wb') as fo:
+        for s in range(0,ids.shape[0],chunk):
+            fo.write(_lines(ids[s:s+chunk],y[s:s+chunk],prefix,suffix))
+
+def _lines(ids,y,prefix,suffix):
+    """
+        the bytes of the lines of a chunk: label, then " "+prefix+id+suffix
+        for every non zero id, then a newline. Every byte is scattered into
+        one preallocated buffer, a pass per character position.
+    """
+    n,k = ids.shape
+    ids = ids.astype(np.int64)
+    pre = [(' '+i).encode() for i in prefix]
+    suf = np.frombuffer(suffix.encode(),dtype=np.uint8)
+    plen = np.array([len(i) for i in pre],dtype=np.int64)
+    nd = _ndigits(ids)
+    lens = np.where(ids>0,plen+nd+len(suf),0)
+    labs,inv = np.unique(y.astype(str),return_inverse=True)
+    labs = [i.encode() for i in labs.tolist()]
+    lablen = np.array([len(i) for i in labs],dtype=np.int64)[inv]
+    rowlen = lablen+lens.sum(axis=1)+1
+    ends = np.cumsum(rowlen)
+    starts = ends-rowlen
+    # one spare byte at the end takes the writes of masked out positions
+    size = int(ends[-1]) if n else 0
+    buf = np.empty(size+1,dtype=np.uint8)
+    for u,b in enumerate(labs):
+        rows = starts[inv==u]
+        for j,ch in enumerate(bytearray(b)):
+            buf[rows+j] = ch
+    buf[ends-1] = ord('\n')
+    # start of every token, flattened over the non zero ids
+    pos = (starts+lablen)[:,None]+np.cumsum(lens,axis=1)-lens
+    on = ids>0
+    # narrow dtypes halve the memory traffic of the passes below
+    itype = np.int32 if size < 1<<31 else np.int64
+    p,v,d = pos[on].astype(itype),ids[on],nd[on].astype(itype)
+    if v.shape[0] and v.max() < 1<<32:
+        v = v.astype(np.uint32)
+    col = np.nonzero(on)[1].astype(itype)
+    table = np.zeros([k,int(plen.max()) if k else 0],dtype=np.uint8)
+    for c,b in enumerate(pre):
+        table[c,:len(b)] = bytearray(b)
+    pl = plen.astype(itype)[col]
+    for j in range(table.shape[1]):
+        buf[np.where(pl>j,p+j,size)] = table[col,j]
+    p = p+pl
+    # digits from the right, the j-th one of numbers with more than j digits
+    last = p+d-1
+    for j in range(int(d.max()) if d.shape[0] else 0):
+        buf[np.where(d>j,last-j,size)] = 48+v%10
+        v = v//10
+    p = p+d
+    for j,ch in enumerate(suf):
+        buf[p+j] = ch
+    buf = buf[:size]
+    return buf.tobytes()
+
+def _ndigits(v):
+    # v >= 0
+    pow10 = 10**np.arange(1,19,dtype=np.int64)
+    return np.searchsorted(pow10,v,side='right')+1
+
+def _label_values(y):
+    if y.dtype.kind == 'f' and np.all(y==np.round(y)):
+        return y.astype(np.int64)
+    return y
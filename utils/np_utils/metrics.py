@@ -0,0 +1,196 @@
+"""
+vectorized metrics
+inputs are never modified. yp may be one prediction per row [n] or one
+column per model [n,m] (e.g. all bagged models), a metric then returns one
+score per column. Ranking metrics sort each column once.
+
+xgb_feval/lgb_feval wrap a metric into the feval callback of xgboost and
+lightgbm.
+"""
+import numpy as np
+
+EPS = 1e-5
+
+def _cols(yp):
+    # [n] -> [n,1], and whether to return a scalar
+    yp = np.asarray(yp)
+    return (yp[:,None],True) if yp.ndim == 1 else (yp,False)
+
+def _out(score,single):
+    return float(score[0]) if single else score
+
+def rank(yp):
+    """
+        1-based ranks of every column, ties get their average rank
+        (like scipy.stats.rankdata), with one argsort per column
+    """
+    P,single = _cols(yp)
+    n,m = P.shape
+    order = np.argsort(P,axis=0,kind='mergesort')
+    S = np.take_along_axis(P,order,axis=0)
+    # first and last sorted position of the run of ties of every position
+    new = np.ones([n,m],dtype=bool)
+    new[1:] = S[1:] != S[:-1]
+    pos = np.arange(n)[:,None]
+    first = np.maximum.accumulate(np.where(new,pos,0),axis=0)
+    end = np.ones([n,m],dtype=bool)
+    end[:-1] = new[1:]
+    last = np.flipud(np.minimum.accumulate(np.flipud(np.where(end,pos,n)),axis=0))
+    R = np.empty([n,m],dtype=np.float64)
+    np.put_along_axis(R,order,(first+last)/2.0+1,axis=0)
+    return R[:,0] if single else R
+
+def auc(y,yp):
+    """
+        area under the roc curve of binary y, Mann-Whitney on the ranks,
+        nan if y has only one class
+    """
+    R = rank(yp)
+    R,single = _cols(R)
+    pos = np.asarray(y)>0
+    npos = pos.sum()
+    nneg = pos.shape[0]-npos
+    if npos == 0 or nneg == 0:
+        return _out(np.full(R.shape[1],np.nan),single)
+    score = (R[pos].sum(axis=0)-npos*(npos+1)/2.0)/(npos*nneg)
+    return _out(score,single)
+
+def gini(y,yp):
+    """
+        gini of predictions yp against actual values y: rows sorted by yp
+        descending (ties in row order), cumulated share of y
+    """
+    P,single = _cols(yp)
+    y = np.asarray(y,dtype=np.float64)
+    n = y.shape[0]
+    order = np.argsort(-P,axis=0,kind='mergesort')
+    cum = np.cumsum(y[order],axis=0).sum(axis=0)/y.sum()
+    return _out((cum-(n+1)/2.0)/n,single)
+
+def gini_normalized(y,yp):
+    return gini(y,yp)/gini(y,y)
+
+def qwk(y,yp,min_rating=None,max_rating=None):
+    """
+        quadratic weighted kappa of integer ratings, yp [n] or [n,m]
+    """
+    P,single = _cols(yp)
+    y = np.asarray(y).astype(np.int64)
+    P = P.astype(np.int64)
+    lo = min(y.min(),P.min()) if min_rating is None else min_rating
+    hi = max(y.max(),P.max()) if max_rating is None else max_rating
+    k = int(hi-lo+1)
+    n = y.shape[0]
+    w = (np.arange(k)[:,None]-np.arange(k)[None,:])**2/float(max(k-1,1)**2)
+    hy = np.bincount(y-lo,minlength=k)
+    score = np.empty(P.shape[1])
+    for c in range(P.shape[1]):
+        p = P[:,c]-lo
+        conf = np.bincount((y-lo)*k+p,minlength=k*k).reshape(k,k)
+        hp = np.bincount(p,minlength=k)
+        expected = np.outer(hy,hp)/float(n)
+        score[c] = 1.0-(w*conf).sum()/(w*expected).sum()
+    return _out(score,single)
+
+def logloss(y,yp,eps=EPS):
+    P,single = _cols(yp)
+    y = np.asarray(y)[:,None]
+    P = np.clip(P,eps,1-eps)
+    return _out(np.mean(-y*np.log(P)-(1-y)*np.log(1-P),axis=0),single)
+
+def mlogloss(y,yp,eps=EPS):
+    """
+        multiclass logloss, yp [n,k] probabilities of the k classes
+        or [n,k,m] for m models
+    """
+    yp = np.asarray(yp)
+    y = np.asarray(y).astype(np.int64)
+    p = yp[np.arange(y.shape[0]),y]
+    score = np.mean(-np.log(np.clip(p,eps,1-eps)),axis=0)
+    return float(score) if yp.ndim == 2 else score
+
+def rmse(y,yp):
+    P,single = _cols(yp)
+    y = np.asarray(y)[:,None]
+    return _out(np.mean((y-P)**2,axis=0)**0.5,single)
+
+def rmsle(y,yp):
+    y = np.maximum(np.asarray(y),0)
+    return rmse(np.log1p(y),np.log1p(yp))
+
+def mae(y,yp):
+    P,single = _cols(yp)
+    y = np.asarray(y)[:,None]
+    return _out(np.mean(np.abs(y-P),axis=0),single)
+
+def acc(y,yp):
+    """
+        yp [n] probabilities of class 1, or [n,k] of k classes
+    """
+    yp = np.asarray(yp)
+    y = np.asarray(y)
+    assert y.shape[0] == yp.shape[0]
+    ypx = (yp>0.5).astype(int) if yp.ndim == 1 else np.argmax(yp,axis=1)
+    return float(np.mean(y==ypx))
+
+def group_auc(y,yp,groups):
+    """
+        auc of every group (e.g. user or query), nan for groups with one class
+        one lexsort by group and prediction for all groups
+        Return: unique groups, auc per group
+    """
+    uniq,g = np.unique(np.asarray(groups),return_inverse=True)
+    yp = np.asarray(yp)
+    pos = np.asarray(y)>0
+    order = np.lexsort((yp,g))
+    gs,ps,pos = g[order],yp[order],pos[order]
+    n = gs.shape[0]
+    idx = np.arange(n)
+    # rank within the group, ties averaged
+    gstart = np.r_[0,np.nonzero(np.diff(gs))[0]+1]
+    new = np.ones(n,dtype=bool)
+    new[1:] = (gs[1:] != gs[:-1]) | (ps[1:] != ps[:-1])
+    first = np.maximum.accumulate(np.where(new,idx,0))
+    end = np.r_[new[1:],True]
+    last = np.minimum.accumulate(np.where(end,idx,n)[::-1])[::-1]
+    r = (first+last)/2.0+1-gstart[gs]
+    k = len(uniq)
+    npos = np.bincount(gs,weights=pos,minlength=k)
+    cnt = np.bincount(gs,minlength=k)
+    nneg = cnt-npos
+    rsum = np.bincount(gs,weights=r*pos,minlength=k)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        score = (rsum-npos*(npos+1)/2.0)/(npos*nneg)
+    score[(npos==0)|(nneg==0)] = np.nan
+    return uniq,score
+
+METRICS = {'auc':(auc,True),'gini':(gini_normalized,True),'qwk':(qwk,True),
+    'logloss':(logloss,False),'mlogloss':(mlogloss,False),'rmse':(rmse,False),
+    'rmsle':(rmsle,False),'mae':(mae,False),'acc':(acc,True)}
+
+def _metric(metric):
+    if isinstance(metric,str):
+        return metric,METRICS[metric][0],METRICS[metric][1]
+    return metric.__name__,metric,None
+
+def xgb_feval(metric,transform=None):
+    """
+        feval of xgb.train, e.g. feval=xgb_feval('gini')
+        transform: applied to the raw predictions first, e.g. a sigmoid
+    """
+    name,func,_ = _metric(metric)
+    def _feval(preds,dtrain):
+        yp = preds if transform is None else transform(preds)
+        return name,func(dtrain.get_label(),yp)
+    return _feval
+
+def lgb_feval(metric,higher_better=None,transform=None):
+    """
+        feval of lgb.train, which also wants whether higher is better
+    """
+    name,func,hb = _metric(metric)
+    hb = hb if higher_better is None else higher_better
+    def _feval(preds,data):
+        yp = preds if transform is None else transform(preds)
+        return name,func(data.get_label(),yp),hb
+    return _feval
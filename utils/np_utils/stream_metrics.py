@@ -0,0 +1,146 @@
+"""
+mergeable metric accumulators for chunked predictions
+every accumulator keeps a few sums (or a histogram) instead of the arrays,
+update(y,yp) takes one chunk, merge(other) adds the state of an accumulator
+of another shard, score() gives the metric of everything seen so far. So
+evaluation runs alongside a chunked predict, or per shard in parallel, in
+constant memory.
+
+    acc = loglossAcc()
+    for chunk in pd.read_csv(pred_path,chunksize=1<<20):
+        acc.update(chunk['y'].values,chunk['p'].values)
+    print(acc.score())
+"""
+import numpy as np
+from utils.pypy_utils.utils import mapkAcc
+from utils.np_utils.metrics import EPS
+
+class metricAcc(object):
+
+    def update(self,y,yp):
+        raise NotImplementedError
+
+    def score(self):
+        raise NotImplementedError
+
+    def merge(self,other):
+        # every state is a sum, so shards merge by adding their state
+        assert type(self) is type(other)
+        for name in self._state:
+            setattr(self,name,getattr(self,name)+getattr(other,name))
+        return self
+
+    def __iadd__(self,other):
+        return self.merge(other)
+
+    _state = []
+
+class loglossAcc(metricAcc):
+    """
+    yp [n] probabilities of class 1, or [n,k] of k classes with int y
+    """
+    _state = ['total','n']
+
+    def __init__(self,eps=EPS):
+        self.eps = eps
+        self.total = 0.0
+        self.n = 0
+
+    def update(self,y,yp):
+        yp = np.asarray(yp)
+        y = np.asarray(y)
+        if yp.ndim == 1:
+            p = np.clip(yp,self.eps,1-self.eps)
+            self.total += float(np.sum(-y*np.log(p)-(1-y)*np.log(1-p)))
+        else:
+            p = yp[np.arange(y.shape[0]),y.astype(np.int64)]
+            self.total += float(np.sum(-np.log(np.clip(p,self.eps,1-self.eps))))
+        self.n += y.shape[0]
+        return self
+
+    def score(self):
+        return self.total/self.n if self.n else np.nan
+
+class accuracyAcc(metricAcc):
+    """
+    yp [n] probabilities of class 1 (cut at 0.5), or [n,k] of k classes
+    """
+    _state = ['correct','n']
+
+    def __init__(self):
+        self.correct = 0
+        self.n = 0
+
+    def update(self,y,yp):
+        yp = np.asarray(yp)
+        ypx = (yp>0.5).astype(int) if yp.ndim == 1 else np.argmax(yp,axis=1)
+        self.correct += int(np.sum(np.asarray(y)==ypx))
+        self.n += ypx.shape[0]
+        return self
+
+    def score(self):
+        return self.correct*1.0/self.n if self.n else np.nan
+
+class confusionAcc(metricAcc):
+    """
+    k x k confusion matrix of ratings lo..lo+k-1, rows are y
+    yp are ratings, or [n,k] class probabilities decoded by argmax
+    """
+    _state = ['conf']
+
+    def __init__(self,k,lo=0):
+        self.k = k
+        self.lo = lo
+        self.conf = np.zeros([k,k],dtype=np.int64)
+
+    def update(self,y,yp):
+        yp = np.asarray(yp)
+        p = np.argmax(yp,axis=1) if yp.ndim == 2 else yp.astype(np.int64)-self.lo
+        y = np.asarray(y).astype(np.int64)-self.lo
+        self.conf += np.bincount(y*self.k+p,minlength=self.k*self.k).reshape(self.k,self.k)
+        return self
+
+    def score(self):
+        # quadratic weighted kappa
+        k = self.k
+        n = self.conf.sum()
+        w = (np.arange(k)[:,None]-np.arange(k)[None,:])**2/float(max(k-1,1)**2)
+        expected = np.outer(self.conf.sum(axis=1),self.conf.sum(axis=0))/float(n)
+        return 1.0-(w*self.conf).sum()/(w*expected).sum()
+
+    def accuracy(self):
+        return np.trace(self.conf)*1.0/max(self.conf.sum(),1)
+
+class aucAcc(metricAcc):
+    """
+    approximate auc from histograms of the predictions of positives and
+    negatives on a fixed grid of bins over [lo,hi], ties within a bin
+    count half. The error is at most the share of pairs in a same bin.
+    """
+    _state = ['pos','neg']
+
+    def __init__(self,bins=1<<12,lo=0.0,hi=1.0):
+        self.bins = bins
+        self.lo,self.hi = lo,hi
+        self.pos = np.zeros(bins,dtype=np.int64)
+        self.neg = np.zeros(bins,dtype=np.int64)
+
+    def update(self,y,yp):
+        yp = np.asarray(yp,dtype=np.float64)
+        idx = ((yp-self.lo)*(self.bins/float(self.hi-self.lo))).astype(np.int64)
+        idx = np.clip(idx,0,self.bins-1)
+        pos = np.asarray(y)>0
+        self.pos += np.bincount(idx[pos],minlength=self.bins)
+        self.neg += np.bincount(idx[~pos],minlength=self.bins)
+        return self
+
+    def merge(self,other):
+        assert (self.bins,self.lo,self.hi) == (other.bins,other.lo,other.hi)
+        return super(aucAcc,self).merge(other)
+
+    def score(self):
+        npos,nneg = self.pos.sum(),self.neg.sum()
+        if npos == 0 or nneg == 0:
+            return np.nan
+        below = np.cumsum(self.neg)-self.neg
+        return float(np.sum(self.pos*(below+0.5*self.neg)))/(npos*nneg)
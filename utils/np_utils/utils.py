@@ -1,32 +1,23 @@
 import numpy as np
+from utils.np_utils import metrics
+# kept for the callers, see utils.np_utils.metrics
 def rmsle(y,yp):
-    y1 = y.copy()
-    y1[y1<0] = 0
-    return rmse(np.log1p(y1),np.log1p(yp))
+    return metrics.rmsle(y,yp)
 
 def rmse(y,yp):
-    return np.mean((y-yp)**2)**0.5
+    return metrics.rmse(y,yp)
 
 def mae(y,yp):
-    return np.mean(np.abs(y-yp))
+    return metrics.mae(y,yp)
 
 def acc(y,yp):
-    assert y.shape[0] == yp.shape[0]
-    if len(yp.shape) == 1:
-        ypx = (yp>0.5).astype(int)
-    else:
-        ypx = np.argmax(yp,axis=1)
-    return y[y==ypx].shape[0]*1.0/y.shape[0]
+    return metrics.acc(y,yp)
 
 def logloss(y,yp):
-    yp[yp>0.99999] = 0.99999
-    yp[yp<1e-5] = 1e-5
-    return np.mean(-y*np.log(yp)-(1-y)*np.log(1-yp))
+    return metrics.logloss(y,yp)
 
 def cross_entropy(y,yp):
-    yp[yp>0.99999] = 0.99999
-    yp[yp<1e-5] = 1e-5
-    return np.mean(-np.log(yp[range(yp.shape[0]),y.astype(int)]))
+    return metrics.mlogloss(y,yp)
 
 def confusion_matrix(rater_a, rater_b, min_rating=None, max_rating=None):
     """
@@ -78,33 +69,7 @@ def quadratic_weighted_kappa(rater_a, rater_b, min_rating=None, max_rating=None)
     is the minimum possible rating, and max_rating is the maximum possible
     rating
     """
-    rater_a = np.array(rater_a, dtype=int)
-    rater_b = np.array(rater_b, dtype=int)
-    assert(len(rater_a) == len(rater_b))
-    if min_rating is None:
-        min_rating = min(min(rater_a), min(rater_b))
-    if max_rating is None:
-        max_rating = max(max(rater_a), max(rater_b))
-    conf_mat = confusion_matrix(rater_a, rater_b,
-                                min_rating, max_rating)
-    num_ratings = len(conf_mat)
-    num_scored_items = float(len(rater_a))
-
-    hist_rater_a = histogram(rater_a, min_rating, max_rating)
-    hist_rater_b = histogram(rater_b, min_rating, max_rating)
-
-    numerator = 0.0
-    denominator = 0.0
-
-    for i in range(num_ratings):
-        for j in range(num_ratings):
-            expected_count = (hist_rater_a[i] * hist_rater_b[j]
-                              / num_scored_items)
-            d = pow(i - j, 2.0) / pow(num_ratings - 1, 2.0)
-            numerator += d * conf_mat[i][j] / num_scored_items
-            denominator += d * expected_count / num_scored_items
-
-    return 1.0 - numerator / denominator
+    return metrics.qwk(rater_a, rater_b, min_rating, max_rating)
 
 def softmax(score):
     score = np.asarray(score, dtype=float)
@@ -0,0 +1,69 @@
+"""
+numba kernels against their numpy fallback, every kernel is checked to
+give the same result and timed after a warm up call (the compilation)
+
+    python -m utils.numba_utils.bench_kernels [rows] [group size]
+"""
+import sys
+import time
+import numpy as np
+from utils.numba_utils import kernels
+
+def _time(func,repeat=3):
+    func()
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        res = func()
+        t = time.time()-start
+        best = t if best is None else min(best,t)
+    return res,best
+
+def _diff(a,b):
+    if isinstance(a,tuple):
+        return max(_diff(i,j) for i,j in zip(a,b))
+    a,b = np.asarray(a,dtype=np.float64),np.asarray(b,dtype=np.float64)
+    same = np.isnan(a)&np.isnan(b)
+    return float(np.max(np.where(same,0,np.abs(a-b)),initial=0))
+
+def cases(rows,size,seed=0):
+    rng = np.random.RandomState(seed)
+    G = rows//size
+    rows = G*size
+    offsets = np.arange(0,G*size+1,size)
+    scores = rng.rand(G*size)
+    y = (rng.rand(G*size)<0.3).astype(np.float64)
+    na = rng.randint(0,4,G)
+    aoff = np.r_[0,np.cumsum(na)]
+    actual = rng.randint(0,size,aoff[-1])
+    top = kernels.topk(scores,offsets,3,jit=False)%size
+    N = 8
+    P = rng.rand(rows,N)
+    P /= P.sum(axis=1)[:,None]
+    labels = rng.randint(0,N,rows)
+    ratings = rng.randint(0,N,rows)
+    margins = rng.randn(rows)
+    return [
+        ('topk',lambda jit: kernels.topk(scores,offsets,3,jit=jit)),
+        ('apk',lambda jit: kernels.apk(actual,aoff,top.ravel(),np.arange(0,top.size+1,3),3,jit=jit)),
+        ('auc',lambda jit: kernels.auc(y,scores,jit=jit)),
+        ('group_auc',lambda jit: kernels.group_auc(y,scores,offsets,jit=jit)),
+        ('gini',lambda jit: kernels.gini(y,scores,jit=jit)),
+        ('qwk',lambda jit: kernels.qwk(labels,ratings,0,N-1,jit=jit)),
+        ('logreg_grad_hess',lambda jit: kernels.logreg_grad_hess(margins,y,jit=jit)),
+        ('mae_grad_hess',lambda jit: kernels.mae_grad_hess(margins,y,2.0,jit=jit)),
+        ('softkappa_grad_hess',lambda jit: kernels.softkappa_grad_hess(P,labels,jit=jit)),
+    ]
+
+def main(rows=1000000,size=20):
+    print("%20s %10s %10s %8s %10s"%('kernel','numpy s','numba s','speedup','max diff'))
+    for name,func in cases(rows,size):
+        res0,t0 = _time(lambda: func(False))
+        if not kernels.HAS_NUMBA:
+            print("%20s %10.4f %10s %8s %10s"%(name,t0,'-','-','-'))
+            continue
+        res1,t1 = _time(lambda: func(True))
+        print("%20s %10.4f %10.4f %8.1f %10.2e"%(name,t0,t1,t0/max(t1,1e-9),_diff(res0,res1)))
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:3]])
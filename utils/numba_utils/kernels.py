@@ -0,0 +1,376 @@
+"""
+compiled kernels of grouped ranking metrics and xgboost objectives
+with numba every kernel is compiled nopython, parallel over groups or rows,
+and cached on disk next to this file. Without numba the same functions run
+as vectorized numpy, jit=True/False forces one or the other.
+
+rankings are grouped by offsets: group g (a user, a query) owns the rows
+offsets[g]:offsets[g+1] of the flat arrays, e.g. offsets = np.r_[0,np.cumsum(sizes)]
+
+    top = topk(scores,offsets,3)
+    score = mapk(actual,actual_offsets,top.ravel(),np.arange(0,top.size+1,3),3)
+"""
+import numpy as np
+from utils.np_utils import metrics
+try:
+    import numba
+    prange = numba.prange
+except ImportError:
+    numba = None
+    prange = range
+
+HAS_NUMBA = numba is not None
+
+def kernel(func):
+    """
+        nopython, parallel and cached with numba, None without it
+    """
+    if numba is None:
+        return None
+    return numba.njit(parallel=True,cache=True)(func)
+
+def _jit(jit):
+    if jit is None:
+        return HAS_NUMBA
+    assert HAS_NUMBA or not jit,"numba is not installed"
+    return jit
+
+def _offsets(offsets):
+    return np.asarray(offsets,dtype=np.int64)
+
+def topk(scores,offsets,k,jit=None):
+    """
+        Input:
+            scores: [n] scores of the items of all groups
+            offsets: [G+1] group bounds
+        Return: [G,k] int64 rows of the k best scores of every group,
+            best first, ties in row order, -1 past the end of small groups
+    """
+    scores = np.asarray(scores,dtype=np.float64)
+    offsets = _offsets(offsets)
+    if _jit(jit):
+        return _nb_topk(scores,offsets,k)
+    G = offsets.shape[0]-1
+    sizes = np.diff(offsets)
+    g = np.repeat(np.arange(G),sizes)
+    # lexsort is stable: by group, then score descending, then row
+    order = np.lexsort((-scores,g))
+    pos = np.arange(order.shape[0])-offsets[g[order]]
+    keep = pos<k
+    out = np.full([G,k],-1,dtype=np.int64)
+    out[g[order][keep],pos[keep]] = order[keep]
+    return out
+
+def _nb_topk_(scores,offsets,k):
+    G = offsets.shape[0]-1
+    out = np.full((G,k),-1,dtype=np.int64)
+    for g in prange(G):
+        s,e = offsets[g],offsets[g+1]
+        order = np.argsort(-scores[s:e],kind='mergesort')
+        for i in range(min(k,e-s)):
+            out[g,i] = order[i]+s
+    return out
+
+def apk(actual,actual_offsets,predicted,pred_offsets,k=3,jit=None):
+    """
+        average precision at k of every group, like pypy_utils.utils.apk
+        Input:
+            actual: [na] relevant ids of all groups, grouped by actual_offsets
+            predicted: [np] ranked ids of all groups, grouped by pred_offsets,
+                only the first k of a group count, -1 is never a hit
+        Return: [G] float64, 0 for groups without relevant ids
+    """
+    actual = np.asarray(actual,dtype=np.int64)
+    predicted = np.asarray(predicted,dtype=np.int64)
+    aoff,poff = _offsets(actual_offsets),_offsets(pred_offsets)
+    if _jit(jit):
+        return _nb_apk(actual,aoff,predicted,poff,k)
+    G = aoff.shape[0]-1
+    na = np.diff(aoff)
+    # the first k predictions of every group as a [G,k] table
+    pos = np.arange(predicted.shape[0])-np.repeat(poff[:-1],np.diff(poff))
+    gp = np.repeat(np.arange(G),np.diff(poff))
+    keep = pos<k
+    P = np.full([G,k],-1,dtype=np.int64)
+    P[gp[keep],pos[keep]] = predicted[keep]
+    # (group,id) pairs as one key, ids factorized over both sides
+    uniq,codes = np.unique(np.concatenate([actual,P.ravel()]),return_inverse=True)
+    m = uniq.shape[0]
+    akey = np.repeat(np.arange(G),na)*m+codes[:actual.shape[0]]
+    pkey = (np.arange(G)[:,None]*m+codes[actual.shape[0]:].reshape(G,k)).ravel()
+    hit = np.isin(pkey,akey)&(P.ravel()>=0)
+    # a repeated prediction only counts at its first position
+    first = np.zeros(G*k,dtype=bool)
+    first[np.unique(pkey,return_index=True)[1]] = True
+    hit = (hit&first).reshape(G,k)
+    hits = np.cumsum(hit,axis=1)
+    score = (hit*hits/np.arange(1.0,k+1)).sum(axis=1)
+    return np.where(na>0,score/np.maximum(np.minimum(na,k),1),0.0)
+
+def _nb_apk_(actual,aoff,predicted,poff,k):
+    G = aoff.shape[0]-1
+    out = np.zeros(G)
+    for g in prange(G):
+        a0,a1 = aoff[g],aoff[g+1]
+        if a1 == a0:
+            continue
+        p0 = poff[g]
+        p1 = min(poff[g+1],p0+k)
+        score = 0.0
+        hits = 0.0
+        for i in range(p0,p1):
+            p = predicted[i]
+            if p < 0:
+                continue
+            seen = False
+            for j in range(p0,i):
+                if predicted[j] == p:
+                    seen = True
+                    break
+            if seen:
+                continue
+            for j in range(a0,a1):
+                if actual[j] == p:
+                    hits += 1.0
+                    score += hits/(i-p0+1.0)
+                    break
+        out[g] = score/min(a1-a0,k)
+    return out
+
+def mapk(actual,actual_offsets,predicted,pred_offsets,k=3,jit=None):
+    return float(np.mean(apk(actual,actual_offsets,predicted,pred_offsets,k,jit)))
+
+def auc(y,yp,jit=None):
+    """
+        area under the roc curve of binary y, ties get their average rank
+    """
+    y = np.asarray(y,dtype=np.float64)
+    yp = np.asarray(yp,dtype=np.float64)
+    if _jit(jit):
+        return _nb_auc(y,yp,np.array([0,y.shape[0]],dtype=np.int64))[0]
+    return metrics.auc(y,yp)
+
+def group_auc(y,yp,offsets,jit=None):
+    """
+        auc of every group, nan for groups with one class
+    """
+    y = np.asarray(y,dtype=np.float64)
+    yp = np.asarray(yp,dtype=np.float64)
+    offsets = _offsets(offsets)
+    if _jit(jit):
+        return _nb_auc(y,yp,offsets)
+    G = offsets.shape[0]-1
+    out = np.full(G,np.nan)
+    if y.shape[0]:
+        uniq,score = metrics.group_auc(y,yp,np.repeat(np.arange(G),np.diff(offsets)))
+        out[uniq] = score
+    return out
+
+def _nb_auc_(y,yp,offsets):
+    G = offsets.shape[0]-1
+    out = np.full(G,np.nan)
+    for g in prange(G):
+        s,e = offsets[g],offsets[g+1]
+        p = yp[s:e]
+        order = np.argsort(p,kind='mergesort')
+        npos = 0.0
+        rsum = 0.0
+        i = 0
+        n = e-s
+        while i < n:
+            # a run of ties i..j shares the average rank
+            j = i
+            while j+1 < n and p[order[j+1]] == p[order[i]]:
+                j += 1
+            pos = 0.0
+            for t in range(i,j+1):
+                if y[s+order[t]] > 0:
+                    pos += 1.0
+            rsum += pos*((i+j)/2.0+1)
+            npos += pos
+            i = j+1
+        nneg = n-npos
+        if npos > 0 and nneg > 0:
+            out[g] = (rsum-npos*(npos+1)/2.0)/(npos*nneg)
+    return out
+
+def gini(y,yp,jit=None):
+    """
+        gini of yp against actual values y, same as metrics.gini
+    """
+    y = np.asarray(y,dtype=np.float64)
+    yp = np.asarray(yp,dtype=np.float64)
+    if _jit(jit):
+        return _nb_gini(y,yp)
+    return metrics.gini(y,yp)
+
+def _nb_gini_(y,yp):
+    n = y.shape[0]
+    order = np.argsort(-yp,kind='mergesort')
+    cum = 0.0
+    total = 0.0
+    for i in range(n):
+        cum += y[order[i]]
+        total += cum
+    return (total/cum-(n+1)/2.0)/n
+
+def gini_normalized(y,yp,jit=None):
+    return gini(y,yp,jit)/gini(y,y,jit)
+
+def qwk(y,yp,lo=None,hi=None,jit=None):
+    """
+        quadratic weighted kappa of integer ratings in [lo,hi]
+    """
+    y = np.asarray(y).astype(np.int64)
+    yp = np.asarray(yp).astype(np.int64)
+    lo = min(y.min(),yp.min()) if lo is None else lo
+    hi = max(y.max(),yp.max()) if hi is None else hi
+    if _jit(jit):
+        return _nb_qwk(y,yp,int(lo),int(hi))
+    return metrics.qwk(y,yp,lo,hi)
+
+def _nb_qwk_(y,yp,lo,hi):
+    k = hi-lo+1
+    n = y.shape[0]
+    norm = float(max(k-1,1)**2)
+    hy = np.zeros(k)
+    hp = np.zeros(k)
+    o = 0.0
+    for m in range(n):
+        i = y[m]-lo
+        j = yp[m]-lo
+        hy[i] += 1
+        hp[j] += 1
+        o += (i-j)*(i-j)/norm
+    e = 0.0
+    for i in prange(k):
+        for j in range(k):
+            e += hy[i]*hp[j]*(i-j)*(i-j)/norm
+    return 1.0-o/(e/n)
+
+def logreg_grad_hess(preds,y,jit=None):
+    """
+        gradient and hessian of the logloss of margins preds
+    """
+    preds = np.asarray(preds,dtype=np.float64)
+    y = np.asarray(y,dtype=np.float64)
+    if _jit(jit):
+        return _nb_logreg(preds,y)
+    yp = 1.0/(1.0+np.exp(-preds))
+    return yp-y,yp*(1.0-yp)
+
+def _nb_logreg_(preds,y):
+    n = preds.shape[0]
+    grad = np.empty(n)
+    hess = np.empty(n)
+    for i in prange(n):
+        p = 1.0/(1.0+np.exp(-preds[i]))
+        grad[i] = p-y[i]
+        hess[i] = p*(1.0-p)
+    return grad,hess
+
+def mae_grad_hess(preds,y,c=2.0,jit=None):
+    """
+        gradient and hessian of the fair loss, a smooth mae
+    """
+    preds = np.asarray(preds,dtype=np.float64)
+    y = np.asarray(y,dtype=np.float64)
+    if _jit(jit):
+        return _nb_mae(preds,y,c)
+    x = preds-y
+    return c*x/(np.abs(x)+c),c**2/(np.abs(x)+c)**2
+
+def _nb_mae_(preds,y,c):
+    n = preds.shape[0]
+    grad = np.empty(n)
+    hess = np.empty(n)
+    for i in prange(n):
+        x = preds[i]-y[i]
+        d = abs(x)+c
+        grad[i] = c*x/d
+        hess[i] = c*c/(d*d)
+    return grad,hess
+
+def softkappa_grad_hess(P,labels,jit=None):
+    """
+        gradient and hessian of the soft kappa O/E of softmax probabilities
+        P [M,N] in the margins, before the hessian is rescaled.
+        with W[i,j] = (i-j)^2, A[m] = W[label_m] and c = W.hist_label
+            O = sum(A*P), E = hist_label.W.hist_pred
+            dO/dy_mn = P_mn*(A_mn - sum_j A_mj*P_mj)
+            dE/dy_mn = P_mn*(c_n - sum_k c_k*P_mk)
+        the second derivatives are the first ones times (1-2*P_mn),
+        so it is O(M*N)
+        Input:
+            labels: [M] int classes in [0,N)
+        Return: grad,hess [M,N]
+    """
+    P = np.ascontiguousarray(P,dtype=np.float64)
+    labels = np.asarray(labels,dtype=np.int64)
+    if _jit(jit):
+        return _nb_softkappa(P,labels)
+    M,N = P.shape
+    cls = np.arange(N,dtype=float)
+    W = (cls[:,None]-cls[None,:])**2
+    A = W[labels]
+    AP = np.einsum('mj,mj->m',A,P)
+    O = AP.sum()
+    hist_label = np.bincount(labels,minlength=N)[:N].astype(float)
+    c = W.dot(hist_label)
+    E = c.dot(P.sum(axis=0))
+    dO = P*(A-AP[:,None])
+    dE = P*(c[None,:]-P.dot(c)[:,None])
+    d1 = dO*E-O*dE
+    grad = M*d1/(E**2)
+    hess = M*((1-2.*P)*d1*(E**2)-d1*2.*E*dE)/(E**4)
+    return grad,hess
+
+def _nb_softkappa_(P,labels):
+    M,N = P.shape
+    hist_label = np.zeros(N)
+    for m in range(M):
+        hist_label[labels[m]] += 1
+    c = np.zeros(N)
+    for k in range(N):
+        for l in range(N):
+            c[k] += (k-l)*(k-l)*hist_label[l]
+    E = 0.0
+    for n in prange(N):
+        s = 0.0
+        for m in range(M):
+            s += P[m,n]
+        E += c[n]*s
+    AP = np.empty(M)
+    Pc = np.empty(M)
+    O = 0.0
+    for m in prange(M):
+        a = 0.0
+        b = 0.0
+        for j in range(N):
+            d = labels[m]-j
+            a += d*d*P[m,j]
+            b += c[j]*P[m,j]
+        AP[m] = a
+        Pc[m] = b
+        O += a
+    grad = np.empty((M,N))
+    hess = np.empty((M,N))
+    for m in prange(M):
+        for n in range(N):
+            p = P[m,n]
+            d = labels[m]-n
+            dO = p*(d*d-AP[m])
+            dE = p*(c[n]-Pc[m])
+            d1 = dO*E-O*dE
+            grad[m,n] = M*d1/(E*E)
+            hess[m,n] = M*((1-2.*p)*d1*E*E-d1*2.*E*dE)/(E**4)
+    return grad,hess
+
+_nb_topk = kernel(_nb_topk_)
+_nb_apk = kernel(_nb_apk_)
+_nb_auc = kernel(_nb_auc_)
+_nb_gini = kernel(_nb_gini_)
+_nb_qwk = kernel(_nb_qwk_)
+_nb_logreg = kernel(_nb_logreg_)
+_nb_mae = kernel(_nb_mae_)
+_nb_softkappa = kernel(_nb_softkappa_)
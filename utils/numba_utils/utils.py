@@ -1,47 +1,10 @@
 import numpy as np
-from numba import jit 
+from utils.numba_utils import kernels
 
-@jit
 def qwk(a1, a2, max_rat):
     assert(len(a1) == len(a2))
-    a1 = np.asarray(a1, dtype=int)
-    a2 = np.asarray(a2, dtype=int)
+    return kernels.qwk(a1, a2, 0, max_rat)
 
-    w = np.zeros((max_rat + 1, max_rat + 1))
-    for i in range(max_rat + 1):
-        for j in range(max_rat + 1):
-            w[i, j] = (i - j) * (i - j)/ (max_rat * max_rat)
-
-    hist1 = np.zeros((max_rat + 1, ))
-    hist2 = np.zeros((max_rat + 1, ))
-
-    o = 0
-    for i, j in zip(a1, a2):
-        hist1[i] += 1
-        hist2[j] += 1
-        o +=  w[i, j]
-
-    e = 0
-    for i in range(max_rat + 1):
-        for j in range(max_rat + 1):
-            e += hist1[i] * hist2[j] * w[i, j]
-
-    e = e / a1.shape[0]
-
-    return 1 - o / e
-
-@jit
 def eval_gini(y_true, y_prob):
-    y_true = np.asarray(y_true)
-    y_true = y_true[np.argsort(y_prob)]
-    ntrue = 0
-    gini = 0
-    delta = 0
-    n = len(y_true)
-    for i in range(n-1, -1, -1):
-        y_i = y_true[i]
-        ntrue += y_i
-        gini += y_i * delta
-        delta += 1 - y_i
-    gini = 1 - 2 * gini / (ntrue * (n - ntrue))
-    return gini
+    # 1-2*(pairs ranked wrong)/(pairs) of binary y_true, i.e. 2*auc-1
+    return 2*kernels.auc(y_true, y_prob)-1
@@ -0,0 +1,261 @@
+"""
+persistent process or thread pool
+one pool per (mode,workers,mem_mb) is created on first use and reused by
+every later call until close() or exit. Results stream back in order (imap)
+or as they finish (as_completed); an exception in a worker is raised in the
+caller as TaskError with the index and the item that failed, and the pool
+is dropped so no orphan work keeps running. A worker process that dies
+(killed for memory, a segfault, os._exit) is noticed while waiting for
+results and raised as TaskError of the first item not done.
+only multiprocessing is used, the pypy2 scripts can use it too.
+
+    ex = get_executor(8)
+    res = ex.map(func,items,progress=progressReport())
+    for i,res in ex.as_completed(func,items):
+        ...
+func must be a module level function in process mode, star=True calls
+func(*item) for items that are argument tuples.
+"""
+import sys
+import time
+import atexit
+import threading
+import traceback
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+CHUNKS_PER_WORKER = 4 # chunks handed to every worker when the length is known
+MAX_CHUNK = 1<<12
+POLL = 0.5 # seconds between checks for dead workers while waiting
+
+class TaskError(Exception):
+    """
+    a worker failed on items[index], tb is the formatted worker traceback
+    """
+    def __init__(self,index,item,tb):
+        Exception.__init__(self,"item %d %s failed in a worker:\n%s"%(index,item,tb))
+        self.index = index
+        self.item = item
+        self.tb = tb
+
+class _task(object):
+    # runs func on a chunk of (index,item) in the worker, stops at the
+    # first exception and returns it with the results before it
+    def __init__(self,func,star):
+        self.func = func
+        self.star = star
+
+    def __call__(self,chunk):
+        out = []
+        for i,item in chunk:
+            try:
+                res = self.func(*item) if self.star else self.func(item)
+                out.append((i,True,res))
+            except Exception:
+                out.append((i,False,(_short(item),traceback.format_exc())))
+                break
+        return out
+
+class _pending(object):
+    # chunks of (index,item) handed to the pool, and the items not returned yet
+    def __init__(self,items,chunksize):
+        self.items = items
+        self.chunksize = chunksize
+        self.todo = {}
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        chunk = []
+        for i,item in enumerate(self.items):
+            with self.lock:
+                self.todo[i] = item
+            chunk.append((i,item))
+            if len(chunk) == self.chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def done(self,i):
+        with self.lock:
+            self.todo.pop(i,None)
+
+    def first(self):
+        with self.lock:
+            if not self.todo:
+                return -1,None
+            i = min(self.todo)
+            return i,self.todo[i]
+
+def _short(item,width=200):
+    s = repr(item)
+    return s if len(s) <= width else s[:width]+'...'
+
+def _limit_memory(mem_mb):
+    # address space cap of a worker, going past it raises MemoryError there
+    import resource
+    cap = int(mem_mb)<<20
+    soft,hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        cap = min(cap,hard)
+    resource.setrlimit(resource.RLIMIT_AS,(cap,hard))
+
+class progressReport(object):
+    """
+    progress callback, prints done/total, elapsed and eta at most every
+    interval seconds and once at the end
+    """
+    def __init__(self,tag="",interval=1.0):
+        self.tag = tag
+        self.interval = interval
+        self.last = 0
+
+    def __call__(self,done,total,start):
+        now = time.time()
+        if now-self.last < self.interval and done != total:
+            return
+        self.last = now
+        elapsed = now-start
+        tag = self.tag+' ' if self.tag else ''
+        msg = "\r{}--- Completed {:,}".format(tag,done)
+        if total:
+            eta = elapsed*(total-done)/max(done,1)
+            msg += " out of {:,}, {:.0f}s elapsed, eta {:.0f}s".format(total,elapsed,eta)
+        else:
+            msg += ", {:.0f}s elapsed".format(elapsed)
+        sys.stdout.write(msg)
+        if done == total:
+            sys.stdout.write("\n")
+        sys.stdout.flush()
+
+class Executor(object):
+
+    def __init__(self,workers=None,mode='process',mem_mb=None,maxtasksperchild=None):
+        """
+            workers: None for the number of cores
+            mode: 'process' for cpu bound jobs, 'thread' for io bound ones
+            mem_mb: memory cap of every worker process, not for threads
+            maxtasksperchild: chunks before a worker is replaced, for leaky jobs
+        """
+        assert mode in ['process','thread'],"mode must be process or thread"
+        self.workers = workers or multiprocessing.cpu_count()
+        self.mode = mode
+        self.mem_mb = mem_mb
+        self.maxtasksperchild = maxtasksperchild
+        self.pool = None
+
+    def _pool(self):
+        if self.pool is None:
+            if self.mode == 'thread':
+                self.pool = ThreadPool(self.workers)
+            else:
+                init,args = (_limit_memory,(self.mem_mb,)) if self.mem_mb else (None,())
+                self.pool = multiprocessing.Pool(self.workers,init,args,self.maxtasksperchild)
+        return self.pool
+
+    def chunksize(self,n):
+        """
+            about CHUNKS_PER_WORKER chunks per worker, small enough to
+            balance uneven items and big enough to amortize the pickling
+        """
+        if n is None:
+            return 1
+        size = -(-n//(self.workers*CHUNKS_PER_WORKER))
+        return max(1,min(size,MAX_CHUNK))
+
+    def _run(self,func,items,ordered,chunksize,progress,star):
+        try:
+            total = len(items)
+        except TypeError:
+            total = None
+        if chunksize is None:
+            chunksize = self.chunksize(total)
+        pool = self._pool()
+        run = pool.imap if ordered else pool.imap_unordered
+        # the chunks are made here, the pool gets one at a time: only its
+        # iterator of single tasks can be waited on with a timeout
+        pending = _pending(items,chunksize)
+        workers = {}
+        self._dead(workers)
+        it = run(_task(func,star),pending,1)
+        start = time.time()
+        done = 0
+        while True:
+            try:
+                chunk = it.next(POLL)
+            except StopIteration:
+                break
+            except multiprocessing.TimeoutError:
+                # the pool replaces a dead worker, its chunk never returns
+                dead = self._dead(workers)
+                if dead is not None:
+                    self.close(terminate=True)
+                    i,item = pending.first()
+                    raise TaskError(i,_short(item),"worker %d exited with code %d\n"%(dead.pid,dead.exitcode))
+                continue
+            self._dead(workers)
+            for i,ok,res in chunk:
+                pending.done(i)
+                if not ok:
+                    self.close(terminate=True)
+                    raise TaskError(i,res[0],res[1])
+                done += 1
+                if progress is not None:
+                    progress(done,total,start)
+                yield i,res
+
+    def _dead(self,workers):
+        # a worker of this run that exited with an error code, or None.
+        # workers are recorded before any task is sent and at every result
+        # so one is still known after the pool has replaced it
+        if self.mode != 'process' or self.pool is None:
+            return None
+        for p in list(self.pool._pool):
+            workers[p.pid] = p
+        for p in workers.values():
+            if p.exitcode not in (None,0):
+                return p
+        return None
+
+    def imap(self,func,items,chunksize=None,progress=None,star=False):
+        """
+            results in the order of items, streamed as they are ready
+        """
+        for _,res in self._run(func,items,True,chunksize,progress,star):
+            yield res
+
+    def as_completed(self,func,items,chunksize=None,progress=None,star=False):
+        """
+            (index,result) pairs in the order the workers finish them
+        """
+        return self._run(func,items,False,chunksize,progress,star)
+
+    def map(self,func,items,chunksize=None,progress=None,star=False):
+        return list(self.imap(func,items,chunksize,progress,star))
+
+    def close(self,terminate=False):
+        if self.pool is None:
+            return
+        if terminate:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+        self.pool = None
+
+_EXECUTORS = {}
+
+def get_executor(workers=None,mode='process',mem_mb=None,maxtasksperchild=None):
+    """
+        the shared Executor of these settings, its pool is kept between calls
+    """
+    key = (workers,mode,mem_mb,maxtasksperchild)
+    if key not in _EXECUTORS:
+        _EXECUTORS[key] = Executor(workers,mode,mem_mb,maxtasksperchild)
+    return _EXECUTORS[key]
+
+def close_all():
+    for ex in _EXECUTORS.values():
+        ex.close()
+
+atexit.register(close_all)
@@ -0,0 +1,166 @@
+"""
+shared memory transport of numpy arrays to worker processes
+the parent publishes every array once into a named shared memory segment,
+workers get the registry (only names, dtypes and shapes are pickled) and
+attach to zero-copy read-only views by name. Lookup tables (dicts like h2c
+or a vocabulary) are published as sorted key and value arrays.
+
+    with sharedArrays() as shared:
+        shared.put('ids',ids)
+        shared.put_table('h2c',h2c)
+        get_executor(8).map(work,[(shared,s) for s in starts],star=True)
+
+    def work(shared,s):
+        ids = shared['ids'][s:s+step]
+        lat_lon,found = shared.table('h2c').lookup(hashes)
+
+only the publishing registry owns the segments: they are unlinked by
+close(), at the end of a with block, when the registry is garbage collected
+or at exit. A worker that crashes only loses its mapping. If the parent
+itself is killed, the multiprocessing resource tracker unlinks what is left.
+"""
+import os
+import weakref
+import numpy as np
+from multiprocessing import shared_memory
+
+SHM_DIR = '/dev/shm'
+_ATTACHED = {} # segment name -> (SharedMemory,view), per process
+
+class sharedArrays(object):
+
+    def __init__(self):
+        self.specs = {} # name -> {shm,dtype,shape}
+        self._owned = {}
+        self._finalizer = weakref.finalize(self,_release,self._owned,os.getpid())
+
+    def put(self,name,arr):
+        """
+            copy arr into a new segment once
+            Return: the read-only shared view
+        """
+        assert name not in self.specs,"%s is already published"%name
+        arr = np.ascontiguousarray(arr)
+        assert arr.dtype.kind != 'O',"object arrays can not be shared, %s"%name
+        shm = shared_memory.SharedMemory(create=True,size=max(arr.nbytes,1))
+        self._owned[shm.name] = shm
+        view = np.ndarray(arr.shape,dtype=arr.dtype,buffer=shm.buf)
+        view[...] = arr
+        view.flags.writeable = False
+        self.specs[name] = {"shm":shm.name,"dtype":arr.dtype.str,"shape":arr.shape}
+        _ATTACHED[shm.name] = (shm,view)
+        return view
+
+    def put_table(self,name,dic):
+        """
+            publish a dict as arrays name.keys (sorted) and name.values,
+            str keys become fixed width unicode
+        """
+        keys = sorted(dic)
+        self.put(name+'.keys',np.array(keys))
+        self.put(name+'.values',np.array([dic[k] for k in keys]))
+        return self.table(name)
+
+    def __getitem__(self,name):
+        return attach(self.specs[name])
+
+    def __contains__(self,name):
+        return name in self.specs
+
+    def table(self,name):
+        return sharedTable(self[name+'.keys'],self[name+'.values'])
+
+    def close(self):
+        for spec in self.specs.values():
+            _ATTACHED.pop(spec['shm'],None)
+        self.specs = {}
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        self.close()
+
+    def __getstate__(self):
+        # workers only get the names, they never own the segments
+        return {"specs":self.specs}
+
+    def __setstate__(self,state):
+        self.specs = state['specs']
+        self._owned = {}
+        self._finalizer = weakref.finalize(self,_release,self._owned,None)
+
+class sharedTable(object):
+    """
+    read-only dict of sorted key and value arrays, looked up with searchsorted
+    """
+    def __init__(self,keys,values):
+        self.keys = keys
+        self.values = values
+
+    def __len__(self):
+        return self.keys.shape[0]
+
+    def lookup(self,keys):
+        """
+            Return: values of keys (unspecified where not found), found mask
+        """
+        keys = np.asarray(keys)
+        n = self.keys.shape[0]
+        if n == 0 or (keys.dtype.kind in 'US') != (self.keys.dtype.kind in 'US'):
+            # strings never match numbers
+            return np.zeros(keys.shape,dtype=self.values.dtype),np.zeros(keys.shape,dtype=bool)
+        # searched in the key dtype, which may truncate a query ('abc' as 'ab',
+        # 5.7 as 5); the match is then checked on the query as it was given
+        with np.errstate(invalid='ignore',over='ignore'):
+            q = keys.astype(self.keys.dtype)
+        idx = np.minimum(np.searchsorted(self.keys,q),n-1)
+        found = self.keys[idx] == keys
+        return self.values[idx],found
+
+    def get(self,key,default=None):
+        vals,found = self.lookup([key])
+        return vals[0] if found[0] else default
+
+def attach(spec):
+    """
+        read-only view of a published array, mapped once per process
+    """
+    name = spec['shm']
+    if name not in _ATTACHED:
+        _prune()
+        shm = shared_memory.SharedMemory(name=name)
+        view = np.ndarray(tuple(spec['shape']),dtype=np.dtype(spec['dtype']),buffer=shm.buf)
+        view.flags.writeable = False
+        _ATTACHED[name] = (shm,view)
+    return _ATTACHED[name][1]
+
+def _prune():
+    # a long lived worker drops the segments their publisher has unlinked
+    if not os.path.isdir(SHM_DIR):
+        return
+    for name in list(_ATTACHED):
+        if not os.path.exists(os.path.join(SHM_DIR,name)):
+            shm,_ = _ATTACHED.pop(name)
+            try:
+                shm.close()
+            except BufferError:
+                pass
+
+def _release(owned,pid):
+    # a forked worker inherits the registry, only the publisher unlinks
+    if pid != os.getpid():
+        return
+    for name,shm in list(owned.items()):
+        _ATTACHED.pop(name,None)
+        owned.pop(name,None)
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            shm.close()
+        except BufferError:
+            # views still held elsewhere keep the mapping until they go
+            pass
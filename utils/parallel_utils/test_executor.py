@@ -0,0 +1,71 @@
+"""
+checks of the shared executor, run from the root folder:
+
+    python -m pytest utils/parallel_utils/test_executor.py
+"""
+import os
+from utils.parallel_utils.executor import Executor,TaskError
+from utils.parallel_utils.utils import parallel_run
+
+def _square(x):
+    return x*x
+
+def _add(x,y):
+    return x+y
+
+def _fail_at_37(x):
+    if x == 37:
+        raise ValueError("bad item")
+    return x
+
+def _die_at_37(x):
+    if x == 37:
+        os._exit(1)
+    return x
+
+def test_many_items():
+    # more than CHUNKS_PER_WORKER*workers items, the pool gets chunks of them
+    ex = Executor(2)
+    try:
+        items = list(range(1000))
+        assert ex.chunksize(len(items)) > 1
+        assert ex.map(_square,items) == [i*i for i in items]
+        assert sorted(ex.as_completed(_square,items)) == [(i,i*i) for i in items]
+        assert ex.map(_square,iter(items),chunksize=7) == [i*i for i in items]
+        assert ex.map(_add,[(i,1) for i in items],star=True) == [i+1 for i in items]
+    finally:
+        ex.close()
+    assert parallel_run(abs,list(range(-100,0))) == list(range(100,0,-1))
+
+def test_exception():
+    ex = Executor(2)
+    try:
+        ex.map(_fail_at_37,range(200))
+        assert False,"no TaskError"
+    except TaskError as e:
+        assert e.index == 37 and "bad item" in e.tb
+    assert ex.pool is None
+    assert ex.map(_square,range(10)) == [i*i for i in range(10)]
+    ex.close()
+
+def test_dead_worker():
+    ex = Executor(2)
+    for ordered in [True,False]:
+        try:
+            if ordered:
+                ex.map(_die_at_37,range(200))
+            else:
+                list(ex.as_completed(_die_at_37,range(200)))
+            assert False,"no TaskError"
+        except TaskError as e:
+            assert "exited with code 1" in e.tb
+            assert e.index <= 37
+        assert ex.pool is None
+    ex.close()
+
+def test_threads():
+    ex = Executor(4,mode='thread')
+    try:
+        assert ex.map(_square,range(500)) == [i*i for i in range(500)]
+    finally:
+        ex.close()
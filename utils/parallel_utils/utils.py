@@ -1,27 +1,13 @@
-import time
-import numpy as np
-import os
-import random
-import multiprocessing
-import sys
+from utils.parallel_utils.executor import get_executor,progressReport
 
-def parallel_run(func,data):
-    p = multiprocessing.Pool()
-    results = p.imap(func, data)
-    num_tasks = len(data)
-    while (True):
-        completed = results._index
-        print("\r--- Completed {:,} out of {:,}".format(completed, num_tasks),end="")
-        sys.stdout.flush()
-        time.sleep(1)
-        if (completed == num_tasks):
-            break
-    p.close()
-    p.join()
-    return results
+def parallel_run(func,data,workers=None,chunksize=None):
+    """
+        func on every item of data in the shared process pool
+        Return: list of the results in the order of data
+    """
+    return get_executor(workers).map(func,data,chunksize=chunksize,progress=progressReport())
 
 def parallel_run1(func,data):
     # sequential sanity check
     for d in data:
         func(d)
-
@@ -0,0 +1,163 @@
+"""
+epoch based mini batch sampler
+the frame is converted once into contiguous typed arrays, every epoch walks
+a permutation of the rows (or a stratified / weighted draw) and a batch is a
+single gather of its row ids. A background thread keeps the next batches
+ready while the model trains on the current one.
+
+iterating a batchSampler yields (x, y, epoch), the contract of
+BaseModel._batch_gen, so a model can simply
+    def _batch_gen(self):
+        return batchSampler(df,xcols,ycols,batch_size=B,epochs=E)
+"""
+import threading
+import numpy as np
+try:
+    from queue import Queue,Full
+except ImportError:
+    from Queue import Queue,Full
+
+class batchSampler(object):
+
+    def __init__(self,x,xcols=None,ycols=None,y=None,batch_size=128,epochs=1,shuffle=True,
+        stratify=None,weights=None,drop_last=True,prefetch=4,seed=None,dtype=np.float32):
+        """
+            Input:
+                x: pd.DataFrame or np array of inputs
+                xcols,ycols: input and target columns if x is a frame,
+                    xcols None for all columns except ycols
+                y: np array of targets, instead of ycols
+                shuffle: False to walk the rows in order
+                stratify: class per row (array or column name), every
+                    batch then keeps the class ratios of the epoch
+                weights: sampling weight per row (array or column name),
+                    an epoch is then len(x) draws with replacement
+                drop_last: skip the last partial batch of an epoch
+                prefetch: batches prepared ahead by a thread, 0 for none
+                dtype: dtype of the arrays built from a frame, None to keep
+        """
+        if hasattr(x,'iloc'):
+            df = x
+            if isinstance(ycols,str):
+                ycols = [ycols]
+            if xcols is None:
+                xcols = [i for i in df.columns.values if ycols is None or i not in ycols]
+            x = to_array(df,xcols,dtype)
+            if ycols is not None:
+                y = to_array(df,ycols,dtype)
+            if isinstance(stratify,str):
+                stratify = df[stratify].values
+            if isinstance(weights,str):
+                weights = df[weights].values
+        self.x = x
+        self.y = y
+        self.n = x.shape[0]
+        self.batch_size = min(batch_size,self.n)
+        self.epochs = epochs
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.prefetch = prefetch
+        self.rng = np.random.RandomState(seed)
+        self.stratify = None
+        if stratify is not None:
+            self.stratify = np.unique(np.asarray(stratify),return_inverse=True)[1]
+        self.p = None
+        if weights is not None:
+            w = np.asarray(weights,dtype=np.float64)
+            self.p = w/w.sum()
+
+    def batches_per_epoch(self):
+        B = self.batch_size
+        return self.n//B if self.drop_last else (self.n+B-1)//B
+
+    def __len__(self):
+        return self.epochs*self.batches_per_epoch()
+
+    def __iter__(self):
+        if self.prefetch > 0:
+            return _prefetch(self._batches(),self.prefetch)
+        return self._batches()
+
+    def order(self):
+        """
+            row ids of one epoch
+        """
+        if self.p is not None:
+            return self.rng.choice(self.n,self.n,replace=True,p=self.p)
+        if not self.shuffle:
+            return np.arange(self.n)
+        if self.stratify is None:
+            return self.rng.permutation(self.n)
+        # spread every class evenly over the epoch: a row's key is its
+        # position in a shuffled class, scaled to [0,1) by the class size
+        cls = self.stratify
+        perm = self.rng.permutation(self.n)
+        cls_perm = cls[perm]
+        sort = np.argsort(cls_perm,kind='mergesort')
+        counts = np.bincount(cls)
+        starts = np.concatenate([[0],np.cumsum(counts)[:-1]])
+        rank = np.empty(self.n,dtype=np.float64)
+        rank[sort] = np.arange(self.n)-starts[cls_perm[sort]]
+        key = (rank+self.rng.uniform(size=self.n))/counts[cls_perm]
+        return perm[np.argsort(key,kind='mergesort')]
+
+    def _batches(self):
+        B = self.batch_size
+        nb = self.batches_per_epoch()
+        for epoch in range(self.epochs):
+            ids = self.order()
+            for b in range(nb):
+                idx = ids[b*B:(b+1)*B]
+                x = self.x.take(idx,axis=0)
+                y = self.y.take(idx,axis=0) if self.y is not None else None
+                yield x,y,epoch
+
+def to_array(df,cols,dtype=np.float32):
+    """
+        one contiguous [n,len(cols)] array, filled column by column so the
+        frame is not first copied into a float64 block
+    """
+    if dtype is None:
+        return np.ascontiguousarray(df[cols].values)
+    out = np.empty([df.shape[0],len(cols)],dtype=dtype)
+    for c,col in enumerate(cols):
+        out[:,c] = df[col].values
+    return out
+
+def _prefetch(gen,size):
+    queue = Queue(maxsize=size)
+    stop = threading.Event()
+    done = object()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                queue.put(item,timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _work():
+        try:
+            for item in gen:
+                if not _put(item):
+                    return
+            _put(done)
+        except Exception as e:
+            _put(e)
+
+    thread = threading.Thread(target=_work)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = queue.get()
+            if item is done:
+                break
+            if isinstance(item,Exception):
+                raise item
+            yield item
+    finally:
+        # the consumer may stop early, let the thread exit
+        stop.set()
@@ -0,0 +1,343 @@
+"""
+out-of-core queries over tables that do not fit in memory
+a chunkQuery is a lazy plan over a source (a columnar table written by
+col_store, a csv file or a data frame) that is read in fixed-size chunks.
+filter/project/map run chunk by chunk, groupby().agg() keeps partial
+aggregates and spills them to disk by key hash once they grow over the
+memory budget, join merges the two sides partition by partition.
+nothing is read until to_frame, to_table or chunks is called.
+
+    q = db.query('orders').filter("eval_set == 'prior'").project(['user_id','order_id'])
+    u2o = q.groupby('user_id').agg({'order_id':'list'}).to_frame()
+"""
+import os
+import shutil
+import pickle
+import tempfile
+import itertools
+import numpy as np
+import pandas as pd
+from utils.pd_utils.col_store import is_table,table_shape,load_table,tableWriter
+from utils.pd_utils.csv_probe import CHUNK
+
+BUDGET = 1<<30 # bytes of partial aggregates or join build side kept in memory
+PARTS = 16 # partitions of a spill
+
+# op -> partial aggregates of a chunk -> how partials are combined
+PARTIAL = {'sum':['sum'],'count':['count'],'size':['size'],'min':['min'],'max':['max'],
+    'first':['first'],'last':['last'],'list':['list'],'mean':['sum','count']}
+COMBINE = {'sum':'sum','count':'sum','size':'sum','min':'min','max':'max',
+    'first':'first','last':'last'}
+
+class chunkQuery(object):
+
+    def __init__(self,source,chunksize=CHUNK,budget=BUDGET,tmp=None,cols=None,steps=None):
+        """
+            Input:
+                source: path of a col_store table or a csv file, a data frame,
+                    or a function returning an iterator of chunks
+                chunksize: rows per chunk read from the source
+                budget: bytes kept in memory before spilling to disk
+                tmp: directory of spill files, None for the system default
+        """
+        self.source = source
+        self.chunksize = chunksize
+        self.budget = budget
+        self.tmp = tmp
+        self.cols = cols # columns read from the source, None for all
+        self.steps = steps or []
+
+    def _derive(self,source=None,cols=None,steps=None):
+        if source is None:
+            return chunkQuery(self.source,self.chunksize,self.budget,self.tmp,
+                cols if cols is not None else self.cols,steps if steps is not None else self.steps)
+        return chunkQuery(source,self.chunksize,self.budget,self.tmp)
+
+    def filter(self,cond):
+        """
+            cond: expression of df.query, or a function chunk -> boolean mask
+        """
+        if isinstance(cond,str):
+            return self.map(lambda df: df.query(cond))
+        return self.map(lambda df: df[np.asarray(cond(df),dtype=bool)])
+
+    def project(self,cols):
+        cols = list(cols)
+        if len(self.steps) == 0:
+            # read only these columns from the source
+            return self._derive(cols=cols)
+        return self.map(lambda df: df[cols])
+
+    def map(self,func):
+        """
+            func: chunk -> chunk, e.g. to add a column
+        """
+        return self._derive(steps=self.steps+[func])
+
+    def groupby(self,keys,sort=True):
+        return chunkGroupBy(self,keys,sort)
+
+    def join(self,other,on,how='inner',suffixes=('_x','_y'),parts=PARTS):
+        """
+            other: chunkQuery or anything chunkQuery accepts as a source
+            on: key column or list of key columns
+            how: inner, left, right or outer
+            if other fits in the budget it is kept in memory and every chunk
+            is merged with it, otherwise both sides are spilled into parts
+            partitions by key hash, which are then merged one at a time with
+            their rows sorted on the keys.
+        """
+        if not isinstance(other,chunkQuery):
+            other = self._derive(source=other)
+        on = [on] if isinstance(on,str) else list(on)
+        def _join_chunks():
+            return _join(self,other,on,how,suffixes,parts)
+        return self._derive(source=_join_chunks)
+
+    def chunks(self):
+        for chunk in self._read():
+            for step in self.steps:
+                chunk = step(chunk)
+            if chunk.shape[0]:
+                yield chunk
+
+    def to_frame(self):
+        chunks = list(self.chunks())
+        if len(chunks) == 0:
+            return self._empty()
+        return pd.concat(chunks,axis=0)
+
+    def to_table(self,path):
+        """
+            write the result as a col_store table, one chunk in memory at a time
+            Return: path
+        """
+        writer = tableWriter(path)
+        empty = True
+        for chunk in self.chunks():
+            writer.append(chunk)
+            empty = False
+        if empty:
+            writer.append(self._empty())
+        writer.close()
+        return path
+
+    def _empty(self):
+        # the schema of the result without its rows
+        for chunk in self._read():
+            chunk = chunk.iloc[:0]
+            for step in self.steps:
+                chunk = step(chunk)
+            return chunk
+        return pd.DataFrame()
+
+    def _read(self):
+        source = self.source
+        if callable(source):
+            return source()
+        if isinstance(source,pd.DataFrame):
+            return _frame_chunks(source,self.cols,self.chunksize)
+        if is_table(source):
+            return _table_chunks(source,self.cols,self.chunksize)
+        return pd.read_csv(source,usecols=self.cols,chunksize=self.chunksize)
+
+    def _mkdtemp(self):
+        if self.tmp is not None and not os.path.exists(self.tmp):
+            os.makedirs(self.tmp)
+        return tempfile.mkdtemp(prefix="chunk_query_",dir=self.tmp)
+
+class chunkGroupBy(object):
+
+    def __init__(self,query,keys,sort=True):
+        self.query = query
+        self.keys = [keys] if isinstance(keys,str) else list(keys)
+        self.sort = sort
+
+    def agg(self,spec):
+        """
+            spec: {} column -> op or list of ops, ops are
+                sum, count, size, min, max, mean, first, last, list
+                a column with one op keeps its name, otherwise the
+                result column is column_op
+            Return: chunkQuery over the aggregated frame, indexed by keys
+                like pandas. Without a spill the keys are sorted if sort,
+                after a spill they are sorted within each partition only.
+        """
+        spec = [(col,[ops] if isinstance(ops,str) else list(ops)) for col,ops in spec.items()]
+        for col,ops in spec:
+            for op in ops:
+                if op not in PARTIAL:
+                    raise ValueError("unknown aggregation %s of %s"%(op,col))
+        query = self.query
+        def _agg_chunks():
+            return _aggregate(query,self.keys,spec,self.sort)
+        return query._derive(source=_agg_chunks)
+
+    def size(self):
+        return self.agg({self.keys[0]:'size'})
+
+def _aggregate(query,keys,spec,sort):
+    buf,nbytes = [],0
+    tmp = None
+    try:
+        for chunk in query.chunks():
+            part = _partial(chunk,keys,spec)
+            buf.append(part)
+            nbytes += part.memory_usage(index=True,deep=True).sum()
+            if nbytes < query.budget:
+                continue
+            part = _combine(pd.concat(buf,axis=0),len(keys))
+            buf,nbytes = [part],part.memory_usage(index=True,deep=True).sum()
+            if nbytes*2 < query.budget:
+                continue
+            # too many distinct keys to keep in memory
+            if tmp is None:
+                tmp = query._mkdtemp()
+                print("spill partial aggregates to %s"%tmp)
+            _spill(part,_index_frame(part),tmp,'agg',PARTS)
+            buf,nbytes = [],0
+        if tmp is None:
+            if len(buf) == 0:
+                return
+            part = _finalize(_combine(pd.concat(buf,axis=0),len(keys)),spec)
+            yield part.sort_index() if sort else part
+            return
+        if len(buf):
+            part = pd.concat(buf,axis=0)
+            _spill(part,_index_frame(part),tmp,'agg',PARTS)
+        for p in range(PARTS):
+            pieces = list(_read_spill(tmp,'agg',p))
+            if len(pieces) == 0:
+                continue
+            part = _finalize(_combine(pd.concat(pieces,axis=0),len(keys)),spec)
+            yield part.sort_index() if sort else part
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp,ignore_errors=True)
+
+def _partial(chunk,keys,spec):
+    g = chunk.groupby(keys,sort=False,observed=True)
+    parts = {}
+    for col,ops in spec:
+        for op in ops:
+            for p in PARTIAL[op]:
+                name = "%s|%s"%(col,p)
+                if name in parts:
+                    continue
+                if p == 'size':
+                    parts[name] = g.size()
+                elif p == 'list':
+                    parts[name] = g[col].agg(list)
+                else:
+                    parts[name] = g[col].agg(p)
+    return pd.DataFrame(parts)
+
+def _combine(part,nkeys):
+    # partials of the same keys, in chunk order, are reduced to one row
+    g = part.groupby(level=list(range(nkeys)),sort=False,observed=True)
+    res = {}
+    for name in part.columns:
+        op = name.split('|')[-1]
+        if op == 'list':
+            res[name] = g[name].agg(_concat_lists)
+        else:
+            res[name] = g[name].agg(COMBINE[op])
+    return pd.DataFrame(res,columns=part.columns)
+
+def _concat_lists(s):
+    return list(itertools.chain.from_iterable(s))
+
+def _finalize(part,spec):
+    res = {}
+    for col,ops in spec:
+        for op in ops:
+            name = col if len(ops) == 1 else "%s_%s"%(col,op)
+            if op == 'mean':
+                res[name] = part["%s|sum"%col]/part["%s|count"%col]
+            else:
+                res[name] = part["%s|%s"%(col,op)]
+    return pd.DataFrame(res,index=part.index,columns=list(res.keys()))
+
+def _join(left,right,on,how,suffixes,parts):
+    build,nbytes = [],0
+    rchunks = right.chunks()
+    for chunk in rchunks:
+        build.append(chunk)
+        nbytes += chunk.memory_usage(index=True,deep=True).sum()
+        if nbytes > left.budget:
+            break
+    else:
+        if how in ['inner','left']:
+            # the right side fits in memory
+            rdf = pd.concat(build,axis=0) if len(build) else right._empty()
+            for chunk in left.chunks():
+                yield pd.merge(chunk,rdf,on=on,how=how,suffixes=suffixes)
+            return
+    tmp = left._mkdtemp()
+    try:
+        for chunk in itertools.chain(build,rchunks):
+            _spill(chunk,chunk[on],tmp,'right',parts)
+        del build
+        for chunk in left.chunks():
+            _spill(chunk,chunk[on],tmp,'left',parts)
+        lempty,rempty = left._empty(),right._empty()
+        for p in range(parts):
+            lpieces = list(_read_spill(tmp,'left',p))
+            rpieces = list(_read_spill(tmp,'right',p))
+            if len(lpieces)+len(rpieces) == 0:
+                continue
+            ldf = pd.concat(lpieces,axis=0) if len(lpieces) else lempty
+            rdf = pd.concat(rpieces,axis=0) if len(rpieces) else rempty
+            res = pd.merge(ldf,rdf,on=on,how=how,suffixes=suffixes,sort=True)
+            if res.shape[0]:
+                yield res
+    finally:
+        shutil.rmtree(tmp,ignore_errors=True)
+
+def _index_frame(part):
+    return part.index.to_frame(index=False)
+
+def _spill(df,keys,tmp,tag,parts):
+    h = _hash_keys(keys)%parts
+    for p in np.unique(h):
+        with open("%s/%s-%d.pkl"%(tmp,tag,p),'ab') as fo:
+            pickle.dump(df[h==p],fo,protocol=pickle.HIGHEST_PROTOCOL)
+
+def _read_spill(tmp,tag,p):
+    name = "%s/%s-%d.pkl"%(tmp,tag,p)
+    if not os.path.exists(name):
+        return
+    with open(name,'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                break
+
+def _hash_keys(keys):
+    # the same key must hash the same on both sides of a join,
+    # whatever the integer width or encoding of the column
+    if isinstance(keys,pd.Series):
+        keys = keys.to_frame()
+    cols = {}
+    for col in keys.columns:
+        s = keys[col]
+        if isinstance(s.dtype,pd.CategoricalDtype) or pd.api.types.is_string_dtype(s.dtype):
+            s = s.astype(object)
+        elif s.dtype.kind in 'iub':
+            s = s.astype(np.int64)
+        cols[col] = s.values
+    cols = pd.DataFrame(cols,columns=list(keys.columns))
+    return pd.util.hash_pandas_object(cols,index=False).values
+
+def _table_chunks(path,cols,chunksize):
+    n,_ = table_shape(path)
+    vocabs = {} # string vocabularies are decoded once per query
+    for s in range(0,n,chunksize):
+        yield load_table(path,cols,rows=slice(s,min(s+chunksize,n)),vocabs=vocabs)
+
+def _frame_chunks(df,cols,chunksize):
+    if cols is not None:
+        df = df[cols]
+    for s in range(0,df.shape[0],chunksize):
+        yield df.iloc[s:s+chunksize]
@@ -0,0 +1,337 @@
+"""
+columnar table cache for pd_DB
+each column is saved as its own typed binary file next to a small manifest,
+numeric columns are loaded back through memory mapping so only the pages
+a task actually touches are read from disk.
+
+layout of a table directory:
+    manifest.json       column names, kinds, dtypes and number of rows
+    c0.npy, c1.npy ...  one file per numeric column
+    c2.codes.npy        codes of a dictionary encoded string column
+    c2.vocab.bin/.off.npy  utf-8 vocabulary blob and its offsets
+"""
+import os
+import json
+import pickle
+import struct
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+VERSION = 1
+CAT_RATIO = 0.5 # string columns with fewer uniques per row stay encoded
+
+def is_table(path):
+    return os.path.exists("%s/%s"%(path,MANIFEST))
+
+def table_columns(path):
+    return [col['name'] for col in _read_manifest(path)['columns']]
+
+def table_shape(path):
+    manifest = _read_manifest(path)
+    return manifest['nrows'],len(manifest['columns'])
+
+def save_table(df,path):
+    """
+        Input:
+            df: pd.DataFrame
+            path: directory of the table, created if needed
+        the manifest is written last so a crashed save is never
+        mistaken for a complete table.
+    """
+    writer = tableWriter(path)
+    writer.append(df)
+    writer.close()
+
+def load_table(path,cols=None,mmap=True,categorical=False,rows=None,vocabs=None):
+    """
+        Input:
+            path: directory written by save_table
+            cols: list of column names to load, None for all
+            mmap: if True numeric columns are copy-on-write memory maps,
+                the data is paged in only when it is read
+            categorical: if True string columns with repeated values
+                are returned as pd.Categorical on their codes,
+                instead of one python str per row (object, the default)
+            rows: slice of rows to load, None for all
+            vocabs: {} the decoded vocabularies are kept in, pass the
+                same one to every row slice of a table to decode them once
+        Return: pd.DataFrame
+    """
+    manifest = _read_manifest(path)
+    infos = manifest['columns']
+    if cols is not None:
+        cols = list(cols)
+        byname = {info['name']:info for info in infos}
+        missing = [i for i in cols if i not in byname]
+        if len(missing):
+            raise KeyError("columns %s not in %s"%(missing,path))
+        infos = [byname[i] for i in cols]
+    mode = 'c' if mmap else None
+    bar = manifest['nrows']*CAT_RATIO if categorical else -1
+    data = {}
+    for info in infos:
+        data[info['name']] = _load_column(info,path,mode,bar,rows,vocabs)
+    if manifest['index'] is not None:
+        index = pd.Index(_load_column(manifest['index'],path,mode,-1,rows,vocabs),
+            name=manifest['index']['name'])
+    else:
+        index = pd.RangeIndex(manifest['nrows'])
+        if rows is not None:
+            index = index[rows]
+    df = pd.DataFrame(data,index=index,columns=[info['name'] for info in infos],copy=False)
+    return df
+
+class tableWriter(object):
+    """
+    writes a table one chunk at a time, e.g. the result of an out-of-core
+    query. Every chunk must have the same columns. Numeric columns and codes
+    are appended to their .npy files, the vocabulary of string columns grows
+    as new values show up.
+    """
+    def __init__(self,path):
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.mname = "%s/%s"%(path,MANIFEST)
+        if os.path.exists(self.mname):
+            os.remove(self.mname)
+        self.nrows = 0
+        self.names = None
+        self.columns = None
+        self.index = None
+
+    def append(self,df):
+        if self.columns is None:
+            self.names = [_json_name(col) for col in df.columns.values]
+            self.columns = [_colWriter("%s/c%d"%(self.path,c)) for c in range(df.shape[1])]
+            if not _is_default_index(df.index):
+                self.index = _colWriter("%s/index"%self.path)
+                self.index_name = _json_name(df.index.name)
+        for c,writer in enumerate(self.columns):
+            writer.append(df.iloc[:,c])
+        if self.index is not None:
+            self.index.append(pd.Series(df.index.values))
+        self.nrows += df.shape[0]
+
+    def close(self):
+        columns = []
+        for name,writer in zip(self.names or [],self.columns or []):
+            info = writer.close(self.nrows)
+            info['name'] = name
+            columns.append(info)
+        index = None
+        if self.index is not None:
+            index = self.index.close(self.nrows)
+            index['name'] = self.index_name
+        manifest = {"version":VERSION,"nrows":int(self.nrows),
+            "columns":columns,"index":index}
+        with open(self.mname+".tmp",'w') as fo:
+            json.dump(manifest,fo)
+        os.rename(self.mname+".tmp",self.mname)
+
+def load_column(path,col,mmap=True,categorical=False):
+    return load_table(path,[col],mmap,categorical)[col]
+
+def _read_manifest(path):
+    with open("%s/%s"%(path,MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != VERSION:
+        raise ValueError("unknown table version in %s"%path)
+    return manifest
+
+def _json_name(name):
+    if name is None or isinstance(name,(str,int,float,bool)):
+        return name
+    if isinstance(name,np.generic):
+        return name.item()
+    return str(name)
+
+def _is_default_index(index):
+    return isinstance(index,pd.RangeIndex) and index.start==0 and index.step==1 and index.name is None
+
+def code_dtype(n):
+    # codes range from -1 (missing) to n-1
+    for dtype in [np.int8,np.int16,np.int32]:
+        if n < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class _colWriter(object):
+    """
+    kind of the column is decided by its first chunk:
+        num: values appended after a fixed size npy header
+        str/cat: int32 codes into a growing vocabulary,
+            shrunk to code_dtype(len(vocab)) on close
+        pkl: one pickle per chunk
+    """
+    def __init__(self,base):
+        self.base = base
+        self.kind = None
+
+    def append(self,s):
+        if self.kind is None:
+            self._start(s)
+        if self.kind == "pkl":
+            pickle.dump(s.values,self.f,protocol=pickle.HIGHEST_PROTOCOL)
+            return
+        if self.kind == "cat":
+            values = self._recode(s.cat.codes.values,s.cat.categories)
+        elif self.kind == "str":
+            codes,uniques = pd.factorize(s.values)
+            values = self._recode(codes,pd.Index(uniques,dtype=object,tupleize_cols=False))
+        else:
+            values = s.values
+            if values.dtype != self.dtype:
+                if not np.can_cast(values.dtype,self.dtype,'safe'):
+                    raise ValueError("%s: chunk of %s does not fit %s"%(self.base,values.dtype,self.dtype))
+                values = values.astype(self.dtype)
+        self.f.write(np.ascontiguousarray(values).tobytes())
+
+    def close(self,nrows):
+        name = self.base.split('/')[-1]
+        if self.kind is None:
+            # no chunk at all
+            self._start(pd.Series([],dtype=np.float64))
+        self.f.close()
+        if self.kind == "pkl":
+            return {"kind":"pkl","file":name}
+        if self.kind == "num":
+            write_npy_header(self.fname,self.dtype,nrows)
+            return {"kind":"num","file":name,"dtype":str(self.dtype)}
+        write_npy_header(self.fname,np.int32,nrows)
+        dtype = code_dtype(len(self.vocab))
+        if dtype != np.int32:
+            _shrink_npy(self.fname,dtype)
+        info = {"kind":self.kind,"file":name}
+        if self.kind == "cat":
+            info['ordered'] = self.ordered
+            info['vocab'] = _save_values(np.asarray(self.vocab.values),self.base)
+        else:
+            info['vocab'] = _save_values(np.asarray(self.vocab,dtype=object),self.base)
+        return info
+
+    def _start(self,s):
+        if isinstance(s.dtype,pd.CategoricalDtype):
+            self.kind = "cat"
+            self.ordered = bool(s.cat.ordered)
+            self.vocab = s.cat.categories[:0]
+        elif s.dtype == object or pd.api.types.is_string_dtype(s.dtype):
+            try:
+                pd.factorize(s.values)
+                self.kind = "str"
+                self.vocab = pd.Index([],dtype=object)
+            except TypeError:
+                # unhashable values such as lists
+                self.kind = "pkl"
+        elif not isinstance(s.dtype,np.dtype) or s.dtype.kind not in 'biufcmM':
+            # nullable and other extension dtypes are kept as they are
+            self.kind = "pkl"
+        else:
+            self.kind = "num"
+            self.dtype = s.dtype
+        if self.kind == "pkl":
+            self.fname = "%s.pkl"%self.base
+            self.f = open(self.fname,'wb')
+            return
+        self.fname = "%s.npy"%self.base if self.kind == "num" else "%s.codes.npy"%self.base
+        self.f = open(self.fname,'wb')
+        self.f.write(b' '*NPY_HEADER)
+
+    def _recode(self,codes,uniques):
+        # codes of this chunk -> codes in the vocabulary of the column
+        if self.vocab.equals(uniques):
+            return codes.astype(np.int32)
+        pos = self.vocab.get_indexer(uniques)
+        new = pos<0
+        if new.any():
+            pos[new] = np.arange(len(self.vocab),len(self.vocab)+new.sum())
+            self.vocab = self.vocab.append(pd.Index(uniques[new]))
+        pos = np.append(pos,-1).astype(np.int32)
+        return pos[codes]
+
+NPY_HEADER = 128 # fixed so the header can be rewritten once nrows is known
+
+def write_npy_header(fname,dtype,n):
+    header = repr({'descr':np.lib.format.dtype_to_descr(np.dtype(dtype)),
+        'fortran_order':False,'shape':(int(n),)})
+    header = header+' '*(NPY_HEADER-11-len(header))+'\n'
+    with open(fname,'r+b') as fo:
+        fo.write(b'\x93NUMPY\x01\x00'+struct.pack('<H',NPY_HEADER-10)+header.encode('latin1'))
+
+def _shrink_npy(fname,dtype,chunksize=1<<22):
+    src = np.load(fname,mmap_mode='r')
+    dst = np.lib.format.open_memmap(fname+".tmp",mode='w+',dtype=dtype,shape=src.shape)
+    for s in range(0,src.shape[0],chunksize):
+        dst[s:s+chunksize] = src[s:s+chunksize]
+    dst.flush()
+    del src,dst
+    os.rename(fname+".tmp",fname)
+
+def _save_values(values,base):
+    if values.dtype != object:
+        np.save("%s.vocab.npy"%base,values)
+        return "npy"
+    if all(isinstance(i,str) for i in values):
+        blobs = [i.encode('utf-8') for i in values]
+        off = np.zeros(len(blobs)+1,dtype=np.int64)
+        np.cumsum([len(i) for i in blobs],out=off[1:])
+        with open("%s.vocab.bin"%base,'wb') as fo:
+            fo.write(b"".join(blobs))
+        np.save("%s.vocab.off.npy"%base,off)
+        return "utf8"
+    with open("%s.vocab.pkl"%base,'wb') as fo:
+        pickle.dump(values,fo,protocol=pickle.HIGHEST_PROTOCOL)
+    return "pkl"
+
+def _load_values(kind,base):
+    if kind == "npy":
+        return np.load("%s.vocab.npy"%base)
+    if kind == "utf8":
+        off = np.load("%s.vocab.off.npy"%base)
+        with open("%s.vocab.bin"%base,'rb') as f:
+            blob = f.read()
+        values = np.empty(len(off)-1,dtype=object)
+        values[:] = [blob[off[i]:off[i+1]].decode('utf-8') for i in range(len(off)-1)]
+        return values
+    with open("%s.vocab.pkl"%base,'rb') as f:
+        return pickle.load(f)
+
+def _load_column(info,path,mode,bar,rows=None,vocabs=None):
+    base = "%s/%s"%(path,info['file'])
+    kind = info['kind']
+    rows = slice(None) if rows is None else rows
+    if kind == "num":
+        return np.load("%s.npy"%base,mmap_mode=mode)[rows]
+    if kind == "pkl":
+        return _load_pickles("%s.pkl"%base)[rows]
+    codes = np.load("%s.codes.npy"%base,mmap_mode=mode)[rows]
+    vocabs = {} if vocabs is None else vocabs
+    if base not in vocabs:
+        vocabs[base] = _load_values(info['vocab'],base)
+    vocab = vocabs[base]
+    if kind == "cat":
+        return pd.Categorical.from_codes(codes,categories=vocab,ordered=info['ordered'])
+    if len(vocab) <= bar:
+        return pd.Categorical.from_codes(codes,categories=vocab)
+    if (base,'object') not in vocabs:
+        # the extra nan at the end is what code -1 picks up
+        vocabs[(base,'object')] = np.append(vocab.astype(object),np.nan)
+    return vocabs[(base,'object')][codes]
+
+def _load_pickles(fname):
+    # one pickle per appended chunk
+    parts = []
+    with open(fname,'rb') as f:
+        while True:
+            try:
+                parts.append(pickle.load(f))
+            except EOFError:
+                break
+    if len(parts) == 1:
+        return parts[0]
+    if len(parts) == 0:
+        return np.array([],dtype=object)
+    if isinstance(parts[0],np.ndarray):
+        return np.concatenate(parts)
+    return type(parts[0])._concat_same_type(parts)
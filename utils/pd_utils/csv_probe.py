@@ -0,0 +1,120 @@
+"""
+streaming dtype inference and typed loading of csv files
+probe_csv scans the file once in fixed-size chunks and keeps per column
+min/max/nulls/cardinality, read_csv_typed then loads it in one more chunked
+pass straight into preallocated arrays of the narrowest dtypes.
+"""
+import numpy as np
+import pandas as pd
+from utils.pd_utils.col_store import code_dtype
+
+CHUNK = 1<<20
+FLOAT32_EXACT = 1<<24 # integers above this are not exact in float32
+
+class colStat(object):
+    def __init__(self):
+        self.kinds = set() # numpy kinds seen in chunks: b,i,u,f,O
+        self.nulls = 0
+        self.mi = None
+        self.mx = None
+        self.integral = True # all non-null floats are whole numbers
+        self.uniques = set() # None once more than cat_bar values are seen
+
+    def update(self,s,cat_bar):
+        self.nulls += int(s.isnull().sum())
+        kind = s.dtype.kind if isinstance(s.dtype,np.dtype) else 'O'
+        self.kinds.add(kind)
+        if kind in 'iuf':
+            x = s.values
+            if kind == 'f':
+                x = x[~np.isnan(x)]
+                if x.shape[0] and self.integral:
+                    self.integral = bool(np.all(np.mod(x,1)==0))
+            if x.shape[0]:
+                mi,mx = x.min(),x.max()
+                self.mi = mi if self.mi is None else min(mi,self.mi)
+                self.mx = mx if self.mx is None else max(mx,self.mx)
+        elif kind == 'O' and self.uniques is not None:
+            self.uniques.update(s.dropna().unique())
+            if len(self.uniques) > cat_bar:
+                self.uniques = None
+
+    def dtype(self):
+        kinds = self.kinds
+        if 'O' in kinds:
+            # categories are only trusted if every chunk parsed as strings
+            if self.uniques is not None and kinds == {'O'}:
+                return 'category'
+            return object
+        if kinds == {'b'}:
+            return np.bool_
+        if self.mi is None:
+            return np.float32
+        if 'f' in kinds:
+            if self.integral and max(abs(self.mi),abs(self.mx)) > FLOAT32_EXACT:
+                return np.float64
+            return np.float32
+        return min_int_dtype(self.mi,self.mx)
+
+def min_int_dtype(mi,mx):
+    for dtype in [np.int8,np.uint8,np.int16,np.uint16,np.int32,np.uint32]:
+        info = np.iinfo(dtype)
+        if info.min<=mi and mx<=info.max:
+            return dtype
+    return np.int64
+
+def probe_csv(fname,sep=',',chunksize=CHUNK,cat_bar=1000,**kw):
+    """
+        Input:
+            fname: csv file
+            chunksize: rows per chunk, peak memory is one chunk
+            cat_bar: string columns with at most cat_bar distinct
+                values are loaded as category
+        Return: profile {} with
+            nrows: number of rows
+            dtype: {} column name -> narrowest dtype
+            categories: {} column name -> sorted categories
+            stats: {} column name -> colStat
+    """
+    stats = {}
+    nrows = 0
+    for chunk in pd.read_csv(fname,sep=sep,chunksize=chunksize,**kw):
+        for col in chunk.columns.values:
+            if col not in stats:
+                stats[col] = colStat()
+            stats[col].update(chunk[col],cat_bar)
+        nrows += chunk.shape[0]
+    dtype = {col:stat.dtype() for col,stat in stats.items()}
+    categories = {col:sorted(stats[col].uniques) for col in dtype if dtype[col]=='category'}
+    return {"nrows":nrows,"dtype":dtype,"categories":categories,"stats":stats}
+
+def read_csv_typed(fname,profile,sep=',',chunksize=CHUNK,**kw):
+    """
+        load fname in one chunked pass, every chunk is written into
+        arrays preallocated from the profile returned by probe_csv.
+    """
+    n = profile['nrows']
+    dtype = profile['dtype']
+    cats = profile['categories']
+    arrays = {}
+    read_dtype = {}
+    for col,dt in dtype.items():
+        if dt == 'category':
+            arrays[col] = np.empty(n,dtype=code_dtype(len(cats[col])))
+            read_dtype[col] = object
+        else:
+            arrays[col] = np.empty(n,dtype=dt)
+            read_dtype[col] = dt
+    s = 0
+    for chunk in pd.read_csv(fname,sep=sep,chunksize=chunksize,dtype=read_dtype,**kw):
+        e = s+chunk.shape[0]
+        for col in chunk.columns.values:
+            if dtype[col] == 'category':
+                arrays[col][s:e] = pd.Categorical(chunk[col].values,categories=cats[col]).codes
+            else:
+                arrays[col][s:e] = chunk[col].values
+        s = e
+    assert s == n, "%s changed since it was probed"%fname
+    for col in cats:
+        arrays[col] = pd.Categorical.from_codes(arrays[col],categories=cats[col])
+    return pd.DataFrame(arrays,columns=list(dtype.keys()),copy=False)
@@ -0,0 +1,66 @@
+"""
+vectorized date/time features
+timestamps repeat heavily (at most one value per second), so a column is
+factorized once, only its unique values are parsed and the parts are
+broadcast back to the rows through the codes as compact int arrays.
+missing or unparseable values get -1.
+"""
+import numpy as np
+import pandas as pd
+
+FEAS = ['year','month','day','hour','minute','second','dow','epoch']
+DTYPES = {'year':np.int16,'month':np.int8,'day':np.int8,'hour':np.int8,
+    'minute':np.int8,'second':np.int8,'dow':np.int8,'epoch':np.int64}
+
+def time_parts(s,feas=FEAS,fmt=None):
+    """
+        Input:
+            s: pd.Series of timestamp strings or datetimes
+            feas: any of FEAS, dow is monday=0, epoch is seconds since 1970
+            fmt: format of pd.to_datetime, None to infer it
+        Return: {} fea -> np array with one value per row
+    """
+    codes,uniq = pd.factorize(s)
+    t = pd.to_datetime(pd.Series(uniq),format=fmt,errors='coerce')
+    ok = t.notnull().values
+    res = {}
+    for fea in feas:
+        if fea == 'epoch':
+            vals = t.values.astype('datetime64[s]').astype(np.int64)
+        elif fea == 'dow':
+            vals = t.dt.dayofweek.values
+        else:
+            vals = getattr(t.dt,fea).values
+        res[fea] = _broadcast(np.where(ok,vals,-1),codes,DTYPES[fea])
+    return res
+
+def date_parts(s,deli='-',order='ymd'):
+    """
+        split dates like 2017-05-10 (deli '-', order 'ymd') or
+        10/05/2017 (deli '/', order 'dmy') into year, month, day
+        Return: {} year/month/day -> np array with one value per row
+    """
+    codes,uniq = pd.factorize(s)
+    parts = pd.Series(uniq,dtype=object).str.split(deli,expand=True)
+    names = {'y':'year','m':'month','d':'day'}
+    res = {}
+    for c,i in enumerate(order):
+        if c in parts.columns:
+            vals = pd.to_numeric(parts[c],errors='coerce').values.astype(np.float64)
+        else:
+            vals = np.full(len(uniq),np.nan)
+        res[names[i]] = _broadcast(np.where(np.isnan(vals),-1,vals),codes,DTYPES[names[i]])
+    return res
+
+def add_time_features(df,col,feas=FEAS,fmt=None,prefix=''):
+    """
+        add the time_parts of df[col] to df as columns prefix+fea
+    """
+    for fea,vals in time_parts(df[col],feas,fmt).items():
+        df[prefix+fea] = vals
+    return df
+
+def _broadcast(vals,codes,dtype):
+    # one extra slot at the end for the missing code -1
+    table = np.append(vals,-1).astype(dtype)
+    return table[codes]
@@ -0,0 +1,228 @@
+"""
+one pass train/test drift profiler
+both sources (frames or csv files) are read once in chunks and every column
+keeps small mergeable sketches per side:
+    min/max, nulls and dtypes
+    approximate distinct count, a HyperLogLog of the value hashes
+    heavy hitters, the most frequent values
+    a histogram on a grid shared by both sides, widened by doubling
+values are exact while a column has at most EXACT distinct values, above
+that the set differences are estimated as |A union B| - |A|.
+"""
+import numpy as np
+import pandas as pd
+from utils.pd_utils.csv_probe import CHUNK
+
+HLL_P = 14 # 2^14 registers, about 1% error
+EXACT = 1<<12 # distinct values kept exactly
+TOP = 10 # heavy hitters reported per column
+BINS = 64
+
+def drift_report(a,b,cols=None,names=('a','b'),chunksize=CHUNK,**kw):
+    """
+        Input:
+            a,b: pd.DataFrame or csv file, e.g. train and test
+            cols: columns to profile, None for the columns of a
+            kw: passed to pd.read_csv
+        Return: pd.DataFrame, one row per column with, for each side,
+            dtype, rows, nulls, min, max, distinct, only (values not in
+            the other side), top (heavy hitters), and the psi of the two
+            histograms of numeric columns
+    """
+    profiles = {}
+    for side,src in enumerate([a,b]):
+        for chunk in _chunks(src,cols,chunksize,**kw):
+            if cols is None:
+                cols = list(chunk.columns.values)
+            for col in cols:
+                if col not in chunk.columns:
+                    continue
+                if col not in profiles:
+                    profiles[col] = colProfile()
+                profiles[col].update(side,chunk[col])
+    rows = []
+    for col in cols or []:
+        if col in profiles:
+            rows.append(profiles[col].report(col,names))
+    return pd.DataFrame(rows).set_index('column') if len(rows) else pd.DataFrame()
+
+def _chunks(src,cols,chunksize,**kw):
+    if isinstance(src,pd.DataFrame):
+        if cols is not None:
+            src = src[[i for i in cols if i in src.columns]]
+        for s in range(0,src.shape[0],chunksize):
+            yield src.iloc[s:s+chunksize]
+    else:
+        for chunk in pd.read_csv(src,chunksize=chunksize,**kw):
+            yield chunk
+
+class colProfile(object):
+    """
+    sketches of one column on both sides, the histogram grid is shared
+    """
+    def __init__(self,bins=BINS):
+        self.sides = [colSketch(),colSketch()]
+        self.bins = bins
+        self.w = None # bin width, a power of 2
+        self.k0 = 0 # bin i covers [(k0+i)*w,(k0+i+1)*w)
+        self.lo,self.hi = None,None
+
+    def update(self,side,s):
+        x = self.sides[side].update(s)
+        if x is not None and x.shape[0]:
+            self._hist(side,x)
+
+    def _hist(self,side,x):
+        mn,mx = x.min(),x.max()
+        self.lo = mn if self.lo is None else min(mn,self.lo)
+        self.hi = mx if self.hi is None else max(mx,self.hi)
+        if self.w is None:
+            span = max(self.hi-self.lo,1e-12)
+            self.w = 2.0**np.ceil(np.log2(span/(self.bins-1)))
+            self.k0 = int(np.floor(self.lo/self.w))
+        t = 0
+        while np.floor(self.hi/self.w)-np.floor(self.lo/self.w) >= self.bins:
+            self.w *= 2
+            t += 1
+        k0 = int(np.floor(self.lo/self.w))
+        for sk in self.sides:
+            if sk.hist is None:
+                sk.hist = np.zeros(self.bins,dtype=np.int64)
+            elif t or k0 != self.k0:
+                # absolute bin a of width w/2^t falls into a>>t of width w
+                nz = np.nonzero(sk.hist)[0]
+                a = (self.k0+nz)>>t
+                sk.hist = np.bincount(a-k0,weights=sk.hist[nz],minlength=self.bins).astype(np.int64)
+        self.k0 = k0
+        idx = np.floor(x/self.w).astype(np.int64)-k0
+        self.sides[side].hist += np.bincount(np.clip(idx,0,self.bins-1),minlength=self.bins)
+
+    def report(self,col,names):
+        a,b = self.sides
+        res = {'column':col}
+        for n,sk in zip(names,self.sides):
+            res["%s_dtype"%n] = ','.join(sorted(sk.dtypes))
+            res["%s_rows"%n] = sk.rows
+            res["%s_nulls"%n] = sk.nulls
+            res["%s_min"%n] = sk.mn
+            res["%s_max"%n] = sk.mx
+            res["%s_distinct"%n] = sk.distinct()
+            res["%s_top"%n] = sk.top()
+        res["%s_only"%names[0]] = a.only(b)
+        res["%s_only"%names[1]] = b.only(a)
+        res['psi'] = psi(a.hist,b.hist) if a.hist is not None and b.hist is not None else np.nan
+        return res
+
+class colSketch(object):
+
+    def __init__(self):
+        self.dtypes = set()
+        self.rows = 0
+        self.nulls = 0
+        self.mn,self.mx = None,None
+        self.reg = np.zeros(1<<HLL_P,dtype=np.uint8)
+        self.values = {} # hash -> value while exact
+        self.hh = pd.Series([],dtype=np.float64) # value -> approximate count
+        self.hist = None
+
+    def update(self,s):
+        """
+            Return: finite numeric values of s for the histogram, or None
+        """
+        self.dtypes.add(str(s.dtype))
+        self.rows += s.shape[0]
+        null = s.isnull().values
+        self.nulls += int(null.sum())
+        vc = s.value_counts()
+        vc = vc[vc>0] # categories without rows
+        if TOP:
+            self.hh = self.hh.add(vc.iloc[:2*TOP].astype(np.float64),fill_value=0).nlargest(2*TOP)
+        if vc.shape[0] == 0:
+            return None
+        uniq = vc.index.values
+        h = hash_values(uniq)
+        self._hll(h)
+        if self.values is not None and len(uniq) > EXACT:
+            self.values = None
+        if self.values is not None:
+            self.values.update(zip(h.tolist(),uniq.tolist()))
+            if len(self.values) > EXACT:
+                self.values = None
+        x = _numeric(s[~null])
+        if x is None:
+            return None
+        x = x[np.isfinite(x)]
+        if x.shape[0]:
+            mn,mx = x.min(),x.max()
+            self.mn = mn if self.mn is None else min(mn,self.mn)
+            self.mx = mx if self.mx is None else max(mx,self.mx)
+        return x
+
+    def _hll(self,h):
+        p = HLL_P
+        idx = (h>>np.uint64(64-p)).astype(np.int64)
+        rest = h & np.uint64((1<<(64-p))-1)
+        # rank of the first 1 bit in the remaining 64-p bits
+        _,e = np.frexp(rest.astype(np.float64))
+        rho = np.where(rest>0,64-p-e+1,64-p+1).astype(np.uint8)
+        np.maximum.at(self.reg,idx,rho)
+
+    def distinct(self):
+        if self.values is not None:
+            return len(self.values)
+        return int(round(hll_count(self.reg)))
+
+    def only(self,other):
+        """
+            values (exact) or number of values (estimate) not in other
+        """
+        if self.values is not None and other.values is not None:
+            diff = [self.values[k] for k in self.values if k not in other.values]
+            return diff if len(diff) < TOP else len(diff)
+        union = hll_count(np.maximum(self.reg,other.reg))
+        return int(max(round(union-hll_count(other.reg)),0))
+
+    def top(self):
+        return list(self.hh.iloc[:TOP].index.values)
+
+def hash_values(uniq):
+    """
+        uint64 hash of values, the same value hashes the same whatever
+        the integer width, int/float or category/str encoding
+    """
+    vals = np.asarray(uniq)
+    if vals.dtype.kind in 'iufb':
+        vals = vals.astype(np.float64)
+    elif vals.dtype.kind in 'mM':
+        vals = vals.view(np.int64).astype(np.float64)
+    else:
+        vals = vals.astype(object)
+    return pd.util.hash_array(vals)
+
+def hll_count(reg):
+    m = reg.shape[0]
+    alpha = 0.7213/(1+1.079/m)
+    est = alpha*m*m/np.sum(2.0**-reg.astype(np.float64))
+    zeros = np.sum(reg==0)
+    if est <= 2.5*m and zeros > 0:
+        # small range correction, linear counting
+        est = m*np.log(m*1.0/zeros)
+    return est
+
+def psi(a,b,eps=1e-4):
+    """
+        population stability index of two histograms on the same grid
+    """
+    pa = a/max(a.sum(),1)+eps
+    pb = b/max(b.sum(),1)+eps
+    return float(np.sum((pa-pb)*np.log(pa/pb)))
+
+def _numeric(s):
+    dtype = s.dtype
+    if isinstance(dtype,pd.CategoricalDtype) or not isinstance(dtype,np.dtype):
+        return None
+    if dtype.kind in 'iufb':
+        return s.values.astype(np.float64)
+    if dtype.kind in 'mM':
+        return s.values.view(np.int64).astype(np.float64)
+    return None
@@ -1,26 +1,133 @@
-from sklearn.preprocessing import LabelEncoder
+import os
+import json
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from utils.pd_utils.utils import is_cat
+from utils.pd_utils.col_store import code_dtype
 
-def lbl_encode(df_tr,df_te=None,cols=None,objonly=True):
+def lbl_encode(df_tr,df_te=None,cols=None,objonly=True,order='lexical',min_count=1,path=None,workers=None):
+    """
+        encode the columns of df_tr and df_te inplace with a joint vocabulary
+        path: json file of the vocabulary, loaded if it exists, else saved
+        Return: the FactorEncoder
+    """
     print("label encode ...")
-    lbl = LabelEncoder()
-    if df_te is not None:
-        df = df_tr.append(df_te)
-        if cols is None:
-            cols = set(df_tr.columns.values).intersection(set(df_te.columns.values))
+    dfs = [df_tr] if df_te is None else [df_tr,df_te]
+    if cols is None:
+        cols = [i for i in df_tr.columns.values if df_te is None or i in df_te.columns]
+    if objonly:
+        cols = [i for i in cols if is_cat(df_tr[i])]
+    if path is not None and os.path.exists(path):
+        enc = FactorEncoder.load(path)
     else:
-        df = df_tr
-        if cols is None:
-            cols = df_tr.columns.values
-    encoded = []
-    for col in cols:
-        if objonly and df[col].dtype!='object':
-            continue
-        encoded.append(col)
-        lbl.fit(df[col].map(str))
-        df_tr[col] = lbl.transform(df_tr[col].map(str))
-        if df_te is not None:
-            df_te[col] = lbl.transform(df_te[col].map(str))
-    print('lbl encode:',encoded)
+        enc = FactorEncoder(cols,order,min_count,workers).fit(*dfs)
+        if path is not None:
+            enc.save(path)
+    for df in dfs:
+        enc.transform(df)
+    print('lbl encode:',cols)
+    return enc
 
+class FactorEncoder(object):
+    """
+    label encoding with one vocabulary per column
+    every frame is factorized on its own, so train and test are encoded
+    jointly without being concatenated, and only the unique values of a
+    column are turned into strings and looked up. Missing values are a
+    value of their own like str(nan) was. Codes are int8/int16/int32,
+    whichever fits the vocabulary, and columns are encoded in threads.
+    """
+    def __init__(self,cols,order='lexical',min_count=1,workers=None):
+        """
+            order: 'lexical', the codes of sklearn LabelEncoder on str values,
+                or 'freq', the most frequent value first
+            min_count: values seen fewer times in fit share one rare code
+                after the others, values unseen in fit get it too.
+                with min_count 1 unseen values are -1
+        """
+        if order not in ['lexical','freq']:
+            raise ValueError("unknown order %s"%order)
+        self.cols = list(cols)
+        self.order = order
+        self.min_count = min_count
+        self.workers = workers
+        self.vocab = {}
+
+    def fit(self,*dfs):
+        vocabs = self._map(lambda col: self._fit_col([df[col] for df in dfs]))
+        self.vocab = dict(zip(self.cols,vocabs))
+        return self
+
+    def transform(self,df):
+        """
+            replaces the columns of df with their codes, inplace
+        """
+        cols = [i for i in self.cols if i in df.columns]
+        codes = self._map(lambda col: self.encode(df[col],col),cols)
+        for col,c in zip(cols,codes):
+            df[col] = c
+        return df
+
+    def fit_transform(self,*dfs):
+        self.fit(*dfs)
+        for df in dfs:
+            self.transform(df)
+        return dfs[0] if len(dfs) == 1 else dfs
+
+    def size(self,col):
+        # number of codes, the rare code included
+        return len(self.vocab[col])+int(self.min_count>1)
+
+    def encode(self,s,col):
+        """
+            Return: np array of the codes of the values of s
+        """
+        vocab = self.vocab[col]
+        codes,uniq = _factorize(s)
+        pos = pd.Index(vocab,dtype=object).get_indexer(uniq)
+        pos[pos<0] = len(vocab) if self.min_count>1 else -1
+        return pos.astype(code_dtype(len(vocab)+1))[codes]
+
+    def decode(self,codes,col):
+        vocab = np.array(list(self.vocab[col])+[None],dtype=object)
+        codes = np.asarray(codes)
+        return vocab[np.where((codes>=0)&(codes<len(vocab)-1),codes,len(vocab)-1)]
+
+    def _fit_col(self,series):
+        counts = []
+        for s in series:
+            codes,uniq = _factorize(s)
+            cnt = np.bincount(codes,minlength=len(uniq))
+            counts.append(pd.Series(cnt,index=uniq))
+        cnt = pd.concat(counts).groupby(level=0).sum()
+        cnt = cnt[cnt>=self.min_count]
+        if self.order == 'freq':
+            # ties in lexical order
+            return sorted(cnt.index.values.tolist(),key=lambda v: (-cnt[v],v))
+        return sorted(cnt.index.values.tolist())
+
+    def _map(self,func,cols=None):
+        cols = self.cols if cols is None else cols
+        if self.workers == 1 or len(cols) < 2:
+            return [func(col) for col in cols]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(func,cols))
+
+    def save(self,path):
+        state = {"cols":self.cols,"order":self.order,"min_count":self.min_count,
+            "vocab":[self.vocab[col] for col in self.cols]}
+        with open(path,'w') as fo:
+            json.dump(state,fo)
+
+    @classmethod
+    def load(cls,path,workers=None):
+        with open(path) as f:
+            state = json.load(f)
+        enc = cls(state['cols'],state['order'],state['min_count'],workers)
+        enc.vocab = dict(zip(enc.cols,state['vocab']))
+        return enc
+
+def _factorize(s):
+    codes,uniq = pd.factorize(s,use_na_sentinel=False)
+    return codes,np.array([str(i) for i in uniq],dtype=object)
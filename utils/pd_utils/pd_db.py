@@ -6,19 +6,40 @@ import pandas as pd
 import numpy as np
 import os
 import gc
+import time
 from utils.utils import print_mem_time 
+from utils.profile_utils.stages import stage
+from utils.pd_utils.col_store import is_table,save_table,load_table
+from utils.pd_utils.csv_probe import probe_csv,read_csv_typed
+from utils.cache_utils.artifact import get_cache
+from utils.pd_utils.utils import union_categories
+from utils.pd_utils.chunk_query import chunkQuery,CHUNK,BUDGET
 from collections import namedtuple
+from functools import partial
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor,ProcessPoolExecutor
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+Table = namedtuple('Table', 'name fname dtype')
 
 class pd_DB(object):
-    def __init__(self):
+    def __init__(self,flags=None,tables=None,prob_dtype=False,categorical=False,share_vocab=None):
         self.sp = ','
+        self.sources = {} # table name -> cache it is loaded from
+        if flags is not None:
+            self._build(flags,tables if tables is not None else [],prob_dtype,
+                categorical=categorical,share_vocab=share_vocab)
 
     def build(self):
         self.Table = namedtuple('Table', 'name fname dtype')
         TABLES = [self.Table(i,"%s/%s"%(self.path,j),None) for i,j in zip(self.names,self.fnames)]
         self._build(self.flags,TABLES)
 
-    def _build(self,flags,tables=[],prob_dtype=False):
+    def _build(self,flags,tables=[],prob_dtype=False,eager=None,workers=None,
+        categorical=False,share_vocab=None):
         """
             Input:
               tables: a list of namedtuples,
@@ -29,63 +50,133 @@ class pd_DB(object):
                 set tables to [] if only some member functions 
                 are needed without loading data
               prob_dtype:
-                if True, will detect optimal dtype automatically
-                with additional time  
+                if True and the table has no dtype, will detect
+                optimal dtype with one chunked pass over the file
+              eager:
+                None: a table is loaded the first time it is accessed
+                "thread" or "process": load all tables now with a pool
+                of workers, processes only build the caches which are
+                then memory mapped by this process
+              categorical:
+                if True string columns with repeated values are
+                loaded as pd.Categorical, object columns otherwise
+              share_vocab:
+                groups of table names whose categorical columns share
+                one vocabulary per column name, e.g. [['train','test']]
             build a self.data {} fname->pd data frame
         """
-        print()
         self.flags = flags
-        path = flags.data_path
-        data = {}
+        self.categorical = categorical
+        self.data = lazyTables(share_vocab)
         for table in tables:
-            name = table.name
-            fname = table.fname
-            dtype = table.dtype
-            pname = "%s/%s.pkl"%(path,name.split('/')[-1].split('.')[0])
-            if os.path.exists(pname):
-                data[name] = pd.read_pickle(pname)
-            else:
-                print("read %s from raw"%fname)
-                if dtype is None and prob_dtype:
-                    dtype = self._get_dtype(fname,silent=flags.verbosity<=0)
-                data[name] = pd.read_csv(fname,dtype=dtype,sep=self.sp)
-                data[name].to_pickle(pname)
-            print_mem_time("Loaded {} {}".format(fname.split('/')[-1],data[name].shape))
-        self.data = data # no copy, pass the inference
+            self.data.add(table.name,partial(self._load_table,table,prob_dtype))
+            self.sources[table.name] = "%s.col"%self._cache_name(flags.data_path,table.name)
+        if eager is not None:
+            self.load_all(eager,workers,tables,prob_dtype)
+
+    def load_all(self,mode="thread",workers=None,tables=None,prob_dtype=False):
         print()
+        if mode == "process" and tables:
+            # callers build Table locally, which does not pickle
+            todo = [Table(*t) for t in tables if not self.data.is_loaded(t.name)]
+            state = {k:v for k,v in self.__dict__.items() if k not in ['data','Table']}
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for _ in pool.map(_warm_table,[(type(self),state,t,prob_dtype) for t in todo]):
+                    pass
+            # workers committed to the manifest on disk
+            get_cache(self.flags.data_path).reload()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in pool.map(self.data.__getitem__,list(self.data.keys())):
+                pass
+        print()
+
+    def _load_table(self,table,prob_dtype=False):
+        with stage("load_"+table.name) as st:
+            start = time.time()
+            name,fname = table.name,table.fname
+            pname = self._cache_name(self.flags.data_path,name)
+            params = self._cache_params(table,prob_dtype)
+            df = self._load_cache(pname,fname,params)
+            if df is None:
+                print("read %s from raw"%fname)
+                df = self._save_cache(self._read_raw(table,prob_dtype),pname,fname,params,
+                    time.time()-start)
+            nbytes = df.memory_usage(index=True).sum()
+            st.add(rows=df.shape[0],nbytes=int(nbytes))
+            print_mem_time("Loaded {} {} {:.2f} seconds {:.1f} MB".format(fname.split('/')[-1],
+                df.shape,time.time()-start,nbytes/1024.0/1024.0))
+        return df
+
+    def query(self,name,chunksize=CHUNK,budget=BUDGET):
+        """
+            out-of-core query over the column cache of a table, e.g.
+            self.query('orders').groupby('user_id').agg({'order_id':'list'}).to_frame()
+            Return: chunkQuery, see utils.pd_utils.chunk_query
+        """
+        if name not in self.data:
+            raise KeyError(name)
+        # builds or validates the cache, columns are only memory mapped
+        self.data[name]
+        return chunkQuery(self.sources[name],chunksize=chunksize,budget=budget,
+            tmp="%s/tmp"%self.flags.data_path)
+
+    def _cache_params(self,table,prob_dtype):
+        return {"dtype":table.dtype,"prob_dtype":prob_dtype,"sep":self.sp}
+
+    def _read_raw(self,table,prob_dtype=False):
+        fname,dtype = table.fname,table.dtype
+        if not dtype and prob_dtype:
+            profile = self._probe(fname,silent=getattr(self.flags,'verbosity',0)<=0)
+            return read_csv_typed(fname,profile,sep=self.sp)
+        return pd.read_csv(fname,dtype=dtype,sep=self.sp)
+
+    def _cache_name(self,path,name):
+        return "%s/%s"%(path,name.split('/')[-1].split('.')[0])
+
+    def _load_cache(self,pname,fname=None,params=None):
+        """
+            pname: cache name without extension
+            fname,params: raw file and loading parameters the table
+                is derived from, the cache is rebuilt if either changes
+            Return: the cached table with memory mapped columns,
+                None if it is not cached or stale.
+            an old whole-file pickle is converted to the columnar cache once.
+        """
+        tname = "%s.col"%pname
+        cache = get_cache(self.flags.data_path)
+        if not is_table(tname) and os.path.exists("%s.pkl"%pname) and tname not in cache.manifest['artifacts']:
+            print("convert %s.pkl to columnar cache"%pname)
+            save_table(pd.read_pickle("%s.pkl"%pname),tname)
+            gc.collect()
+        key = cache.key("pd_DB.table",[fname] if fname else [],params)
+        if not is_table(tname):
+            with cache.lock:
+                cache.misses += 1
+        elif cache.check(tname,key):
+            return load_table(tname,categorical=getattr(self,'categorical',False))
+        return None
+
+    def _save_cache(self,df,pname,fname=None,params=None,seconds=0.0):
+        # reload through mmap so the parsed frame can be freed
+        tname = "%s.col"%pname
+        save_table(df,tname)
+        del df
+        gc.collect()
+        cache = get_cache(self.flags.data_path)
+        cache.commit(tname,cache.key("pd_DB.table",[fname] if fname else [],params),seconds)
+        return load_table(tname,categorical=getattr(self,'categorical',False))
 
     def _get_dtype(self,fname,silent=False):
-        data = pd.read_csv(fname,sep=self.sp).fillna(0)
-        cols = data.columns.values
-        dtype = {}
-        for col in cols:
-            if data[col].dtype == np.float64:
-                dtype[col] = np.float32
-            elif data[col].dtype == np.int64:
-                x = data[col].unique()
-                mx = np.max(x)
-                mi = np.min(x)
-                if -128<mi and mx<127:
-                    dtype[col] = np.int8
-                elif 0<=mi and mx<256:
-                    dtype[col] = np.uint8
-                elif -32768<mi and mx< 32767:
-                    dtype[col] = np.int16
-                elif 0<=mi and mx<65535:
-                    dtype[col] = np.uint16
-                elif -2147483648<mi and mx< 2147483648:
-                    dtype[col] = np.int32
-                else:
-                    dtype[col] = np.int64
-            else:
-                dtype[col] = data[col].dtype
+        return self._probe(fname,silent)['dtype']
+
+    def _probe(self,fname,silent=False):
+        profile = probe_csv(fname,sep=self.sp)
+        dtype = profile['dtype']
         if not silent:
             print("\n {} {} \n".format(fname,dtype))
         with open('%s/dtype.txt'%self.flags.data_path,'a') as fo:
             fo.write("{} {} \n".format(fname,dtype))
-        del data
-        gc.collect()
-        return dtype
+        return profile
 
     def snoop(self):
         raise NotImplementedError()
@@ -93,3 +184,73 @@ class pd_DB(object):
     def clear(self):
         del self.data
         gc.collect()
+
+class lazyTables(MutableMapping):
+    """
+    a {} name -> pd.DataFrame that calls the loader of a table
+    the first time the table is accessed
+    categorical columns of the tables of a share_vocab group, e.g.
+    ['train','test'], share one vocabulary per column name so codes agree
+    between them; other tables are left as they are loaded
+    """
+    def __init__(self,share_vocab=None):
+        self.loaders = {}
+        self.tables = {}
+        self.locks = {}
+        self.share_vocab = [list(i) for i in share_vocab or []]
+        self.lock = Lock()
+
+    def add(self,name,loader):
+        self.loaders[name] = loader
+        self.locks[name] = Lock()
+        self.tables.pop(name,None)
+
+    def is_loaded(self,name):
+        return name in self.tables
+
+    def __contains__(self,name):
+        # the Mapping default would load the table
+        return name in self.loaders
+
+    def __getitem__(self,name):
+        if name in self.tables:
+            return self.tables[name]
+        if name not in self.loaders:
+            raise KeyError(name)
+        with self.locks[name]:
+            if name not in self.tables:
+                df = self.loaders[name]()
+                with self.lock:
+                    peers = set(i for group in self.share_vocab if name in group
+                        for i in group if i != name and i in self.tables)
+                    if peers:
+                        union_categories([self.tables[i] for i in sorted(peers)]+[df])
+                    self.tables[name] = df
+        return self.tables[name]
+
+    def __setitem__(self,name,df):
+        self.tables[name] = df
+        self.loaders.setdefault(name,None)
+        self.locks.setdefault(name,Lock())
+
+    def __delitem__(self,name):
+        del self.loaders[name]
+        del self.locks[name]
+        self.tables.pop(name,None)
+
+    def __iter__(self):
+        return iter(self.loaders)
+
+    def __len__(self):
+        return len(self.loaders)
+
+    def __repr__(self):
+        return "lazyTables(loaded=%s, lazy=%s)"%([i for i in self.loaders if i in self.tables],
+            [i for i in self.loaders if i not in self.tables])
+
+def _warm_table(args):
+    # runs in a worker process, only writes the table cache
+    cls,state,table,prob_dtype = args
+    db = cls.__new__(cls)
+    db.__dict__.update(state)
+    db._load_table(table,prob_dtype)
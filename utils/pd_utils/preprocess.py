@@ -0,0 +1,165 @@
+"""
+streaming preprocessors that are fit on train and applied to test
+partial_fit takes one chunk at a time and merges its per column count, mean
+and sum of squared deviations into the running ones (Welford/Chan), so a
+file larger than memory is fit by feeding pd.read_csv(chunksize=...) chunks.
+transform rewrites the columns of a chunk one at a time as float32, the
+state is a small json-able dict that can be saved next to the features.
+
+    norm = Normalizer()
+    for chunk in pd.read_csv(fname,chunksize=1<<20):
+        norm.partial_fit(chunk)
+    norm.save("norm.json")
+    test = norm.transform(test)
+"""
+import json
+import numpy as np
+import pandas as pd
+from utils.pd_utils.utils import num_cols
+
+class streamMoments(object):
+
+    def __init__(self,cols=None):
+        """
+            cols: columns to fit, None for the numeric columns of the first chunk
+        """
+        self.cols = None if cols is None else list(cols)
+        self.n = None # non-null rows per column
+        self.nulls = None
+        self.mean = None # nan for columns with no value yet
+        self.m2 = None # sum of squared deviations from the mean
+
+    def partial_fit(self,df):
+        if self.cols is None:
+            self.cols = num_cols(df)
+        k = len(self.cols)
+        if self.n is None:
+            self.n = np.zeros(k)
+            self.nulls = np.zeros(k)
+            self.mean = np.full(k,np.nan)
+            self.m2 = np.zeros(k)
+        for c,col in enumerate(self.cols):
+            x = df[col].values.astype(np.float64)
+            null = np.isnan(x)
+            nb = x.shape[0]-null.sum()
+            self.nulls[c] += null.sum()
+            if nb == 0:
+                continue
+            x = x[~null]
+            mb = x.mean()
+            m2b = np.square(x-mb).sum()
+            # merge the moments of the chunk into the running ones
+            na = self.n[c]
+            if na == 0:
+                self.mean[c],self.m2[c],self.n[c] = mb,m2b,nb
+                continue
+            n = na+nb
+            delta = mb-self.mean[c]
+            self.mean[c] += delta*nb/n
+            self.m2[c] += m2b+delta*delta*na*nb/n
+            self.n[c] = n
+        return self
+
+    def fit(self,df):
+        self.n = None
+        return self.partial_fit(df)
+
+    def fit_transform(self,df,**kw):
+        return self.fit(df).transform(df,**kw)
+
+    def std(self,ddof=1):
+        return np.sqrt(self.m2/np.maximum(self.n-ddof,1))
+
+    def transform(self,df,dtype=np.float32):
+        """
+            rewrites the fitted columns of df in place, one column at a time
+            Return: df
+        """
+        for c,col in enumerate(self.cols):
+            if col not in df.columns or not self._applies(df[col]):
+                continue
+            # in float64, a large offset (epoch seconds) is removed before
+            # the values are rounded to dtype
+            x = df[col].values.astype(np.float64)
+            df[col] = self._transform(c,x).astype(dtype)
+        return df
+
+    def get_state(self):
+        state = {"class":self.__class__.__name__,"cols":self.cols}
+        for name in ['n','nulls','mean','m2']:
+            state[name] = None if getattr(self,name) is None else getattr(self,name).tolist()
+        state.update(self._params())
+        return state
+
+    def set_state(self,state):
+        self.cols = state['cols']
+        for name in ['n','nulls','mean','m2']:
+            setattr(self,name,None if state[name] is None else np.array(state[name],dtype=np.float64))
+        return self
+
+    def save(self,path):
+        with open(path,'w') as fo:
+            json.dump(self.get_state(),fo)
+
+    @classmethod
+    def load(cls,path):
+        with open(path) as f:
+            state = json.load(f)
+        obj = cls(**{k:state[k] for k in cls._param_names})
+        return obj.set_state(state)
+
+    _param_names = []
+
+    def _applies(self,s):
+        return True
+
+    def _params(self):
+        return {k:getattr(self,k) for k in self._param_names}
+
+class Normalizer(streamMoments):
+    """
+    (x-mean)/std per column, constant columns are only centered
+    """
+    _param_names = ['ddof']
+
+    def __init__(self,cols=None,ddof=1):
+        super(Normalizer,self).__init__(cols)
+        self.ddof = ddof
+
+    def _transform(self,c,x):
+        if self.n[c] == 0:
+            # no value at fit time, nothing to center on
+            return x
+        std = self.std(self.ddof)[c]
+        x -= self.mean[c]
+        if std > 0:
+            x /= std
+        return x
+
+class MeanImputer(streamMoments):
+    """
+    fill nulls with the mean of the fitted column, a column that had no
+    value at fit time stays null
+    """
+    def _applies(self,s):
+        # integer columns have no nulls to fill
+        return s.dtype.kind == 'f'
+
+    def _transform(self,c,x):
+        x[np.isnan(x)] = self.mean[c]
+        return x
+
+def stream_transform(pre,fname,out,chunksize=1<<20,fit=True,**kw):
+    """
+        fit pre on the csv fname in one chunked pass (unless fit is False),
+        then write the transformed chunks to the csv out in a second pass
+    """
+    if fit:
+        pre.n = None
+        for chunk in pd.read_csv(fname,chunksize=chunksize,**kw):
+            pre.partial_fit(chunk)
+    header = True
+    for chunk in pd.read_csv(fname,chunksize=chunksize,**kw):
+        pre.transform(chunk).to_csv(out,mode='w' if header else 'a',header=header,index=False)
+        header = False
+    return pre
@@ -0,0 +1,262 @@
+"""
+vectorized target encoding of categorical columns and column crosses
+every key is turned into int codes once, per category sums are computed
+with np.bincount (per fold for out-of-fold encoding) and rows are encoded
+by indexing the per category tables with their codes.
+"""
+import numpy as np
+import pandas as pd
+from utils.pd_utils.utils import categories
+
+STATS = ['mean','std','count','rank']
+
+class TargetEncoder(object):
+
+    def __init__(self,cols,stats=('mean',),smooth=0,min_count=1,unseen='prior',tag=''):
+        """
+            Input:
+                cols: list of keys, a key is a column name or a
+                    tuple of column names for their cross
+                stats: any of mean, std, count, rank
+                    rank is the position of the mean of a category
+                    among the means of all categories seen in fit
+                smooth: the mean of a category with n rows is
+                    (sum+smooth*prior)/(n+smooth), prior the global mean
+                min_count: categories with fewer rows are treated as unseen
+                unseen: 'prior' encodes unseen categories with the global
+                    mean/std (and the rank of the global mean), 'nan' with nan
+                tag: prefix of the encoded column names
+        """
+        for stat in stats:
+            if stat not in STATS:
+                raise ValueError("unknown stat %s"%stat)
+        if unseen not in ['prior','nan']:
+            raise ValueError("unknown unseen mode %s"%unseen)
+        self.keys = [tuple(i) if isinstance(i,(list,tuple)) else (i,) for i in cols]
+        self.stats = list(stats)
+        self.smooth = smooth
+        self.min_count = max(min_count,1)
+        self.unseen = unseen
+        self.tag = tag
+
+    def names(self):
+        names = []
+        for key in self.keys:
+            name = self.tag+'_'.join(str(i) for i in key)
+            if len(self.stats) == 1:
+                names.append(name)
+            else:
+                names.extend("%s_%s"%(name,stat) for stat in self.stats)
+        return names
+
+    def fit(self,df,y):
+        """
+            Input:
+                df: pd.DataFrame with the key columns
+                y: name of the target column or array of targets
+            keeps per category tables of the full df, used by transform
+        """
+        y,valid = _target(df,y)
+        self.vocab = {}
+        self.tables = {}
+        self._codes = {}
+        for key in self.keys:
+            codes = self._fit_codes(df,key)
+            self._codes[key] = codes
+            n = len(self.vocab[key][1])
+            cnt,s,ss = _sums(codes,y,valid,n)
+            prior,prior_std = _prior(cnt.sum(),s.sum(),ss.sum())
+            self.tables[key] = self._table(cnt,s,ss,prior,prior_std)
+        return self
+
+    def transform(self,df):
+        """
+            encode df with the tables of fit, e.g. validation or test
+            Return: pd.DataFrame of encodings with the index of df
+        """
+        res = []
+        for key in self.keys:
+            codes = self._transform_codes(df,key)
+            table = self.tables[key]
+            for stat in self.stats:
+                res.append(_take(table[stat],codes))
+        return self._frame(res,df.index)
+
+    def fit_transform(self,df,y,folds=None,loo=False):
+        """
+            Input:
+                folds: None, array of fold ids per row, or a list of
+                    (train index, validation index) pairs like a KFold split.
+                    A row is encoded with the stats of the other folds,
+                    rows outside every validation fold with the full stats.
+                loo: leave-one-out, a row is encoded with the stats
+                    of its category without the row itself
+                neither: in sample encoding, which overfits
+            Return: pd.DataFrame of encodings of df
+        """
+        self.fit(df,y)
+        if folds is None and not loo:
+            res = []
+            for key in self.keys:
+                for stat in self.stats:
+                    res.append(_take(self.tables[key][stat],self._codes[key]))
+            return self._frame(res,df.index)
+        y,valid = _target(df,y)
+        if folds is not None:
+            folds = fold_ids(folds,df.shape[0])
+        res = []
+        for key in self.keys:
+            codes = self._codes[key]
+            if loo:
+                res.extend(self._loo(codes,y,valid))
+            else:
+                res.extend(self._oof(key,codes,y,valid,folds))
+        self._codes = {}
+        return self._frame(res,df.index)
+
+    def _oof(self,key,codes,y,valid,folds):
+        n = len(self.vocab[key][1])
+        k = folds.max()+1
+        # per (fold, category) sums in one pass, out of fold = total - own fold
+        infold = valid & (folds>=0) & (codes>=0)
+        idx = folds[infold]*n+codes[infold]
+        cnt = np.bincount(idx,minlength=k*n).reshape(k,n)
+        s = np.bincount(idx,weights=y[infold],minlength=k*n).reshape(k,n)
+        ss = np.bincount(idx,weights=y[infold]**2,minlength=k*n).reshape(k,n)
+        tcnt,ts,tss = _sums(codes,y,valid,n)
+        full = self.tables[key]
+        res = [_take(full[stat],codes) for stat in self.stats]
+        for f in range(k):
+            rows = folds == f
+            prior,prior_std = _prior(tcnt.sum()-cnt[f].sum(),ts.sum()-s[f].sum(),tss.sum()-ss[f].sum())
+            table = self._table(tcnt-cnt[f],ts-s[f],tss-ss[f],prior,prior_std)
+            for i,stat in enumerate(self.stats):
+                res[i][rows] = _take(table[stat],codes[rows])
+        return res
+
+    def _loo(self,codes,y,valid):
+        n = codes.max()+1 if codes.shape[0] else 0
+        tcnt,ts,tss = _sums(codes,y,valid,n)
+        prior,prior_std = _prior(tcnt.sum(),ts.sum(),tss.sum())
+        # remove each row from the sums of its own category
+        c = np.maximum(codes,0)
+        own = (valid & (codes>=0)).astype(np.float64)
+        yv = np.where(valid,y,0)
+        vals = self._values(tcnt[c]-own,ts[c]-yv*own,tss[c]-yv*yv*own,prior,prior_std,
+            ranked=self._ranked(tcnt,ts,prior))
+        res = []
+        for stat in self.stats:
+            res.append(np.where(codes>=0,vals[stat],vals['unseen_'+stat]))
+        return res
+
+    def _table(self,cnt,s,ss,prior,prior_std):
+        """
+            Return: {} stat -> value per category, with one extra
+                slot at the end for unseen categories
+        """
+        vals = self._values(cnt,s,ss,prior,prior_std,ranked=self._ranked(cnt,s,prior))
+        return {stat:np.append(vals[stat],vals['unseen_'+stat]) for stat in self.stats}
+
+    def _values(self,cnt,s,ss,prior,prior_std,ranked):
+        # stats of categories with cnt rows summing to s, squares to ss
+        cnt = cnt.astype(np.float64)
+        seen = cnt>=self.min_count
+        fill = self.unseen == 'prior'
+        mean = self._mean(cnt,s,prior)
+        vals = {}
+        for stat in self.stats:
+            if stat == 'count':
+                vals[stat] = cnt
+                vals['unseen_count'] = 0.0
+            elif stat == 'mean':
+                vals['unseen_mean'] = prior if fill else np.nan
+                vals[stat] = np.where(seen,mean,vals['unseen_mean'])
+            elif stat == 'std':
+                var = (ss-s*s/np.maximum(cnt,1))/np.maximum(cnt-1,1)
+                vals['unseen_std'] = prior_std if fill else np.nan
+                vals[stat] = np.where(seen & (cnt>1),np.sqrt(np.maximum(var,0)),vals['unseen_std'])
+            else:
+                # ties share a rank
+                vals['unseen_rank'] = float(np.searchsorted(ranked,prior)) if fill else np.nan
+                vals[stat] = np.where(seen,np.searchsorted(ranked,mean),vals['unseen_rank'])
+        return vals
+
+    def _ranked(self,cnt,s,prior):
+        # sorted means of the categories seen in the fitting rows
+        seen = cnt>=self.min_count
+        return np.sort(self._mean(cnt,s,prior)[seen])
+
+    def _mean(self,cnt,s,prior):
+        return (s+self.smooth*prior)/np.maximum(cnt+self.smooth,1e-12)
+
+    def _fit_codes(self,df,key):
+        vocabs,codes = [],None
+        for col in key:
+            cats = categories(df[col])
+            c = pd.Categorical(df[col].values,categories=cats).codes.astype(np.int64)
+            codes = c if codes is None else _cross(codes,c,len(cats))
+            vocabs.append(cats)
+        uniq,inv = np.unique(codes[codes>=0],return_inverse=True)
+        res = np.full(codes.shape[0],-1,dtype=np.int64)
+        res[codes>=0] = inv
+        self.vocab[key] = (vocabs,uniq)
+        return res
+
+    def _transform_codes(self,df,key):
+        vocabs,uniq = self.vocab[key]
+        codes = None
+        for col,cats in zip(key,vocabs):
+            c = pd.Categorical(df[col].values,categories=cats).codes.astype(np.int64)
+            codes = c if codes is None else _cross(codes,c,len(cats))
+        pos = np.searchsorted(uniq,codes)
+        pos = np.minimum(pos,max(len(uniq)-1,0))
+        found = (codes>=0) & (len(uniq)>0)
+        if len(uniq):
+            found &= uniq[pos]==codes
+        return np.where(found,pos,-1)
+
+    def _frame(self,res,index):
+        return pd.DataFrame(dict(zip(self.names(),res)),index=index,columns=self.names())
+
+def fold_ids(folds,n):
+    """
+        Input:
+            folds: array of fold ids, or a list of (train index,
+                validation index) pairs
+        Return: int32 array, the validation fold of each row, -1 for none
+    """
+    if isinstance(folds,np.ndarray) and folds.ndim == 1 and folds.shape[0] == n:
+        return folds.astype(np.int32)
+    ids = np.full(n,-1,dtype=np.int32)
+    for k,(tr,va) in enumerate(folds):
+        ids[va] = k
+    return ids
+
+def _target(df,y):
+    y = df[y].values if isinstance(y,str) else np.asarray(y)
+    y = y.astype(np.float64)
+    valid = ~np.isnan(y)
+    return np.where(valid,y,0),valid
+
+def _sums(codes,y,valid,n):
+    mask = valid & (codes>=0)
+    c = codes[mask]
+    cnt = np.bincount(c,minlength=n)
+    s = np.bincount(c,weights=y[mask],minlength=n)
+    ss = np.bincount(c,weights=y[mask]**2,minlength=n)
+    return cnt,s,ss
+
+def _prior(cnt,s,ss):
+    if cnt == 0:
+        return np.nan,np.nan
+    mean = s/cnt
+    var = (ss-s*s/cnt)/max(cnt-1,1)
+    return mean,np.sqrt(max(var,0))
+
+def _cross(codes,c,n):
+    # pair codes of two columns, missing if either is missing
+    return np.where((codes>=0) & (c>=0),codes*(n+1)+c,-1)
+
+def _take(table,codes):
+    # code -1 picks up the unseen slot at the end of the table
+    return table[np.where(codes>=0,codes,table.shape[0]-1)]
@@ -2,16 +2,62 @@ import pandas as pd
 import numpy as np
 
 def random_batch_gen(df,batch_size):
+    from utils.pd_utils.batch_sampler import batchSampler
     B = batch_size
-    frac = B*1.0/df.shape[0]
     print("run %d batches for 1 epoch"%(df.shape[0]//B))
-    for j in range(df.shape[0]//B):
-        x = df.sample(frac=frac).values
+    for x,_,_ in batchSampler(df,batch_size=B,dtype=None):
         yield x
 
 def series_equal(s1,s2):
     return (s1==s2).all()
 
+def is_cat(s):
+    # python strings or dictionary encoded codes + vocabulary
+    return isinstance(s.dtype,pd.CategoricalDtype) or s.dtype=='object' or pd.api.types.is_string_dtype(s.dtype)
+
+def cat_cols(df):
+    return [i for i in df.columns.values if is_cat(df[i])]
+
+def num_cols(df):
+    return [i for i in df.columns.values if not is_cat(df[i])]
+
+def union_categories(dfs,cols=None):
+    """
+        Input:
+            dfs: list of data frames, e.g. [train,test]
+            cols: columns to share, None for every categorical column
+        give each column one vocabulary shared by all dfs, in place,
+        so a code means the same value in train and test and concat/merge
+        stay categorical. New values are appended, codes already handed
+        out keep their meaning. A string column that is categorical in
+        another frame is encoded as well.
+        Return: {} column name -> shared categories
+    """
+    if cols is None:
+        cols = []
+        for df in dfs:
+            cols.extend([i for i in df.columns.values if i not in cols and 
+                isinstance(df[i].dtype,pd.CategoricalDtype)])
+    vocab = {}
+    for col in cols:
+        frames = [df for df in dfs if col in df.columns]
+        cats = None
+        for df in frames:
+            new = categories(df[col])
+            cats = new if cats is None else cats.append(new.difference(cats,sort=False))
+        for df in frames:
+            s = df[col]
+            if isinstance(s.dtype,pd.CategoricalDtype) and s.cat.categories.equals(cats):
+                continue
+            df[col] = pd.Categorical(s.values,categories=cats)
+        vocab[col] = cats
+    return vocab
+
+def categories(s):
+    if isinstance(s.dtype,pd.CategoricalDtype):
+        return s.cat.categories
+    return pd.Index(pd.unique(s.dropna().values))
+
 def sequential_iterate_df(df,batch_size):
     def _chunker(df, size):
         return (df[pos:pos + size] for pos in range(0, df.shape[0], size))
@@ -33,15 +79,18 @@ def rm_categorical_cols(df,cols=None):
     bad = None
     if cols is None:
         cols = df.columns.values
-    bad = [i for i in cols if df[i].dtype=='object']
+    bad = [i for i in cols if is_cat(df[i])]
     print("categorical cols {}".format(bad))
     df.drop(bad,axis=1,inplace=True)
     
-def normalize(df,cols=None):
+def normalize(df,cols=None,dtype=np.float32):
+    """
+        fit and apply on one frame, see utils.pd_utils.preprocess.Normalizer
+        to fit on train, apply to test or stream chunks from disk
+    """
+    from utils.pd_utils.preprocess import Normalizer
     print("normalize ...")
-    if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype!='object']
-    df[cols] = (df[cols] - df[cols].mean())/df[cols].std()
+    return Normalizer(cols).fit_transform(df,dtype=dtype)
 
 def impute(df,cols=None,mode="mean"):
     print("impute %s ..."%mode)
@@ -51,10 +100,9 @@ def impute(df,cols=None,mode="mean"):
         print("unknown mode",mode)
         assert 0
 
-def impute_mean(df,cols):
-    if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype!='object']
-    df[cols] = df[cols].fillna(df[cols].mean())
+def impute_mean(df,cols,dtype=np.float32):
+    from utils.pd_utils.preprocess import MeanImputer
+    return MeanImputer(cols).fit_transform(df,dtype=dtype)
 
 def rm_const_cols(df,bar=0.999):
     print("remove const cols ...")
@@ -72,130 +120,160 @@ def rm_const_cols(df,bar=0.999):
     return const
 
 def get_ymd(df,col,deli='-',order="ymd"):
+    from utils.pd_utils.datetime_fea import date_parts
     print("get year month day ...")
-    def _parse_order(order):
-        return {i:c for c,i in enumerate(order)}
-    order_dic = _parse_order(order) 
-    df["year"] = df[col].apply(lambda x: x.split(deli)[order_dic['y']]).astype(int)
-    df["month"] = df[col].apply(lambda x: x.split(deli)[order_dic['m']]).astype(int)
-    df["day"] = df[col].apply(lambda x: x.split(deli)[order_dic['d']]).astype(int)
-    df["time"] = ((df["year"]-df["year"].min())*12 + df["month"]-1)*30 + df["day"]
+    for name,vals in date_parts(df[col],deli,order).items():
+        df[name] = vals
+    year = df["year"].values.astype(np.int32)
+    df["time"] = ((year-year[year>=0].min())*12 + df["month"].values-1)*30 + df["day"].values
 
 def count_missing_per_row(df):
     print("count missinv values per row ...")
-    df['num_missing'] = df.isnull().sum(axis=1)
+    # one column at a time, without a full size boolean frame
+    cnt = np.zeros(df.shape[0],dtype=np.int32)
+    for col in df.columns.values:
+        cnt += df[col].isnull().values
+    df['num_missing'] = cnt
 
-#overfitting! try LOO!
-def rank_cat(df_tr,ycol,df_te=None,cols=None,rank=True,tag=''):
-    if cols is None:
-        cols = [i for i in df_tr.columns.values if df_tr[i].dtype=='object']
-    if len(cols)==0:
-        print("no cat cols found")
-        return
-    for col in cols:
-        dic = df_tr.groupby(col)[ycol].mean().to_dict()
-        if rank:
-            ks = [i for i in dic]
-            vs = np.array([dic[i] for i in ks]).argsort().argsort()
-            dic = {i:j for i,j in zip(ks,vs)}
-        df_tr[tag+col] = df_tr[col].apply(lambda x: dic[x])
-        if df_te is not None:
-            df_te[tag+col] = df_te[col].apply(lambda x: dic.get(x,np.nan))
-
-#overfitting! try LOO!
-def std_cat(df_tr,ycol,df_te=None,cols=None,tag=''):
+# in sample encoding overfits, pass folds or loo=True
+def rank_cat(df_tr,ycol,df_te=None,cols=None,rank=True,tag='',folds=None,loo=False):
+    encode_cat(df_tr,ycol,df_te,cols,['rank' if rank else 'mean'],tag,folds,loo)
+
+# in sample encoding overfits, pass folds or loo=True
+def std_cat(df_tr,ycol,df_te=None,cols=None,tag='',folds=None,loo=False):
+    encode_cat(df_tr,ycol,df_te,cols,['std'],tag,folds,loo)
+
+def encode_cat(df_tr,ycol,df_te=None,cols=None,stats=('mean',),tag='',folds=None,loo=False,**kw):
+    """
+        add target encodings of cols to df_tr and df_te in place
+        cols: categorical columns or tuples of columns for their crosses
+        folds: fold ids or (train,validation) pairs for out-of-fold encoding of df_tr
+        see utils.pd_utils.target_encoder.TargetEncoder for the other options
+    """
+    from utils.pd_utils.target_encoder import TargetEncoder
     if cols is None:
-        cols = [i for i in df_tr.columns.values if df_tr[i].dtype=='object']
+        cols = [i for i in cat_cols(df_tr) if i!=ycol]
     if len(cols)==0:
         print("no cat cols found")
         return
-    for col in cols:
-        dic = df_tr.groupby(col)[ycol].std().to_dict()
-        df_tr[tag+col] = df_tr[col].apply(lambda x: dic[x])
-        if df_te is not None:
-            df_te[tag+col] = df_te[col].apply(lambda x: dic.get(x,np.nan))    
+    kw.setdefault('unseen','nan')
+    enc = TargetEncoder(cols,stats=stats,tag=tag,**kw)
+    res = enc.fit_transform(df_tr,ycol,folds=folds,loo=loo)
+    for col in res.columns:
+        df_tr[col] = res[col].values
+    if df_te is not None:
+        res = enc.transform(df_te)
+        for col in res.columns:
+            df_te[col] = res[col].values
+    return enc
 
-def same_dtype_of_two_df(df1,df2):
+def same_dtype_of_two_df(df1,df2,report=None):
+    if report is None:
+        report = _drift(df1,df2)
     res = True
-    for col in df1.columns.values:
-        if col not in df2.columns.values:
-            continue
-        if df1[col].dtype!=df2[col].dtype:
-            print(col,df1[col].dtype,df2[col].dtype)
+    for col,r in report.iterrows():
+        if r['a_rows'] and r['b_rows'] and r['a_dtype']!=r['b_dtype']:
+            print(col,r['a_dtype'],r['b_dtype'])
             res = False
     print("yes" if res else "no")
 
-def same_set_of_two_df(df1,df2,cols=None):
-    res = True
+def same_set_of_two_df(df1,df2,cols=None,report=None):
+    """
+        values only in one of the frames, listed if fewer than 10 and
+        estimated from sketches for high cardinality columns
+    """
     if cols is None:
-        cols = [i for i in df1.columns.values if df1[i].dtype=='object']
-    for col in cols:
-        if col not in df2.columns.values:
+        cols = cat_cols(df1) if isinstance(df1,pd.DataFrame) else None
+    if report is None:
+        report = _drift(df1,df2,cols)
+    res = True
+    for col,r in report.iterrows():
+        if cols is not None and col not in cols:
+            continue
+        if not r['a_rows'] or not r['b_rows']:
             continue
-        s1 = set(df1[col].map(str).unique().tolist())
-        s2 = set(df2[col].map(str).unique().tolist())
-        if s1!=s2:
-            if len(s1-s2)<10 and len(s2-s1)<10:               
-                print(col,s1-s2,s2-s1)
+        if cols is None and not _cat_dtype(r['a_dtype']) and not _cat_dtype(r['b_dtype']):
+            # csv inputs, categorical columns are only known from the report
+            continue
+        d1,d2 = r['a_only'],r['b_only']
+        if d1 or d2:
+            if isinstance(d1,list) and isinstance(d2,list):
+                print(col,set(d1),set(d2))
             else:
-                print(col,len(s1-s2),len(s2-s1))
+                print(col,len(d1) if isinstance(d1,list) else d1,len(d2) if isinstance(d2,list) else d2)
             res = False
     print("yes" if res else "no")
 
-def same_range_of_two_df(df1,df2,cols=None):
+def same_range_of_two_df(df1,df2,cols=None,report=None):
     if cols is None:
-        cols = [i for i in df1.columns.values if df1[i].dtype!='object']
+        cols = num_cols(df1) if isinstance(df1,pd.DataFrame) else None
+    if report is None:
+        report = _drift(df1,df2,cols)
     res = True
-    for col in cols:
-        if df1[col].dtype=='object':
+    for col,r in report.iterrows():
+        if cols is not None and col not in cols:
             continue
-        if col not in df2.columns.values:
+        if pd.isnull(r['a_min']) or pd.isnull(r['b_min']):
             continue
-        if df1[col].min()!=df2[col].min() or df1[col].max()!=df2[col].max():
-            print(col,[df1[col].min(),df1[col].max()],[df2[col].min(),df2[col].max()])
+        if r['a_min']!=r['b_min'] or r['a_max']!=r['b_max']:
+            print(col,[r['a_min'],r['a_max']],[r['b_min'],r['b_max']])
             res = False
     print("yes" if res else "no")
 
+def _cat_dtype(names):
+    # dtype names of a drift report column, is_cat of any of them
+    for name in names.split(','):
+        try:
+            dtype = pd.api.types.pandas_dtype(name)
+        except TypeError:
+            return True
+        if isinstance(dtype,pd.CategoricalDtype) or dtype=='object' or pd.api.types.is_string_dtype(dtype):
+            return True
+    return False
+
+def _drift(df1,df2,cols=None):
+    # one pass over both frames or csv files serves all the checks
+    from utils.pd_utils.drift import drift_report
+    return drift_report(df1,df2,cols=cols,names=('a','b'))
+
 def plot_fea_vs_target(df,ycol,path,tag='',cols=None):
     from utils.draw.sns_draw import scatter
     if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype!='object']
+        cols = num_cols(df)
     for col in cols:
         scatter(df[col],df[ycol],xlabel=col,ylabel=ycol,name="%s/%s-%s.png"%(path,col,tag),title=tag)
 
-def corr_fea(df,cols,de=None,bar=0.9):
-    from scipy.stats import pearsonr
+def corr_fea(df,cols,de=None,bar=0.9,sample=None):
+    from utils.np_utils.corr import corr_pairs
     xcols = []
-    for c,i in enumerate(cols[:-1]):
-        for j in cols[c+1:]:
-            if i==j:
-                continue
-            #score = pearsonr(df[i],df[j])[0]
-            score = df[i].corr(df[j])
-            #print(i,j,score)
-            if score>bar:
-                df["%s-%s"%(i,j)] = df[i]-df[j]
-                if de is not None:
-                    de["%s-%s"%(i,j)] = de[i]-de[j]
-                xcols.append(j)
-            if score<-bar:
-                df["%s+%s"%(i,j)] = df[i]+df[j]
-                if de is not None:
-                    de["%s+%s"%(i,j)] = de[i]+de[j]
-                xcols.append(j)
+    I,J,S = corr_pairs(df[cols],bar,sample=sample)
+    for i,j,score in zip(I,J,S):
+        i,j = cols[i],cols[j]
+        if i==j:
+            continue
+        if score>bar:
+            df["%s-%s"%(i,j)] = df[i]-df[j]
+            if de is not None:
+                de["%s-%s"%(i,j)] = de[i]-de[j]
+            xcols.append(j)
+        if score<-bar:
+            df["%s+%s"%(i,j)] = df[i]+df[j]
+            if de is not None:
+                de["%s+%s"%(i,j)] = de[i]+de[j]
+            xcols.append(j)
     return xcols
 
-def rm_corr(df,cols=None,de=None,bar=0.99):
+def rm_corr(df,cols=None,de=None,bar=0.99,sample=None):
+    """
+        drop the later column of every pair with correlation > bar
+        sample: rows of a quick first pass, see utils.np_utils.corr.corr_pairs
+    """
+    from utils.np_utils.corr import corr_pairs
     if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype!='object']
-    bad = []
-    for c,i in enumerate(cols[:-1]):
-        for j in cols[c+1:]:
-            if i==j:
-                continue
-            score = df[i].corr(df[j])
-            if score>bar:
-                bad.append(j)
+        cols = num_cols(df)
+    cols = list(cols)
+    I,J,S = corr_pairs(df[cols],bar,sample=sample)
+    bad = [cols[j] for i,j,score in zip(I,J,S) if score>bar and cols[i]!=cols[j]]
     bad = list(set(bad))
     print("rm ",bad)
     df.drop(bad,axis=1,inplace=True)
@@ -0,0 +1,261 @@
+"""
+nested stage profiler
+a stage records wall and cpu seconds, rss of this process at its start and
+end, peak rss while it ran, and the rows and bytes it processed. Stages
+nest, a record is named by its path "load/orders". print_mem_time and
+mark() add point records to the current stage. Records are written to a
+run report at exit (STAGE_REPORT=path or set_report), .csv or .json (one
+json record per line), appended so every process of a pipeline adds its
+rows to the same report.
+
+    with stage('load',rows=df.shape[0]) as st:
+        ...
+        st.add(nbytes=df.memory_usage().sum())
+
+    @stage('train')
+    def train(...):
+
+sample=True (or STAGE_SAMPLE=name of the stage) runs a stack sampler while
+the stage is open and writes collapsed stacks "f;g;h count" next to the
+report, the input of flamegraph.pl.
+pure python, the pypy2 scripts use it too. peak rss is per stage on linux
+(the high water mark is reset at every stage start), the process peak so far
+elsewhere; stages running at once in threads share it.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+
+FIELDS = ['pid','kind','name','depth','start','wall','cpu','rss_start','rss_end','peak_rss','rows','bytes']
+SAMPLE_INTERVAL = 0.005 # seconds between stack samples
+
+_start = time.time()
+_local = threading.local() # every thread nests its own stages
+_records = []
+_report = {"path":os.environ.get('STAGE_REPORT')}
+
+class stage(object):
+
+    def __init__(self,name,rows=0,nbytes=0,sample=None):
+        """
+            rows,nbytes: processed by the stage, also counted with add()
+            sample: run the stack sampler, None to follow STAGE_SAMPLE
+        """
+        self.name = name
+        self.rows = rows
+        self.nbytes = nbytes
+        self.sample = sample
+
+    def add(self,rows=0,nbytes=0):
+        self.rows += rows
+        self.nbytes += nbytes
+
+    def __call__(self,func):
+        def wrapper(*args,**kw):
+            with stage(self.name,self.rows,self.nbytes,self.sample):
+                return func(*args,**kw)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+
+    def __enter__(self):
+        _stack = _stages()
+        parent = _stack[-1] if _stack else None
+        if parent is not None:
+            parent.peak = max(parent.peak,hwm())
+        _reset_hwm()
+        self.peak = 0
+        self.path = self.name if parent is None else parent.path+'/'+self.name
+        self.depth = len(_stack)
+        self.rss_start = rss()
+        self.t0,self.c0 = time.time(),cpu_time()
+        self.sampler = None
+        if self.sample or (self.sample is None and os.environ.get('STAGE_SAMPLE') == self.name):
+            self.sampler = stackSampler().start()
+        _stack.append(self)
+        return self
+
+    def __exit__(self,*args):
+        wall,cpu = time.time()-self.t0,cpu_time()-self.c0
+        _stack = _stages()
+        _stack.pop()
+        self.peak = max(self.peak,hwm())
+        if _stack:
+            _stack[-1].peak = max(_stack[-1].peak,self.peak)
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.write(_sample_path(self.path))
+        _records.append({"pid":os.getpid(),"kind":"stage","name":self.path,"depth":self.depth,
+            "start":round(self.t0-_start,3),"wall":round(wall,3),"cpu":round(cpu,3),
+            "rss_start":self.rss_start,"rss_end":rss(),"peak_rss":self.peak,
+            "rows":self.rows,"bytes":self.nbytes})
+        return False
+
+def mark(tag,rows=0,nbytes=0):
+    """
+        a point record in the current stage, e.g. a progress print
+        Return: the record
+    """
+    _stack = _stages()
+    path = _stack[-1].path+'/' if _stack else ''
+    mem = rss()
+    rec = {"pid":os.getpid(),"kind":"mark","name":path+str(tag),"depth":len(_stack),
+        "start":round(time.time()-_start,3),"wall":0,"cpu":0,
+        "rss_start":mem,"rss_end":mem,"peak_rss":hwm(),"rows":rows,"bytes":nbytes}
+    _records.append(rec)
+    return rec
+
+def _stages():
+    if not hasattr(_local,'stack'):
+        _local.stack = []
+    return _local.stack
+
+def records():
+    return list(_records)
+
+def set_report(path):
+    """
+        write the records to path (.csv or .json) at exit
+    """
+    _report['path'] = path
+
+def write_report(path=None):
+    path = path or _report['path']
+    if not path or not _records:
+        return
+    new = not os.path.exists(path)
+    with open(path,'a') as fo:
+        if path.endswith('.csv'):
+            if new:
+                fo.write(','.join(FIELDS)+'\n')
+            for rec in _records:
+                fo.write(','.join(_csv(rec[i]) for i in FIELDS)+'\n')
+        else:
+            for rec in _records:
+                fo.write(json.dumps(rec)+'\n')
+    del _records[:]
+
+def summary(recs=None):
+    """
+        one line per stage path: calls, total wall and cpu, max peak rss
+    """
+    res = {}
+    for rec in recs if recs is not None else _records:
+        if rec['kind'] != 'stage':
+            continue
+        s = res.setdefault(rec['name'],{"calls":0,"wall":0.0,"cpu":0.0,"peak_rss":0,"rows":0,"bytes":0})
+        s['calls'] += 1
+        s['wall'] += rec['wall']
+        s['cpu'] += rec['cpu']
+        s['peak_rss'] = max(s['peak_rss'],rec['peak_rss'])
+        s['rows'] += rec['rows']
+        s['bytes'] += rec['bytes']
+    lines = ["%-40s %6s %10s %10s %10s %12s"%('stage','calls','wall s','cpu s','peak MB','rows')]
+    for name in sorted(res):
+        s = res[name]
+        lines.append("%-40s %6d %10.2f %10.2f %10.1f %12d"%(name,s['calls'],s['wall'],s['cpu'],
+            s['peak_rss']/1048576.0,s['rows']))
+    return '\n'.join(lines)
+
+def _csv(v):
+    s = str(v)
+    return '"%s"'%s.replace('"','""') if ',' in s or '"' in s else s
+
+def _sample_path(name):
+    base = os.path.splitext(_report['path'])[0] if _report['path'] else 'stage'
+    return "%s.%s.%d.stacks"%(base,name.replace('/','.'),os.getpid())
+
+def cpu_time():
+    t = os.times()
+    return t[0]+t[1]
+
+def _status(key):
+    # a kB field of /proc/self/status, None off linux
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1])*1024
+    except (IOError,OSError):
+        pass
+    return None
+
+def rss():
+    """
+        resident bytes of this process
+    """
+    v = _status('VmRSS:')
+    if v is None:
+        try:
+            import psutil
+            v = psutil.Process(os.getpid()).memory_info().rss
+        except Exception:
+            v = 0
+    return v
+
+def hwm():
+    """
+        peak resident bytes since the last reset, or of the process
+    """
+    v = _status('VmHWM:')
+    if v is None:
+        try:
+            import resource
+            # kB on linux, bytes on mac
+            v = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            v = v if sys.platform == 'darwin' else v*1024
+        except Exception:
+            v = 0
+    return v
+
+def _reset_hwm():
+    try:
+        with open('/proc/self/clear_refs','w') as f:
+            f.write('5')
+        return True
+    except (IOError,OSError):
+        return False
+
+class stackSampler(object):
+    """
+    samples the stack of the thread that started it every interval seconds
+    from a daemon thread, counts of collapsed stacks root;...;leaf
+    """
+    def __init__(self,interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.done = threading.Event()
+
+    def start(self):
+        self.ident = threading.current_thread().ident
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self.done.is_set():
+            frame = sys._current_frames().get(self.ident)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append("%s:%s"%(os.path.basename(code.co_filename),code.co_name))
+                frame = frame.f_back
+            if names:
+                key = ';'.join(reversed(names))
+                self.counts[key] = self.counts.get(key,0)+1
+            self.done.wait(self.interval)
+
+    def stop(self):
+        self.done.set()
+        self.thread.join()
+
+    def write(self,path):
+        with open(path,'w') as fo:
+            for key in sorted(self.counts,key=self.counts.get,reverse=True):
+                fo.write("%s %d\n"%(key,self.counts[key]))
+
+atexit.register(write_report)
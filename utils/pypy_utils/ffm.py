@@ -0,0 +1,194 @@
+"""
+two phase parallel csv to libffm conversion
+phase one counts the values of every field in byte range chunks of the csv
+files in parallel, merges the counts and gives an id to the values seen at
+least min_count times. The vocabulary is saved, test files are encoded
+with the one of the train files and it only grows when asked to.
+phase two encodes the chunks in parallel against the frozen vocabulary,
+every row as an array of k int ids (0 for none), writes the lines of every
+chunk into a part file and concatenates the parts in order.
+
+    vocab = build_vocab(["tr.csv"],"data/vocab.p","orderid","label",min_count=2)
+    encode_ffm("tr.csv","tr.ffm","orderid","label","data/vocab.p")
+    encode_ffm("te.csv","te.ffm","orderid","label","data/vocab.p")
+
+pure python, it runs under pypy2 too. Lines are split at ',' unless a chunk
+has quotes, then csv parses it; a quoted field must not span lines.
+"""
+import os
+import sys
+import csv
+import shutil
+import pickle
+from array import array
+from utils.parallel_utils.executor import get_executor
+from utils.profile_utils.stages import stage
+
+CHUNK_MB = 64 # csv bytes per job
+_VOCAB = {} # path -> (mtime,vocab), per process
+
+def build_vocab(names,out,id_col,y_col,min_count=1,ignorenan=True,na='',workers=None,update=False):
+    """
+        Input:
+            names: csv files to count the values of, with the same header
+            out: saved vocabulary, loaded if it exists
+            min_count: values seen fewer times get no id
+            update: add the values of names to the saved vocabulary,
+                the ids it has are kept
+        Return: vocab {"fields":[...],"ids":[{value:id} per field],"size":max id}
+    """
+    if isinstance(names,str):
+        names = [names]
+    vocab = load_vocab(out) if os.path.exists(out) else None
+    if vocab is not None and not update:
+        return vocab
+    fields,_,_ = _header(names[0],id_col,y_col)
+    with stage('vocab') as st:
+        jobs = [(name,s,e,id_col,y_col,ignorenan,na) for name in names for s,e in _chunks(name)]
+        counts = [{} for _ in fields]
+        for rows,c in get_executor(workers).imap(_count_chunk,jobs,chunksize=1,star=True):
+            for dic,part in zip(counts,c):
+                for v,n in part.items():
+                    dic[v] = dic.get(v,0)+n
+            st.add(rows=rows)
+    if vocab is None:
+        vocab = {"fields":fields,"ids":[{} for _ in fields],"size":0}
+    assert vocab['fields'] == fields,"%s has other fields than %s"%(names[0],out)
+    size = vocab['size']
+    # frequent values get the small ids, their lines are shorter
+    for ids,dic in zip(vocab['ids'],counts):
+        new = [v for v in dic if dic[v] >= min_count and v not in ids]
+        for v in sorted(new,key=lambda v:(-dic[v],v)):
+            size += 1
+            ids[v] = size
+    vocab['size'] = size
+    save_vocab(vocab,out)
+    print("vocab %s: %d values of %d fields"%(out,size,len(fields)))
+    return vocab
+
+def save_vocab(vocab,out):
+    with open(out,'wb') as fo:
+        pickle.dump(vocab,fo,2) # protocol 2 is read by pypy2 and python3
+    _VOCAB.pop(out,None)
+
+def load_vocab(path):
+    """
+        the saved vocabulary, loaded once per process until the file changes
+    """
+    mtime = os.path.getmtime(path)
+    if path not in _VOCAB or _VOCAB[path][0] != mtime:
+        with open(path,'rb') as f:
+            _VOCAB[path] = (mtime,pickle.load(f))
+    return _VOCAB[path][1]
+
+def fea_dic(vocab):
+    """
+        the vocabulary as the {"field-value":id} dict of csv2ffm
+    """
+    return {"%s-%s"%(field,v):i for field,ids in zip(vocab['fields'],vocab['ids'])
+        for v,i in ids.items()}
+
+def encode_ffm(inx,out,id_col,y_col,vocab_path,ignorenan=True,na='',workers=None):
+    """
+        write inx as libffm lines "y field:id:1 ..." of the values in the
+        vocabulary saved at vocab_path, y is 0 if inx has no y_col
+    """
+    print("encode_ffm",out)
+    if os.path.exists(out):
+        return
+    fields = load_vocab(vocab_path)['fields']
+    assert _header(inx,id_col,y_col)[0] == fields,"%s has other fields than %s"%(inx,vocab_path)
+    chunks = _chunks(inx)
+    parts = ["%s.part%d"%(out,i) for i in range(len(chunks))]
+    jobs = [(inx,s,e,part,id_col,y_col,vocab_path,ignorenan,na) for part,(s,e) in zip(parts,chunks)]
+    with stage('encode') as st:
+        for rows in get_executor(workers).imap(_encode_chunk,jobs,chunksize=1,star=True):
+            st.add(rows=rows)
+    with open(out,'wb') as fo:
+        for part in parts:
+            with open(part,'rb') as f:
+                shutil.copyfileobj(f,fo,1<<24)
+            os.remove(part)
+    print(out,'written',st.rows,'rows')
+
+def _header(name,id_col,y_col):
+    # fields in file order without id and y, and the columns of id and y
+    with open(name) as f:
+        head = next(csv.reader([f.readline().strip()]))
+    fields = [i for i in head if i not in [id_col,y_col]]
+    cols = [head.index(i) for i in fields]
+    yc = head.index(y_col) if y_col in head else None
+    return fields,cols,yc
+
+def _chunks(name,chunk_mb=None):
+    """
+        byte ranges [s,e) of about chunk_mb (None for CHUNK_MB) that start
+        at a line start, the header line excluded
+    """
+    if chunk_mb is None:
+        chunk_mb = CHUNK_MB
+    size = os.path.getsize(name)
+    step = max(int(chunk_mb*(1<<20)),1)
+    with open(name,'rb') as f:
+        f.readline()
+        starts = [f.tell()]
+        while starts[-1]+step < size:
+            f.seek(starts[-1]+step)
+            f.readline()
+            if f.tell() >= size:
+                break
+            starts.append(f.tell())
+    return list(zip(starts,starts[1:]+[size]))
+
+def _rows(name,s,e):
+    # the parsed lines of a byte range
+    with open(name,'rb') as f:
+        f.seek(s)
+        data = f.read(e-s)
+    if sys.version_info[0] > 2:
+        data = data.decode('utf-8')
+    # only \n ends a line, as for csv.DictReader; blank lines are skipped
+    lines = [line.rstrip('\r') for line in data.split('\n')]
+    lines = [line for line in lines if line]
+    if '"' in data:
+        return csv.reader(lines)
+    return (line.split(',') for line in lines)
+
+def _count_chunk(name,s,e,id_col,y_col,ignorenan,na):
+    # rows of a byte range and the counts of the values of every field
+    _,cols,_ = _header(name,id_col,y_col)
+    counts = [{} for _ in cols]
+    rows = 0
+    for row in _rows(name,s,e):
+        rows += 1
+        for dic,c in zip(counts,cols):
+            v = row[c]
+            if ignorenan and v == na:
+                continue
+            dic[v] = dic.get(v,0)+1
+    return rows,counts
+
+def _encode_chunk(name,s,e,out,id_col,y_col,vocab_path,ignorenan,na):
+    """
+        the rows of a byte range as k int ids each, written as libffm lines
+        Return: number of rows
+    """
+    _,cols,yc = _header(name,id_col,y_col)
+    vocab = load_vocab(vocab_path)['ids']
+    k = len(cols)
+    ids = array('i')
+    ys = []
+    for row in _rows(name,s,e):
+        ys.append(row[yc] if yc is not None else '0')
+        for dic,c in zip(vocab,cols):
+            v = row[c]
+            ids.append(0 if ignorenan and v == na else dic.get(v,0))
+    with open(out,'w') as fo:
+        for r,y in enumerate(ys):
+            line = [y]
+            for m in range(k):
+                n = ids[r*k+m]
+                if n:
+                    line.append("%d:%d:1"%(m,n))
+            fo.write(" ".join(line)+'\n')
+    return len(ys)
@@ -0,0 +1,22 @@
+"""
+memoized parsing of 'yyyy-mm-dd hh:mm:ss[.f]' timestamps for the row by row
+csv loops, pure python so it runs under pypy. Timestamps repeat heavily,
+so every distinct string is split and converted to ints only once.
+"""
+MAX_CACHE = 1<<22
+_cache = {}
+
+def split_time(ts):
+    """
+        Return: (ymd, hms, year, month, day, hour, minute, second),
+            the date and time strings and their int parts
+    """
+    res = _cache.get(ts)
+    if res is None:
+        ymd,hms = ts.split()
+        year,month,day = ymd.split('-')
+        hour,minute,second = hms.split(':')
+        res = (ymd,hms,int(year),int(month),int(day),int(hour),int(minute),int(second.split('.')[0]))
+        if len(_cache) < MAX_CACHE:
+            _cache[ts] = res
+    return res
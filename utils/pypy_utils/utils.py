@@ -67,8 +67,22 @@ def apk(actual, predicted, k=3):
             score += num_hits / (i+1.0)
     return score / min(len(actual), k)
 
-def csv2ffm(inx,out,id_col,y_col,fea_dic={},update=False,ignorenan=True,mtr=None,bl=0,bar=0,na=''):
+def csv2ffm(inx,out,id_col,y_col,fea_dic={},update=False,ignorenan=True,mtr=None,bl=0,bar=0,na='',
+    vocab=None,min_count=1,workers=None):
+    """
+        vocab: path of a saved vocabulary, converts in parallel with
+            utils.pypy_utils.ffm instead of row by row into fea_dic, the
+            vocabulary is built from inx if update or it does not exist yet,
+            with the values seen at least min_count times, and returned
+    """
     print("csv2ffm",out)
+    if vocab is not None:
+        from utils.pypy_utils.ffm import build_vocab,encode_ffm,load_vocab
+        assert mtr is None,"mean target rate filtering is not done in parallel"
+        if update or not os.path.exists(vocab):
+            build_vocab([inx],vocab,id_col,y_col,min_count,ignorenan,na,workers,update=True)
+        encode_ffm(inx,out,id_col,y_col,vocab,ignorenan,na,workers)
+        return load_vocab(vocab)
     if os.path.exists(out):
         return fea_dic
     f = open(inx)
@@ -140,3 +154,47 @@ def ffm2svm(inx,out):
         fo.write("%s %s\n"%(xx[0]," ".join(line)))
     f.close()
     fo.close()
+
+class mapkAcc(object):
+    """
+    running MAP@k (and hit rate in top k) of ranked predictions,
+    mergeable across shards, see utils.np_utils.stream_metrics
+    """
+    def __init__(self,k=3):
+        self.k = k
+        self.total = 0.0
+        self.hits = 0.0
+        self.n = 0
+
+    def update(self,actual,predicted):
+        """
+            actual: list of relevant items of one query
+            predicted: ranked list of predicted items
+        """
+        hit = float(len(actual)>0 and actual[0] in predicted[:self.k])
+        return self.add(apk(actual,predicted,self.k),hit)
+
+    def add(self,score,hit=0.0):
+        # apk and hit of one query computed by the caller
+        self.total += score
+        self.hits += hit
+        self.n += 1
+        return self
+
+    def update_many(self,actuals,predicteds):
+        for actual,predicted in zip(actuals,predicteds):
+            self.update(actual,predicted)
+        return self
+
+    def merge(self,other):
+        assert self.k == other.k
+        self.total += other.total
+        self.hits += other.hits
+        self.n += other.n
+        return self
+
+    def score(self):
+        return self.total/self.n if self.n else 0.0
+
+    def hit_rate(self):
+        return self.hits/self.n if self.n else 0.0
@@ -0,0 +1,154 @@
+"""
+binary csr cache of libsvm/libffm text files
+the text is parsed once, chunk by chunk, into npy files next to it
+    name.csr/indptr.npy indices.npy data.npy y.npy [qid.npy] [fields.npy]
+keyed in the artifact cache by the fingerprint of the text file. Later
+loads map the npy files copy-on-write and wrap them in a csr_matrix without
+copying, a row range only slices indptr. Values and labels are float64 and
+writable, as load_svmlight_file returns them.
+"""
+import os
+import numpy as np
+from scipy import sparse
+from sklearn.datasets import load_svmlight_file
+from utils.cache_utils.artifact import get_cache
+from utils.pd_utils.col_store import NPY_HEADER,write_npy_header
+
+CHUNK = 1<<28 # bytes of text parsed at a time
+VERSION = 2
+MAX_FEATURES = (1<<31)-1
+
+def load_csr(name,rows=None,fmt='svm',mmap=True,chunk=CHUNK):
+    """
+        Input:
+            name: libsvm or libffm text file
+            rows: None or slice of rows
+            fmt: 'svm' or 'ffm'
+            mmap: copy-on-write memory maps, False to read the arrays
+        Return: {} with X csr_matrix, y, and qid (svm with qid:)
+            or fields (ffm, the field of every entry of X.data)
+    """
+    out = name+".csr"
+    cache = get_cache(os.path.dirname(out) or '.')
+    cache.cached(out,lambda: _build(name,out,fmt,chunk),name='csr_'+fmt,
+        inputs=[name],params={"version":VERSION})
+    mode = 'c' if mmap else None
+    arrays = {}
+    for i in os.listdir(out):
+        if i.endswith('.npy'):
+            arrays[i[:-4]] = np.load(os.path.join(out,i),mmap_mode=mode)
+    indptr = arrays['indptr']
+    n = indptr.shape[0]-1
+    start,stop,step = (rows or slice(None)).indices(n)
+    assert step == 1,"rows must be a contiguous range"
+    stop = max(stop,start)
+    lo,hi = int(indptr[start]),int(indptr[stop])
+    ptr = np.asarray(indptr[start:stop+1])-lo
+    shape = (stop-start,int(arrays['shape'][1]))
+    X = sparse.csr_matrix((arrays['data'][lo:hi],arrays['indices'][lo:hi],ptr),shape=shape,copy=False)
+    res = {"X":X,"y":arrays['y'][start:stop]}
+    if 'qid' in arrays:
+        res['qid'] = arrays['qid'][start:stop]
+    if 'fields' in arrays:
+        res['fields'] = arrays['fields'][lo:hi]
+    return res
+
+def _build(name,out,fmt,chunk):
+    if not os.path.exists(out):
+        os.makedirs(out)
+    for i in os.listdir(out):
+        os.remove(os.path.join(out,i))
+    print("convert %s to csr"%name)
+    names = ['indices','data','y']+(['fields'] if fmt == 'ffm' else ['qid'])
+    writers = {i:_npyAppender(os.path.join(out,i+'.npy')) for i in names}
+    indptr = [np.zeros(1,dtype=np.int64)]
+    total,mn,mx,has_qid = 0,None,-1,False
+    parts = _ffm_chunks(name,chunk) if fmt == 'ffm' else _svm_chunks(name,chunk)
+    for part in parts:
+        for i in names:
+            writers[i].append(part[i])
+        ind = part['indices']
+        if ind.shape[0]:
+            mn = ind.min() if mn is None else min(mn,ind.min())
+            mx = max(mx,ind.max())
+        has_qid = has_qid or ('qid' in part and bool(part['qid'].any()))
+        indptr.append(total+np.cumsum(part['nnz']))
+        total += int(part['nnz'].sum())
+    for i in names:
+        writers[i].close()
+    if 'qid' in names and not has_qid:
+        os.remove(os.path.join(out,'qid.npy'))
+    indptr = np.concatenate(indptr)
+    np.save(os.path.join(out,'indptr.npy'),indptr)
+    if fmt == 'svm' and mn is not None and mn > 0:
+        # one-based ids, like zero_based='auto' of sklearn: no id 0 in the file
+        ind = np.load(os.path.join(out,'indices.npy'),mmap_mode='r+')
+        step = 1<<24
+        for s in range(0,ind.shape[0],step):
+            ind[s:s+step] -= 1
+        ind.flush()
+        del ind
+        mx -= 1
+    np.save(os.path.join(out,'shape.npy'),np.array([indptr.shape[0]-1,mx+1],dtype=np.int64))
+    print("%s: %d rows, %d nonzeros"%(out,indptr.shape[0]-1,total))
+
+def _svm_chunks(name,chunk):
+    size = os.path.getsize(name)
+    for offset in range(0,size,chunk):
+        # the width is only known at the end, the shape is set then
+        X,y,qid = load_svmlight_file(name,n_features=MAX_FEATURES,zero_based=True,
+            query_id=True,offset=offset,length=chunk,dtype=np.float64)
+        yield {"indices":X.indices.astype(np.int32),"data":X.data,"y":y.astype(np.float64),
+            "qid":qid.astype(np.int64),"nnz":np.diff(X.indptr)}
+
+def _ffm_chunks(name,chunk):
+    """
+        libffm lines "y field:id:value ...", every number of a block of
+        lines is parsed in one call, rows are cut by the tokens per line
+    """
+    rest = b''
+    with open(name,'rb') as f:
+        while True:
+            block = f.read(chunk)
+            if block:
+                # keep the last partial line for the next block
+                block = rest+block
+                end = block.rfind(b'\n')+1
+                block,rest = block[:end],block[end:]
+            else:
+                block,rest = rest,b''
+            lines = [l for l in block.split(b'\n') if l.strip()]
+            if lines:
+                yield _parse_ffm(lines)
+            elif not rest and not block:
+                break
+
+def _parse_ffm(lines):
+    ntok = np.array([l.count(b':') for l in lines],dtype=np.int64)//2
+    nums = np.array(b' '.join(lines).replace(b':',b' ').split(),dtype=np.float64)
+    # a line is its label then 3 numbers per token
+    starts = np.concatenate([[0],np.cumsum(1+3*ntok)[:-1]]).astype(np.int64)
+    is_label = np.zeros(nums.shape[0],dtype=bool)
+    is_label[starts] = True
+    feas = nums[~is_label].reshape(-1,3)
+    return {"indices":feas[:,1].astype(np.int32),"data":feas[:,2],
+        "fields":feas[:,0].astype(np.int32),"y":nums[starts],"nnz":ntok}
+
+class _npyAppender(object):
+    # a 1d npy file grown chunk by chunk, the header is written on close
+    def __init__(self,fname):
+        self.fname = fname
+        self.dtype = None
+        self.n = 0
+        self.f = open(fname,'wb')
+        self.f.write(b' '*NPY_HEADER)
+
+    def append(self,x):
+        if self.dtype is None:
+            self.dtype = x.dtype
+        self.f.write(np.ascontiguousarray(x,dtype=self.dtype).tobytes())
+        self.n += x.shape[0]
+
+    def close(self):
+        self.f.close()
+        write_npy_header(self.fname,self.dtype or np.float64,self.n)
@@ -1,35 +1,83 @@
-from sklearn.feature_extraction import DictVectorizer
+import numpy as np
 from scipy import sparse
-def onehot_encode(tr,te,cols=None):
+from utils.pd_utils.utils import is_cat
+from utils.pd_utils.encoder import FactorEncoder
+
+def onehot_encode(tr,te,cols=None,min_count=1):
+    """
+        one-hot columns like DictVectorizer on str values, same feature
+        order ("col=value" sorted), values unseen in tr are dropped
+        min_count: values seen fewer times in tr are dropped too
+    """
     if cols is None:
         cols = [i for i in tr.columns.values if i in te.columns.values]
-    vec = DictVectorizer()
-    for col in cols:
-        tr[col] = tr[col].map(str)
-        te[col] = te[col].map(str)
     print("start fitting")
-    X = vec.fit_transform(tr[cols].T.to_dict().values())
-    Xt = vec.transform(te[cols].T.to_dict().values())
+    enc = onehot_fit(tr,cols,min_count)
+    X = onehot_csr(tr,enc)
+    Xt = onehot_csr(te,enc)
     print("done fitting",X.shape,Xt.shape)
     return X,Xt
 
-def onehot_encode_bar(tr,te,cols=None,bar=10000):
+def onehot_encode_bar(tr,te,cols=None,bar=10000,min_count=1):
     if cols is None:
         cols = [i for i in tr.columns.values if i in te.columns.values]
-    vec = DictVectorizer()
     cat,num = [],[]
     for col in cols:
         nu = tr[col].unique().shape[0]
-        if (nu<bar and nu>2) or tr[col].dtype=='object':
+        if (nu<bar and nu>2) or is_cat(tr[col]):
             cat.append(col)
-            tr[col] = tr[col].map(str)
-            te[col] = te[col].map(str)
         else:
             num.append(col)
     print("start fitting num of cat features:",len(cat))
-    X = vec.fit_transform(tr[cat].T.to_dict().values())
-    Xt = vec.transform(te[cat].T.to_dict().values())
+    enc = onehot_fit(tr,cat,min_count)
+    X = onehot_csr(tr,enc)
+    Xt = onehot_csr(te,enc)
     print("done fitting",X.shape,Xt.shape)
     X = sparse.hstack([X,tr[num].values],format='csr')
     Xt = sparse.hstack([Xt,te[num].values],format='csr') 
     return X,Xt
+
+def onehot_fit(df,cols,min_count=1):
+    """
+        Return: FactorEncoder of cols, with .feature_ids[col] the
+            one-hot column of each code and .feature_names
+    """
+    enc = FactorEncoder(cols,min_count=min_count).fit(df)
+    names = ["%s=%s"%(col,val) for col in enc.cols for val in enc.vocab[col]]
+    order = np.argsort(np.array(names,dtype=object),kind='mergesort')
+    rank = np.empty(len(names),dtype=np.int64)
+    rank[order] = np.arange(len(names))
+    enc.feature_names = [names[i] for i in order]
+    enc.feature_ids = {}
+    start = 0
+    for col in enc.cols:
+        n = len(enc.vocab[col])
+        enc.feature_ids[col] = rank[start:start+n]
+        start += n
+    return enc
+
+def onehot_csr(df,enc):
+    """
+        one row per row of df with a 1 in the column of each value,
+        built straight from the codes into csr indptr/indices/data
+    """
+    n = df.shape[0]
+    ids = np.empty([n,len(enc.cols)],dtype=np.int64)
+    for c,col in enumerate(enc.cols):
+        codes = enc.encode(df[col],col).astype(np.int64)
+        fid = enc.feature_ids[col]
+        if fid.shape[0] == 0:
+            # no value of the column made it into the vocabulary
+            ids[:,c] = -1
+            continue
+        # rare and unseen codes are outside the vocabulary
+        valid = (codes>=0) & (codes<fid.shape[0])
+        ids[:,c] = np.where(valid,fid[np.where(valid,codes,0)],-1)
+    valid = ids>=0
+    indptr = np.zeros(n+1,dtype=np.int64)
+    np.cumsum(valid.sum(axis=1),out=indptr[1:])
+    indices = ids[valid]
+    data = np.ones(indices.shape[0],dtype=np.float64)
+    X = sparse.csr_matrix((data,indices,indptr),shape=(n,len(enc.feature_names)))
+    X.sort_indices()
+    return X
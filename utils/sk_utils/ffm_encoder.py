@@ -7,34 +7,54 @@ class FFMEncoder(sklearn.base.BaseEstimator):
         """
         x is a dataframe of numpy array
         x should not have target column or id column
+        every column gets a vocabulary (values in order of appearance),
+        the code of each value and the offset of the column
         """
         assert isinstance(X,pd.DataFrame) or isinstance(X,np.ndarray)
-        dic = {}
         if isinstance(X,np.ndarray):
             X = pd.DataFrame(X,columns=['col%d'%i for i in range(X.shape[1])])            
+        self.vocab,self.codes,self.offsets = {},{},{}
+        sx = 1 # 0 is for unseen values
         for col in X.columns.values:
-            #if X[col].dtype!=np.float32:
-            xx = X[col].unique()
-            #xx = sorted(X[col].unique())
+            xx = pd.Index(pd.unique(X[col].values))
             m = 1 if N is None else len(xx)//N
             if m==0:
                 m = 1
-            #dic[col] = {i:(c if N is None else c%N) for c,i in enumerate(xx)}
-            dic[col] = {i:c//m for c,i in enumerate(xx)}
-            print(col,len(xx),max(dic[col].values()))
-        self.dic = dic
+            self.vocab[col] = xx
+            self.codes[col] = (np.arange(len(xx))//m).astype(np.int64)
+            self.offsets[col] = sx
+            mx = int(self.codes[col][-1]) if len(xx) else 0
+            sx += mx+1
+            print(col,len(xx),mx)
+        self.cols = list(X.columns.values)
+        self.size = sx
         self.N = N
         return self
 
+    @property
+    def dic(self):
+        return {col:dict(zip(self.vocab[col],self.codes[col].tolist())) for col in self.cols}
+
     def transform(self, X):
+        """
+        Return: pd.DataFrame of int32 feature ids, offset per column,
+            0 for values unseen in fit
+        """
         assert isinstance(X,pd.DataFrame) or isinstance(X,np.ndarray)
-        #assert X.shape[1] == len(self.dic)
-        dic = self.dic
         if isinstance(X,np.ndarray):
             X = pd.DataFrame(X,columns=['col%d'%i for i in range(X.shape[1])])
-        sx = 1 
-        cols = [i for i in dic]
-        for col in cols:
-            X[col] = X[col].apply(lambda x: int(dic[col][x]+sx) if x in dic[col] else 0)
-            sx += int(max(dic[col].values())+1)
-        return X[cols]
+        return pd.DataFrame({col:self.encode(X[col],col) for col in self.cols},
+            index=X.index,columns=self.cols)
+
+    def encode(self,s,col):
+        # lookup of the unique values only, broadcast back by their codes
+        codes,uniq = pd.factorize(s,use_na_sentinel=False)
+        if len(self.vocab[col]) == 0:
+            return np.zeros(codes.shape[0],dtype=np.int32)
+        pos = self.vocab[col].get_indexer(uniq)
+        ids = np.where(pos>=0,self.codes[col][pos]+self.offsets[col],0)
+        return ids.astype(np.int32)[codes]
+
+    def fields(self):
+        # field of each column, in the order of transform
+        return np.arange(len(self.cols),dtype=np.int32)
@@ -0,0 +1,173 @@
+"""
+cross validation fold registry
+the folds of a dataset are made once and stored as an int32 fold id per row
+(-1 for rows in no fold, e.g. test rows) in path.folds/, keyed in the
+artifact cache by the fold parameters and a digest of y/groups/time, so
+every model and feature stage of a pipeline reuses the same folds.
+loads map the arrays; the validation rows of a fold are a view of one
+argsort of the ids, nothing is copied.
+
+    folds = get_folds("data/folds",len(y),5,y=y)
+    for tr,va in folds:
+        ...
+    va = folds.valid(2)
+
+the folds match the sklearn splitters they are made with, KFold,
+StratifiedKFold, GroupKFold or StratifiedGroupKFold; time folds are
+contiguous blocks of time, and their train rows are the earlier blocks only.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+from utils.cache_utils.artifact import get_cache
+
+VERSION = 1
+_FOLDS = {} # out -> (key,Folds) of this process
+
+def make_folds(n,folds=4,y=None,groups=None,time=None,cuts=None,shuffle=True,seed=126):
+    """
+        Input:
+            n: number of rows
+            y: stratify by y
+            groups: rows of a group stay in one fold
+            time: contiguous time blocks of about n/folds rows, ties kept
+                together and cut on the cumulative row count, or cut at the
+                values cuts (fold i is cuts[i-1] <= time < cuts[i]); fails
+                rather than give an empty time fold
+        Return: int32 fold id of every row
+    """
+    if time is not None:
+        return _time_folds(np.asarray(time),folds,cuts)
+    from sklearn import model_selection as ms
+    rs = seed if shuffle else None
+    X = np.zeros([n,1])
+    if groups is not None and y is not None:
+        kf = ms.StratifiedGroupKFold(n_splits=folds,shuffle=shuffle,random_state=rs)
+    elif groups is not None:
+        kf = ms.GroupKFold(n_splits=folds)
+    elif y is not None:
+        kf = ms.StratifiedKFold(n_splits=folds,shuffle=shuffle,random_state=rs)
+    else:
+        kf = ms.KFold(n_splits=folds,shuffle=shuffle,random_state=rs)
+    ids = np.full(n,-1,dtype=np.int32)
+    for k,(_,va) in enumerate(kf.split(X,y,groups)):
+        ids[va] = k
+    return ids
+
+def _time_folds(t,folds,cuts):
+    if cuts is not None:
+        ids = np.searchsorted(np.asarray(cuts),t,side='right').astype(np.int32)
+        counts = np.bincount(ids,minlength=len(cuts)+1)
+        assert counts.all(),"time folds %s are empty, cuts %s"%(np.flatnonzero(counts==0).tolist(),list(cuts))
+        return ids
+    vals,inv,counts = np.unique(t,return_inverse=True,return_counts=True)
+    m = vals.shape[0]
+    assert m >= folds,"%d distinct times can not make %d time folds"%(m,folds)
+    # cut the values in time order where the rows so far are closest to an
+    # even share of the rows left, every fold keeps at least one value
+    cum = np.cumsum(counts)
+    cuts = [0]
+    for k in range(1,folds):
+        done = cum[cuts[-1]-1] if cuts[-1] else 0
+        target = done+(cum[-1]-done)/float(folds-k+1)
+        j = int(np.searchsorted(cum,target))
+        below = cum[j-1] if j else 0
+        b = j+1 if cum[j]-target < target-below else j
+        cuts.append(min(max(b,cuts[-1]+1),m-(folds-k)))
+    block = np.searchsorted(np.array(cuts[1:]),np.arange(m),side='right')
+    return block[inv.ravel()].astype(np.int32)
+
+class Folds(object):
+    """
+    fold ids with the rows sorted by fold, valid(k) is a view of them
+    """
+    def __init__(self,ids,kind='kfold',order=None,offsets=None):
+        self.ids = ids
+        self.kind = kind
+        k = int(ids.max())+1 if ids.shape[0] else 0
+        if order is None:
+            order = np.argsort(ids,kind='mergesort').astype(np.int32)
+            offsets = np.searchsorted(ids[order],np.arange(k+1)).astype(np.int64)
+        self.order = order
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.offsets.shape[0]-1
+
+    def __getitem__(self,k):
+        if k < 0 or k >= len(self):
+            raise IndexError("fold %d of %d"%(k,len(self)))
+        return self.train(k),self.valid(k)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+
+    def valid(self,k):
+        """
+            rows of fold k, ascending
+        """
+        return self.order[self.offsets[k]:self.offsets[k+1]]
+
+    def train(self,k):
+        """
+            rows of the other folds, of the earlier ones for time folds
+        """
+        if self.kind == 'time':
+            return np.flatnonzero((self.ids<k)&(self.ids>=0))
+        return np.flatnonzero((self.ids!=k)&(self.ids>=0))
+
+    def mask(self,k):
+        return np.asarray(self.ids)==k
+
+def get_folds(path,n,folds=4,y=None,groups=None,time=None,cuts=None,shuffle=True,seed=126,mmap=True):
+    """
+        the registered folds of path.folds, made by make_folds on the first
+        call and again only when the parameters or y/groups/time change.
+        path None keeps them in memory only
+        Return: Folds
+    """
+    kind = 'time' if time is not None else 'kfold'
+    if path is None:
+        return Folds(make_folds(n,folds,y,groups,time,cuts,shuffle,seed),kind)
+    out = path+".folds"
+    cache = get_cache(os.path.dirname(out) or '.')
+    params = {"version":VERSION,"n":n,"folds":folds,"shuffle":shuffle,"seed":seed,
+        "cuts":None if cuts is None else [float(i) for i in cuts],
+        "y":digest(y),"groups":digest(groups),"time":digest(time)}
+    key = cache.key('folds',[],params)
+    if out in _FOLDS and _FOLDS[out][0] == key:
+        return _FOLDS[out][1]
+    def _build():
+        ids = make_folds(n,folds,y,groups,time,cuts,shuffle,seed)
+        f = Folds(ids,kind)
+        if not os.path.exists(out):
+            os.makedirs(out)
+        for name in ['ids','order','offsets']:
+            np.save(os.path.join(out,name+'.npy'),getattr(f,name))
+        with open(os.path.join(out,'meta.json'),'w') as fo:
+            json.dump({"kind":kind,"folds":len(f)},fo)
+        print("%s: %d rows in %d folds"%(out,n,len(f)))
+    cache.cached(out,_build,name='folds',params=params)
+    mode = 'r' if mmap else None
+    arrays = {name:np.load(os.path.join(out,name+'.npy'),mmap_mode=mode) for name in ['ids','order','offsets']}
+    with open(os.path.join(out,'meta.json')) as f:
+        meta = json.load(f)
+    res = Folds(arrays['ids'],meta['kind'],arrays['order'],np.asarray(arrays['offsets']))
+    _FOLDS[out] = (key,res)
+    return res
+
+def digest(a):
+    """
+        sha1 of the values of an array, None for None
+    """
+    if a is None:
+        return None
+    a = np.asarray(a)
+    if a.dtype.kind == 'O' or a.dtype.kind == 'U':
+        a = pd.util.hash_array(a.ravel().astype(object))
+    h = hashlib.sha1(np.ascontiguousarray(a).view(np.uint8).tobytes())
+    h.update(("%s %s"%(a.dtype.str,a.shape)).encode('utf-8'))
+    return h.hexdigest()
@@ -1,25 +1,40 @@
-from sklearn.datasets import load_svmlight_file
+import numpy as np
 from sklearn import metrics
-#mem = Memory("./mycache")
+from utils.np_utils import metrics as np_metrics
+from utils.sk_utils.csr_cache import load_csr
 
-#@mem.cache
-def load_svm(name):
-    data = load_svmlight_file(name)
-    return data[0], data[1]
+def load_svm(name,rows=None,query_id=False):
+    """
+        the text is parsed once into a memory mapped csr cache next to it
+        rows: None or slice of rows, e.g. for chunked training/prediction
+        Return: X,y (and qid if query_id)
+    """
+    data = load_csr(name,rows,fmt='svm')
+    if query_id:
+        return data['X'],data['y'],data.get('qid')
+    return data['X'],data['y']
+
+def load_ffm(name,rows=None):
+    """
+        Return: X,y,fields, the field of every entry of X.data
+    """
+    data = load_csr(name,rows,fmt='ffm')
+    return data['X'],data['y'],data['fields']
 
 def auc(y,yp,pos=1,draw=False):
+    if not draw:
+        # rank based, without building the roc curve
+        return np_metrics.auc(np.asarray(y)==pos,yp)
     fpr,tpr,thresholds = metrics.roc_curve(y,yp,pos_label=pos)
     score = metrics.auc(fpr,tpr)
-    if draw:
-        import matplotlib.pyplot as plt
-        plt.title('Receiver Operating Characteristic')
-        plt.plot(fpr, tpr, 'b', label = 'AUC = %0.2f' % score)
-        plt.legend(loc = 'lower right')
-        plt.plot([0, 1], [0, 1],'r--')
-        plt.xlim([0, 1])
-        plt.ylim([0, 1])
-        plt.ylabel('True Positive Rate')
-        plt.xlabel('False Positive Rate')
-        plt.show()
+    import matplotlib.pyplot as plt
+    plt.title('Receiver Operating Characteristic')
+    plt.plot(fpr, tpr, 'b', label = 'AUC = %0.2f' % score)
+    plt.legend(loc = 'lower right')
+    plt.plot([0, 1], [0, 1],'r--')
+    plt.xlim([0, 1])
+    plt.ylim([0, 1])
+    plt.ylabel('True Positive Rate')
+    plt.xlabel('False Positive Rate')
+    plt.show()
     return score
-
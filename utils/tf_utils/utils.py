@@ -6,6 +6,7 @@ import os
 import sys
 import time
 import csv
+from utils.pd_utils.utils import cat_cols,num_cols
 
 def bbox_iou(box1,box2):
     """
@@ -79,7 +80,7 @@ def encode_line(line,dic):
 
 def tf_cat_bucket_columns(df, cols=None, bins=1000):
     if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype=='object']
+        cols = cat_cols(df)
     if len(cols)==0:
         print("no cat cols found")
         return []
@@ -93,7 +94,7 @@ def tf_cat_bucket_columns(df, cols=None, bins=1000):
         
 def tf_cat_columns(df, cols=None):
     if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype=='object']
+        cols = cat_cols(df)
     if len(cols)==0:
         print("no cat cols found")
         return []
@@ -106,7 +107,7 @@ def tf_cat_columns(df, cols=None):
 
 def tf_num_columns(df, cols=None):
     if cols is None:
-        cols = [i for i in df.columns.values if df[i].dtype!='object']
+        cols = num_cols(df)
     if len(cols)==0:
         print("no numerical cols found")
         return []
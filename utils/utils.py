@@ -3,8 +3,10 @@ import numpy as np
 import os
 import random
 import sys
+from utils.profile_utils.stages import mark
 
 _start = time.time()
+GB = 1024.0*1024*1024
 try:
     import psutil
     _summ = psutil.virtual_memory()
@@ -12,10 +14,16 @@ except:
     pass
 
 def print_mem_time(tag):
-    print(tag," time %.2f seconds"%(time.time()-_start), end='')
+    """
+        print the time since start and the memory of this process and of the
+        system, and add the print as a mark to the current stage
+    """
+    rec = mark(tag)
+    print(tag," time %.2f seconds rss %.2f GB peak %.2f GB"%(time.time()-_start,
+        rec['rss_end']/GB,rec['peak_rss']/GB), end='')
     try:
         summ = psutil.virtual_memory()
-        print(" Used: %.2f GB %.2f%%"%((summ.used)/(1024.0*1024*1024),summ.percent))
+        print(" Used: %.2f GB %.2f%%"%((summ.used)/GB,summ.percent))
     except:
         print()
 
@@ -23,18 +31,15 @@ def get_size(path):
     return os.path.getsize(path)/1024.0/1024.0/1024.0
 
 def split(flags):
+    """
+        images of flags.input_path in flags.folds folds, {fold: [paths]}
+        the folds are registered next to flags.split_path, an old split
+        file there is still used
+    """
     if os.path.exists(flags.split_path):
-        return np.load(flags.split_path).item()
-    folds = flags.folds
+        return np.load(flags.split_path,allow_pickle=True).item()
+    from utils.sk_utils.folds import get_folds
     path = flags.input_path
-    random.seed(6)
-    img_list = ["%s/%s"%(path,img) for img in os.listdir(path)]
-    random.shuffle(img_list)
-    dic = {}
-    n = len(img_list)
-    num = (n+folds-1)//folds
-    for i in range(folds):
-        s,e = i*num,min(i*num+num,n)
-        dic[i] = img_list[s:e]
-    np.save(flags.split_path,dic)
-    return dic
+    img_list = ["%s/%s"%(path,img) for img in sorted(os.listdir(path))]
+    folds = get_folds(os.path.splitext(flags.split_path)[0],len(img_list),int(flags.folds),seed=6)
+    return {i:[img_list[j] for j in folds.valid(i)] for i in range(len(folds))}
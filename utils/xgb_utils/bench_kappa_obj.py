@@ -0,0 +1,122 @@
+"""
+time of the soft kappa objective per boosting round against the time xgboost
+spends building the trees of that round, for 4 to 20 classes
+
+    python -m utils.xgb_utils.bench_kappa_obj [rows] [rounds]
+
+the loop version the objective used before is kept here as the reference,
+the vectorized one is checked against it on every setting.
+"""
+import sys
+import time
+import numpy as np
+from utils.np_utils.utils import softmax
+from utils.xgb_utils.customize_obj import kappa_obj
+
+CLASSES = [4,8,12,16,20]
+
+def kappa_obj_loop(preds, dtrain):
+    labels = np.asarray(dtrain.get_label() + 1, dtype=int)
+    preds = softmax(preds)
+    M,N = preds.shape
+    O = 0.0
+    for j in range(N):
+        O += np.sum((labels - (j+1.))**2 * preds[:,j])
+    hist_label = np.bincount(labels, minlength=N+1)[1:N+1]
+    hist_pred = np.sum(preds, axis=0)
+    E = 0.0
+    for i in range(N):
+        for j in range(N):
+            E += pow(i - j, 2.0) * hist_label[i] * hist_pred[j]
+    grad = np.zeros((M, N))
+    hess = np.zeros((M, N))
+    for n in range(N):
+        dO = np.zeros((M))
+        d2O = np.zeros((M))
+        for j in range(N):
+            t = ((labels - (j+1.))**2) * preds[:,n] * (float(n == j) - preds[:,j])
+            dO += t
+            d2O += t * (1 - 2.*preds[:,n])
+        dE = np.zeros((M))
+        d2E = np.zeros((M))
+        for k in range(N):
+            for l in range(N):
+                t = pow(k-l, 2.0) * hist_label[l] * preds[:,n] * (float(n == k) - preds[:,k])
+                dE += t
+                d2E += t * (1 - 2.*preds[:,n])
+        grad[:,n] = -M * (dO * E - O * dE) / (E**2)
+        hess[:,n] = -M * ((d2O * E - O * d2E)*(E**2) - (dO * E - O * dE) * 2. * E * dE) / (E**4)
+    grad *= -1.
+    hess *= -1.
+    hess = np.abs(hess * 0.000125 / np.mean(abs(hess)))
+    return grad.ravel(), hess.ravel()
+
+class _labels(object):
+    # the part of xgb.DMatrix the objective uses
+    def __init__(self,y):
+        self.y = y
+
+    def get_label(self):
+        return self.y
+
+def _time(func,*args):
+    start = time.time()
+    res = func(*args)
+    return res,time.time()-start
+
+def _data(rows,N,seed=0):
+    rng = np.random.RandomState(seed)
+    X = rng.randn(rows,20).astype(np.float32)
+    y = np.clip(np.round(X[:,0]*N/4.0+N/2.0),0,N-1).astype(np.float32)
+    return X,y
+
+def bench_obj(rows,N,repeat=3):
+    """
+        Return: seconds per call of the loop and the vectorized objective,
+            max relative difference of their gradients and hessians
+    """
+    X,y = _data(rows,N)
+    preds = np.random.RandomState(1).randn(rows,N)
+    d = _labels(y)
+    (g0,h0),t0 = _time(kappa_obj_loop,preds,d)
+    t1 = min(_time(kappa_obj,preds,d)[1] for _ in range(repeat))
+    g1,h1 = kappa_obj(preds,d)
+    diff = max(np.abs(g0-g1).max()/np.abs(g0).max(),np.abs(h0-h1).max()/np.abs(h0).max())
+    return t0,t1,diff
+
+def bench_train(rows,N,rounds):
+    """
+        train with the vectorized objective
+        Return: seconds per round in the objective and in xgboost
+    """
+    import xgboost as xgb
+    X,y = _data(rows,N)
+    dtrain = xgb.DMatrix(X,label=y)
+    spent = [0.0]
+    def obj(preds,dtrain):
+        res,t = _time(kappa_obj,np.asarray(preds).reshape(rows,N),dtrain)
+        spent[0] += t
+        return res
+    params = {'num_class':N,'max_depth':6,'eta':0.1,'tree_method':'hist',
+        'disable_default_eval_metric':1,'verbosity':0}
+    _,total = _time(xgb.train,params,dtrain,rounds,[],obj)
+    return spent[0]/rounds,(total-spent[0])/rounds
+
+def main(rows=100000,rounds=10):
+    try:
+        import xgboost
+    except ImportError:
+        xgboost = None
+        print("xgboost not installed, objective times only")
+    print("%7s %12s %12s %8s %10s %12s"%('classes','loop s/call','vec s/call','speedup','max diff','tree s/round'))
+    for N in CLASSES:
+        t0,t1,diff = bench_obj(rows,N)
+        tree = '-'
+        if xgboost is not None:
+            tobj,ttree = bench_train(rows,N,rounds)
+            tree = "%.4f"%ttree
+            t1 = tobj
+        print("%7d %12.4f %12.4f %8.1f %10.2e %12s"%(N,t0,t1,t0/max(t1,1e-9),diff,tree))
+
+if __name__ == "__main__":
+    main(*[int(i) for i in sys.argv[1:3]])
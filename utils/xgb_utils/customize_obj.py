@@ -1,86 +1,30 @@
 import numpy as np
 from utils.np_utils.utils import softmax
 from utils.np_utils.utils import quadratic_weighted_kappa
+from utils.np_utils import metrics
+from utils.numba_utils import kernels
 
 
 def gini(actual, pred, cmpcol = 0, sortcol = 1):
     assert( len(actual) == len(pred) )
-    all = np.asarray(np.c_[ actual, pred, np.arange(len(actual)) ], dtype=np.float)
-    all = all[ np.lexsort((all[:,2], -1*all[:,1])) ]
-    totalLosses = all[:,0].sum()
-    giniSum = all[:,0].cumsum().sum() / totalLosses
-    
-    giniSum -= (len(actual) + 1) / 2.
-    return giniSum / len(actual)
+    return metrics.gini(actual, pred)
  
 def gini_normalized(a, p):
-    return gini(a, p) / gini(a, a)
+    return metrics.gini_normalized(a, p)
 
 # Create an XGBoost-compatible metric from Gini
 
-def gini_metric(preds, dtrain):
-    labels = dtrain.get_label()
-    gini_score = gini_normalized(labels, preds)
-    return [('gini', gini_score)]
+gini_metric = metrics.xgb_feval('gini')
 
 #https://www.kaggle.com/chenglongchen/customized-softkappa-loss-in-xgboost
 def kappa_obj(preds, dtrain):
     ## label are in [0,1,2,3] as required by XGBoost for multi-classification
-    labels = dtrain.get_label() + 1
-    labels = np.asarray(labels, dtype=int)
+    labels = np.asarray(dtrain.get_label(), dtype=int)
     preds = softmax(preds)
     M = preds.shape[0]
     N = preds.shape[1]
+    grad, hess = kernels.softkappa_grad_hess(preds, labels)
 
-    ## compute O (enumerator)
-    O = 0.0
-    for j in range(N):
-        wj = (labels - (j+1.))**2
-        O += np.sum(wj * preds[:,j])
-    
-    ## compute E (denominator)
-    hist_label = np.bincount(labels)[1:]
-    hist_pred = np.sum(preds, axis=0)
-    E = 0.0
-    for i in range(N):
-        for j in range(N):
-            E += pow(i - j, 2.0) * hist_label[i] * hist_pred[j]
-
-    ## compute gradient and hessian
-    grad = np.zeros((M, N))
-    hess = np.zeros((M, N))
-    for n in range(N):
-        ## first-order derivative: dO / dy_mn
-        dO = np.zeros((M))
-        for j in range(N):
-            indicator = float(n == j)
-            dO += ((labels - (j+1.))**2) * preds[:,n] * (indicator - preds[:,j])
-        ## first-order derivative: dE / dy_mn
-        dE = np.zeros((M))
-        for k in range(N):
-            for l in range(N):
-                indicator = float(n == k)
-                dE += pow(k-l, 2.0) * hist_label[l] * preds[:,n] * (indicator - preds[:,k])
-        ## the grad
-        grad[:,n] = -M * (dO * E - O * dE) / (E**2)
-        
-        ## second-order derivative: d^2O / d (y_mn)^2
-        d2O = np.zeros((M))
-        for j in range(N):
-            indicator = float(n == j)
-            d2O += ((labels - (j+1.))**2) * preds[:,n] * (1 - 2.*preds[:,n]) * (indicator - preds[:,j])
-       
-        ## second-order derivative: d^2E / d (y_mn)^2
-        d2E = np.zeros((M))
-        for k in range(N):
-            for l in range(N):
-                indicator = float(n == k)
-                d2E += pow(k-l, 2.0) * hist_label[l] * preds[:,n] * (1 - 2.*preds[:,n]) * (indicator - preds[:,k])
-        ## the hess
-        hess[:,n] = -M * ((d2O * E - O * d2E)*(E**2) - (dO * E - O * dE) * 2. * E * dE) / (E**4)
-
-    grad *= -1.
-    hess *= -1.
     # this pure hess doesn't work in my case, but the following works ok
     # use a const
     #hess = 0.000125 * np.ones(grad.shape, dtype=float)
@@ -107,13 +51,7 @@ def kappa_metric(preds, dtrain):
 # obj for MAE https://www.kaggle.com/wiki/MeanAbsoluteError
 # J = np.mean(np.abs(y-yp))
 def mae_obj(preds, dtrain):
-    y  = dtrain.get_label()
-    yp = preds
-    c  = 2.0
-    x = yp-y
-    grad  =  c*x / (np.abs(x)+c)
-    hess = c**2 / (np.abs(x)+c)**2
-    return grad, hess
+    return kernels.mae_grad_hess(preds, dtrain.get_label(), 2.0)
 
 # metric for mae
 def mae_metric(preds, dtrain):
@@ -124,11 +62,7 @@ def mae_metric(preds, dtrain):
 
 # obj for logloss
 def logreg_obj(preds, dtrain):
-    y = dtrain.get_label()
-    yp = 1.0 / (1.0 + np.exp(-preds))
-    grad = yp - y
-    hess = yp * (1.0-yp)
-    return grad, hess
+    return kernels.logreg_grad_hess(preds, dtrain.get_label())
 
 # error for logloss (discrete)
 def logreg_error(preds, dtrain):